@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class AccountsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'accounts'
+
+    def ready(self):
+        from custom_requests.bulk_jobs import register_action
+
+        from . import signals  # noqa: F401
+        from .avatars import render_avatars
+
+        register_action('render_avatars', 10, render_avatars)
@@ -0,0 +1,108 @@
+"""
+Profile picture renditions.
+
+An uploaded profile picture is normalized in the background (the
+render_avatars bulk action, started by accounts.signals): it is
+rotated according to its EXIF data, cropped to a square and saved in every
+size of AVATAR_SIZES, in WebP and JPEG, under a directory named after the
+SHA-256 of the original. The digest is then stored in
+Utilisateur.profile_picture_hash.
+
+Rendition URLs contain the digest, so they change with the picture and
+never otherwise; the avatar view serves them with a one-year immutable
+Cache-Control and browsers fetch each avatar once. Until the renditions
+exist, the original picture is used.
+"""
+
+import hashlib
+import io
+import logging
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+AVATAR_SIZES = (48, 128, 512)
+AVATAR_FORMATS = {'webp': ('WEBP', {'quality': 80, 'method': 6}), 'jpg': ('JPEG', {'quality': 85, 'optimize': True})}
+DEFAULT_SIZE = 128
+DEFAULT_FORMAT = 'webp'
+# Renditions never change: browsers may keep them for a year
+MAX_AGE = 365 * 24 * 3600
+
+
+def rendition_name(digest, size, fmt):
+    return f'avatars/{digest}/{size}.{fmt}'
+
+
+def rendition_size(size):
+    """Smallest rendition at least `size` pixels wide"""
+    return next((s for s in AVATAR_SIZES if s >= size), AVATAR_SIZES[-1])
+
+
+def avatar_url(user, size=DEFAULT_SIZE, fmt=DEFAULT_FORMAT):
+    """URL of the rendition closest to `size`; None while the renditions are not ready"""
+    if not user.profile_picture_hash:
+        return None
+    return reverse('accounts:avatar', args=[user.profile_picture_hash, rendition_size(size), fmt])
+
+
+def _encode(image, size, fmt):
+    image = ImageOps.fit(image, (size, size), Image.LANCZOS)
+    pil_format, options = AVATAR_FORMATS[fmt]
+    if pil_format == 'JPEG' and image.mode != 'RGB':
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    output = io.BytesIO()
+    image.save(output, pil_format, **options)
+    return output.getvalue()
+
+
+def render_avatar(user):
+    """Render the renditions of a user's profile picture; returns True once they are ready"""
+    from .models import Utilisateur
+
+    picture = user.profile_picture
+    if not picture:
+        return False
+    try:
+        with picture.open('rb') as f:
+            content = f.read()
+        digest = hashlib.sha256(content).hexdigest()
+        if not all(default_storage.exists(rendition_name(digest, size, fmt))
+                   for size in AVATAR_SIZES for fmt in AVATAR_FORMATS):
+            with Image.open(io.BytesIO(content)) as image:
+                image = ImageOps.exif_transpose(image).convert('RGBA')
+                for size in AVATAR_SIZES:
+                    for fmt in AVATAR_FORMATS:
+                        name = rendition_name(digest, size, fmt)
+                        default_storage.delete(name)
+                        default_storage.save(name, ContentFile(_encode(image, size, fmt)))
+    except (OSError, ValueError, Image.DecompressionBombError):
+        logger.warning("No renditions for the profile picture of user %s", user.pk, exc_info=True)
+        return False
+
+    # Unless the picture was replaced in the meantime
+    Utilisateur.objects.filter(pk=user.pk, profile_picture=picture.name).update(profile_picture_hash=digest)
+    return True
+
+
+def render_avatars(job, ids):
+    """Bulk action rendering the renditions of some users (see custom_requests.bulk_jobs)"""
+    from .models import Utilisateur
+
+    return sum(render_avatar(user) for user in Utilisateur.objects.filter(pk__in=ids))
+
+
+def delete_renditions(digest):
+    """Delete the renditions of a picture no user has anymore"""
+    from .models import Utilisateur
+
+    if not digest or Utilisateur.objects.filter(profile_picture_hash=digest).exists():
+        return
+    for size in AVATAR_SIZES:
+        for fmt in AVATAR_FORMATS:
+            default_storage.delete(rendition_name(digest, size, fmt))
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-19 02:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_remove_expert_country'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='utilisateur',
+            name='profile_picture_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, verbose_name='profile picture hash'),
+        ),
+    ]
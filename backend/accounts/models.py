@@ -42,6 +42,8 @@ class Utilisateur(AbstractUser):
     registration_date = models.DateTimeField(_('registration date'), auto_now_add=True)
     account_type = models.CharField(_('account type'), max_length=20, choices=ACCOUNT_TYPES, default='client')
     profile_picture = models.ImageField(_('profile picture'), upload_to='profile_pictures/', blank=True, null=True)
+    # SHA-256 of the picture once its renditions are rendered, see accounts.avatars
+    profile_picture_hash = models.CharField(_('profile picture hash'), max_length=64, blank=True, editable=False)
     
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['name', 'first_name']
@@ -55,14 +57,12 @@ class Utilisateur(AbstractUser):
         """Return a list of preferred languages"""
         return self.preferred_languages.split(',')
     
-    def get_profile_picture_url(self):
+    def get_profile_picture_url(self, size=128, fmt='webp'):
         """Return the URL of the profile picture or a default one based on account type"""
         if self.profile_picture and hasattr(self.profile_picture, 'url'):
-            # Add cache-busting parameter to ensure fresh images
-            from django.utils import timezone
-            import time
-            cache_buster = str(int(time.time()))
-            return f"{self.profile_picture.url}?v={cache_buster}"
+            # Renditions are versioned by content; a new upload gets a new file name anyway
+            from .avatars import avatar_url
+            return avatar_url(self, size, fmt) or self.profile_picture.url
         elif self.account_type == 'expert':
             return '/static/img/default_expert.jpg'
         elif self.account_type == 'admin':
@@ -0,0 +1,53 @@
+"""
+Signal receivers rendering the profile picture renditions (see
+accounts.avatars) in the background when a user gets a new picture.
+"""
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from custom_requests.bulk_jobs import start_job
+
+from .avatars import delete_renditions
+from .models import Utilisateur
+
+
+def _picture_name(instance):
+    value = instance.__dict__.get('profile_picture')
+    return getattr(value, 'name', value) or ''
+
+
+@receiver(post_init, sender=Utilisateur)
+def remember_profile_picture(sender, instance, **kwargs):
+    """Keep the picture a user was loaded with, to render the renditions of a new one."""
+    if 'profile_picture' in instance.__dict__:
+        instance._profile_picture_name = _picture_name(instance)
+    else:
+        instance._profile_picture_name = None
+
+
+@receiver(post_save, sender=Utilisateur)
+def profile_picture_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    name = _picture_name(instance)
+    old = '' if created else instance._profile_picture_name
+    # A picture deferred when the user was loaded is assumed unchanged
+    if old is not None and old != name:
+        old_hash = instance.__dict__.get('profile_picture_hash')
+        if old_hash:
+            # The original is used until the new renditions are rendered
+            Utilisateur.objects.filter(pk=instance.pk).update(profile_picture_hash='')
+            instance.profile_picture_hash = ''
+            transaction.on_commit(lambda: delete_renditions(old_hash))
+        if name:
+            start_job('render_avatars', [instance.pk])
+    instance._profile_picture_name = name
+
+
+@receiver(post_delete, sender=Utilisateur)
+def profile_picture_deleted(sender, instance, **kwargs):
+    old_hash = instance.__dict__.get('profile_picture_hash')
+    if old_hash:
+        transaction.on_commit(lambda: delete_renditions(old_hash))
@@ -1,8 +1,18 @@
-from django.test import TestCase, Client
+import io
+import os
+import tempfile
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, Client, override_settings
 from django.urls import reverse
 from django.contrib.auth import get_user_model
+from PIL import Image
+from accounts.avatars import AVATAR_FORMATS, AVATAR_SIZES, rendition_name
 from accounts.models import Utilisateur
 from accounts.forms import UserEditForm, CustomPasswordChangeForm
+from custom_requests.bulk_jobs import run_job
+from custom_requests.models import BulkJob
 
 User = get_user_model()
 
@@ -79,3 +89,57 @@ class AuthenticationViewTest(TestCase):
         """Test login view GET request"""
         response = self.client.get(reverse('accounts:login'))
         self.assertEqual(response.status_code, 200)
+
+
+@override_settings(BULK_JOBS_RUNNER='worker')
+class AvatarRenditionTest(TestCase):
+    """Test the profile picture renditions and their cache-friendly URLs"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(MEDIA_ROOT=self.temp_dir.name)
+        self.settings_override.enable()
+        self.user = Utilisateur.objects.create_user(email='client@example.com', password='testpass123', account_type='client')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.temp_dir.cleanup()
+
+    def set_picture(self, color):
+        image = io.BytesIO()
+        Image.new('RGB', (800, 600), color).save(image, 'PNG')
+        self.user.profile_picture.save('me.png', ContentFile(image.getvalue()))
+        run_job(BulkJob.objects.filter(action='render_avatars').latest('created_at').pk)
+        self.user.refresh_from_db()
+
+    def test_renditions_and_stable_url(self):
+        self.assertEqual(self.user.get_profile_picture_url(), '/static/img/client-default.png')
+        self.set_picture('red')
+        digest = self.user.profile_picture_hash
+        for size in AVATAR_SIZES:
+            for fmt in AVATAR_FORMATS:
+                with default_storage.open(rendition_name(digest, size, fmt)) as f, Image.open(f) as image:
+                    self.assertEqual(image.size, (size, size))
+
+        url = self.user.get_profile_picture_url()
+        self.assertEqual(url, reverse('accounts:avatar', args=[digest, 128, 'webp']))
+        self.assertEqual(self.user.get_profile_picture_url(), url)
+        self.assertEqual(self.user.get_profile_picture_url(40, 'jpg'), reverse('accounts:avatar', args=[digest, 48, 'jpg']))
+
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age=31536000', response['Cache-Control'])
+        response.close()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_new_picture_gets_new_url(self):
+        self.set_picture('red')
+        old_digest = self.user.profile_picture_hash
+        old_url = self.user.get_profile_picture_url()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.set_picture('blue')
+        self.assertNotEqual(self.user.get_profile_picture_url(), old_url)
+        self.assertFalse(default_storage.exists(rendition_name(old_digest, 128, 'webp')))
+        self.assertEqual(self.client.get(old_url).status_code, 404)
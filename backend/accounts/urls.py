@@ -46,6 +46,7 @@ urlpatterns = [
     # API endpoints
     path('api/profile/', views.api_profile, name='api_profile'),
     path('api/update_profile/', views.api_update_profile, name='api_update_profile'),
+    path('avatars/<slug:digest>/<int:size>.<slug:fmt>', views.avatar_view, name='avatar'),
     path('verify-email/<str:uidb64>/<str:token>/', views.verify_email, name='verify_email'),
     path('verification-denied/', views.verification_denied, name='verification_denied'),
     path('resend-verification/', views.resend_verification, name='resend_verification'),
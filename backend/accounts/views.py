@@ -1177,3 +1177,16 @@ def custom_logout_view(request):
 def register_test_view(request):
     """Test registration view"""
     return render(request, 'general/register_test.html')
+
+def avatar_view(request, digest, size, fmt):
+    """Profile picture rendition; public and cached for a year, its URL changes with the picture"""
+    from django.db.models.fields.files import FieldFile
+    from django.http import Http404
+    from servicesbladi.protected_media import serve_protected_file
+    from .avatars import AVATAR_FORMATS, AVATAR_SIZES, MAX_AGE, rendition_name
+    
+    if size not in AVATAR_SIZES or fmt not in AVATAR_FORMATS or not Utilisateur.objects.filter(profile_picture_hash=digest).exists():
+        raise Http404("Avatar not found.")
+    rendition = FieldFile(None, Utilisateur._meta.get_field('profile_picture'), rendition_name(digest, size, fmt))
+    return serve_protected_file(request, rendition, f'{size}.{fmt}', as_attachment=False,
+                                etag=f'{digest}-{size}-{fmt}', max_age=MAX_AGE, public=True)
@@ -0,0 +1,294 @@
+"""
+Compteurs d'analytics du chatbot MRE
+
+Les incréments sont accumulés en mémoire par processus puis écrits
+périodiquement dans ChatAnalytics : une ligne par jour est créée si besoin,
+puis chaque jour est mis à jour par un seul UPDATE avec des expressions F().
+L'addition est faite par la base de données, les compteurs restent donc
+exacts même avec plusieurs workers qui écrivent sur la même ligne.
+
+Le tampon est vidé dès que CHATBOT_ANALYTICS_FLUSH_SECONDS est écoulé, au
+prochain incrément ou à la fin de la prochaine requête servie par le
+processus (request_finished), ainsi qu'à l'arrêt normal du worker (atexit,
+recyclage après max_requests). Un worker tué sans pouvoir s'arrêter
+(SIGKILL après le timeout de gunicorn) perd au plus les incréments reçus
+depuis le dernier vidage, soit les messages d'une fenêtre de
+CHATBOT_ANALYTICS_FLUSH_SECONDS.
+
+Les autres colonnes (sessions, utilisateurs distincts, temps de réponse,
+escalades, satisfaction) sont remplies par rollup_analytics, lancé par la
+commande rollup_chat_analytics : seules les lignes créées depuis le dernier
+passage (watermark par table) sont agrégées.
+"""
+
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import transaction
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import ChatAnalytics, ChatFeedback, ChatMessage, ChatRollupWatermark, ChatSession
+
+logger = logging.getLogger(__name__)
+
+# Tables agrégées par rollup_analytics, avec leur watermark
+ROLLUP_SOURCES = {
+    'sessions': ChatSession,
+    'messages': ChatMessage,
+    'feedback': ChatFeedback,
+}
+
+DOMAIN_COUNTERS = {
+    'fiscalite': 'fiscalite_questions',
+    'immobilier': 'immobilier_questions',
+    'investissement': 'investissement_questions',
+    'administration': 'administration_questions',
+    'formation': 'formation_questions',
+}
+
+
+class AnalyticsCounterBuffer:
+    """Tampon d'incréments par (date, champ), vidé au plus toutes les `flush_interval` secondes"""
+
+    def __init__(self, flush_interval=None):
+        self._lock = threading.Lock()
+        self._pending = defaultdict(int)
+        self._flush_interval = flush_interval
+        self._last_flush = time.monotonic()
+
+    @property
+    def flush_interval(self):
+        if self._flush_interval is not None:
+            return self._flush_interval
+        return getattr(settings, 'CHATBOT_ANALYTICS_FLUSH_SECONDS', 10)
+
+    def increment(self, field, amount=1, date=None):
+        """Ajouter un incrément en mémoire et vider le tampon si l'intervalle est écoulé"""
+        date = date or timezone.now().date()
+        with self._lock:
+            self._pending[(date, field)] += amount
+        self.flush_if_due()
+
+    def flush_if_due(self):
+        """Vider le tampon si l'intervalle est écoulé et qu'il reste des incréments"""
+        with self._lock:
+            due = self._pending and time.monotonic() - self._last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def record_message(self, domain_category):
+        """Compter un message utilisateur et son domaine"""
+        date = timezone.now().date()
+        self.increment('total_messages', date=date)
+        self.increment(DOMAIN_COUNTERS.get(domain_category, 'off_topic_questions'), date=date)
+
+    def pending(self):
+        """Copie des incréments non encore écrits (utile pour les tests et le debug)"""
+        with self._lock:
+            return dict(self._pending)
+
+    def flush(self):
+        """Écrire les incréments accumulés : un UPDATE atomique par jour"""
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(int)
+            self._last_flush = time.monotonic()
+
+        if not pending:
+            return 0
+
+        by_date = defaultdict(dict)
+        for (date, field), amount in pending.items():
+            by_date[date][field] = amount
+
+        try:
+            with transaction.atomic():
+                # La contrainte d'unicité sur `date` rend la création sûre entre processus
+                ChatAnalytics.objects.bulk_create(
+                    [ChatAnalytics(date=date) for date in by_date],
+                    ignore_conflicts=True,
+                )
+                for date, counters in by_date.items():
+                    ChatAnalytics.objects.filter(date=date).update(
+                        **{field: F(field) + amount for field, amount in counters.items()}
+                    )
+        except Exception:
+            # Remettre les incréments dans le tampon pour le prochain essai
+            logger.exception("Échec de l'écriture des analytics du chatbot")
+            with self._lock:
+                for key, amount in pending.items():
+                    self._pending[key] += amount
+            return 0
+
+        return len(by_date)
+
+
+analytics_counters = AnalyticsCounterBuffer()
+
+# Ne pas perdre les derniers incréments à l'arrêt du worker
+atexit.register(analytics_counters.flush)
+
+
+def _flush_after_request(sender, **kwargs):
+    analytics_counters.flush_if_due()
+
+
+# Sans attendre le prochain message : un worker inactif garde sinon ses compteurs
+request_finished.connect(_flush_after_request, dispatch_uid='chatbot_analytics_flush')
+
+
+# Note de satisfaction (1 à 5) associée à chaque type de retour
+FEEDBACK_SCORES = {
+    'helpful': 5,
+    'incomplete': 3,
+    'not_helpful': 2,
+    'incorrect': 1,
+}
+
+
+def _next_range(model, watermark, batch_size, cutoff, timestamp_field):
+    """Bornes (exclue, incluse) du prochain lot d'identifiants, limité aux lignes antérieures à `cutoff`"""
+    ids = model.objects.filter(
+        pk__gt=watermark.last_id, **{f'{timestamp_field}__lt': cutoff}
+    ).order_by('pk').values_list('pk', flat=True)[:batch_size]
+    ids = list(ids)
+    if not ids:
+        return None
+    return watermark.last_id, ids[-1]
+
+
+def _day_bounds(day):
+    start = timezone.make_aware(datetime.combine(day, datetime.min.time()))
+    return start, start + timedelta(days=1)
+
+
+def _count_unique_users(day):
+    """Utilisateurs distincts du jour : comptes connectés, plus IP des sessions anonymes"""
+    start, end = _day_bounds(day)
+    messages = ChatMessage.objects.filter(message_type='user', timestamp__gte=start, timestamp__lt=end)
+    users = messages.filter(session__user__isnull=False).values('session__user').distinct().count()
+    anonymous = messages.filter(session__user__isnull=True).values('session__ip_address').distinct().count()
+    return users + anonymous
+
+
+def _rollup_batch(batch_size, cutoff):
+    """Agréger un lot par table source ; retourne le nombre de lignes traitées par source"""
+    watermarks = {
+        watermark.source: watermark
+        for watermark in ChatRollupWatermark.objects.select_for_update().filter(source__in=ROLLUP_SOURCES)
+    }
+    updates = defaultdict(dict)
+    touched_days = set()
+    processed = defaultdict(int)
+    last_ids = {}
+
+    sessions_range = _next_range(ChatSession, watermarks['sessions'], batch_size, cutoff, 'created_at')
+    messages_range = _next_range(ChatMessage, watermarks['messages'], batch_size, cutoff, 'timestamp')
+    feedback_range = _next_range(ChatFeedback, watermarks['feedback'], batch_size, cutoff, 'created_at')
+
+    if sessions_range:
+        rows = ChatSession.objects.filter(pk__gt=sessions_range[0], pk__lte=sessions_range[1]).annotate(
+            day=TruncDate('created_at')
+        ).values('day').annotate(count=Count('id'))
+        for row in rows:
+            updates[row['day']]['total_sessions'] = F('total_sessions') + row['count']
+            processed['sessions'] += row['count']
+        last_ids['sessions'] = sessions_range[1]
+
+    if messages_range:
+        rows = ChatMessage.objects.filter(pk__gt=messages_range[0], pk__lte=messages_range[1]).annotate(
+            day=TruncDate('timestamp')
+        ).values('day').annotate(
+            count=Count('id'),
+            bot=Count('id', filter=Q(message_type='bot')),
+            responses=Count('id', filter=Q(message_type='bot', response_time_ms__isnull=False)),
+            response_time=Sum('response_time_ms', filter=Q(message_type='bot')),
+            escalated=Count('id', filter=Q(is_escalated=True)),
+        )
+        for row in rows:
+            touched_days.add(row['day'])
+            processed['messages'] += row['count']
+            if row['bot']:
+                updates[row['day']]['bot_messages'] = F('bot_messages') + row['bot']
+            if row['responses']:
+                # Moyennes pondérées : le membre de droite d'un UPDATE lit les anciennes valeurs
+                total = F('bot_responses') + row['responses']
+                updates[row['day']].update(
+                    avg_response_time_ms=(
+                        Coalesce(F('avg_response_time_ms'), 0.0) * F('bot_responses') + float(row['response_time'] or 0)
+                    ) / total,
+                    escalation_rate=(
+                        Coalesce(F('escalation_rate'), 0.0) * F('bot_responses') + float(row['escalated'])
+                    ) / total,
+                    bot_responses=total,
+                )
+        last_ids['messages'] = messages_range[1]
+
+    if feedback_range:
+        score = Case(
+            *[When(feedback_type=feedback_type, then=Value(value)) for feedback_type, value in FEEDBACK_SCORES.items()],
+            default=Value(3),
+        )
+        rows = ChatFeedback.objects.filter(pk__gt=feedback_range[0], pk__lte=feedback_range[1]).annotate(
+            day=TruncDate('created_at')
+        ).values('day').annotate(count=Count('id'), score=Sum(score))
+        for row in rows:
+            processed['feedback'] += row['count']
+            total = F('feedback_count') + row['count']
+            updates[row['day']].update(
+                satisfaction_avg=(Coalesce(F('satisfaction_avg'), 0.0) * F('feedback_count') + float(row['score'])) / total,
+                feedback_count=total,
+            )
+        last_ids['feedback'] = feedback_range[1]
+
+    for day in touched_days:
+        updates[day]['unique_users'] = _count_unique_users(day)
+
+    if updates:
+        ChatAnalytics.objects.bulk_create([ChatAnalytics(date=day) for day in updates], ignore_conflicts=True)
+        for day, fields in updates.items():
+            ChatAnalytics.objects.filter(date=day).update(**fields)
+
+    for source, last_id in last_ids.items():
+        watermarks[source].last_id = last_id
+        watermarks[source].save(update_fields=['last_id', 'updated_at'])
+
+    return dict(processed)
+
+
+def rollup_analytics(batch_size=5000, lag_seconds=60):
+    """Agréger dans ChatAnalytics les sessions, messages et retours créés depuis le dernier passage
+
+    Seules les lignes plus anciennes que `lag_seconds` sont prises, pour ne pas
+    dépasser une transaction encore en cours qui aurait un identifiant plus petit.
+    Retourne le nombre de lignes agrégées par source.
+    """
+    for source in ROLLUP_SOURCES:
+        ChatRollupWatermark.objects.get_or_create(source=source)
+
+    cutoff = timezone.now() - timedelta(seconds=lag_seconds)
+    totals = defaultdict(int)
+    while True:
+        with transaction.atomic():
+            processed = _rollup_batch(batch_size, cutoff)
+        for source, count in processed.items():
+            totals[source] += count
+        if not processed:
+            return dict(totals)
+
+
+def reset_rollup():
+    """Remettre à zéro les colonnes du rollup et les watermarks (avant une reconstruction complète)"""
+    with transaction.atomic():
+        ChatAnalytics.objects.update(
+            total_sessions=0, unique_users=0, avg_response_time_ms=None, escalation_rate=None,
+            satisfaction_avg=None, bot_responses=0, feedback_count=0, bot_messages=0,
+        )
+        ChatRollupWatermark.objects.filter(source__in=ROLLUP_SOURCES).update(last_id=0)
@@ -0,0 +1,87 @@
+"""
+Instantané en mémoire de ChatbotConfiguration
+
+Les configurations actives sont chargées une fois par processus dans un
+dictionnaire en lecture seule. Une lecture ne coûte donc aucune requête.
+
+Invalidation :
+- dans le processus qui modifie une configuration, l'instantané est jeté
+  immédiatement (signaux post_save / post_delete) ;
+- pour les autres processus, une clé de version est changée dans le cache
+  après le commit. Chaque processus compare sa version à celle du cache au
+  plus toutes les CHATBOT_CONFIG_CHECK_SECONDS secondes ;
+- sans cache partagé (pas de Redis), l'instantané est de toute façon
+  rechargé après CHATBOT_CONFIG_MAX_AGE_SECONDS secondes.
+"""
+
+import threading
+import time
+import uuid
+from types import MappingProxyType
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+CONFIG_VERSION_KEY = 'chatbot:config:version'
+
+
+class _Snapshot:
+    __slots__ = ('values', 'version', 'loaded_at', 'checked_at')
+
+    def __init__(self, values, version):
+        self.values = MappingProxyType(values)
+        self.version = version
+        self.loaded_at = self.checked_at = time.monotonic()
+
+
+_snapshot = None
+_lock = threading.Lock()
+
+
+def _load(version):
+    from .models import ChatbotConfiguration
+
+    values = dict(ChatbotConfiguration.objects.filter(is_active=True).values_list('key', 'value'))
+    return _Snapshot(values, version)
+
+
+def get_config():
+    """Dictionnaire en lecture seule {clé: valeur} des configurations actives"""
+    global _snapshot
+
+    snapshot = _snapshot
+    now = time.monotonic()
+    if snapshot is not None:
+        if now - snapshot.checked_at < getattr(settings, 'CHATBOT_CONFIG_CHECK_SECONDS', 5):
+            return snapshot.values
+        if now - snapshot.loaded_at < getattr(settings, 'CHATBOT_CONFIG_MAX_AGE_SECONDS', 60):
+            version = cache.get(CONFIG_VERSION_KEY)
+            if version is not None and version == snapshot.version:
+                snapshot.checked_at = now
+                return snapshot.values
+
+    with _lock:
+        # Un autre thread a peut-être déjà rechargé
+        if _snapshot is not None and _snapshot is not snapshot:
+            return _snapshot.values
+        version = cache.get(CONFIG_VERSION_KEY)
+        if version is None:
+            version = uuid.uuid4().hex
+            cache.add(CONFIG_VERSION_KEY, version, None)
+            version = cache.get(CONFIG_VERSION_KEY, version)
+        _snapshot = _load(version)
+        return _snapshot.values
+
+
+def _bump_version():
+    cache.set(CONFIG_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def invalidate_config():
+    """Jeter l'instantané local et prévenir les autres processus après le commit"""
+    global _snapshot
+
+    with _lock:
+        _snapshot = None
+    transaction.on_commit(_bump_version)
@@ -0,0 +1,94 @@
+"""
+Export en flux des conversations du chatbot (sessions, messages, retours)
+
+Les lignes sont lues avec `.iterator(chunk_size=...)` et écrites lot par
+lot, si bien que la mémoire utilisée ne dépend pas du nombre de lignes.
+Formats :
+- csv : une ligne par enregistrement, avec en-tête ; un texte commençant
+  par =, +, - ou @ est précédé d'une apostrophe pour qu'un tableur ne
+  l'évalue pas comme une formule ;
+- jsonl : un objet JSON par ligne ;
+- columnar : un objet JSON par lot de `chunk_size` lignes, de la forme
+  {"rows": n, "columns": {"champ": [valeurs, ...], ...}}, à charger
+  colonne par colonne (ex. pandas.DataFrame(chunk["columns"])).
+"""
+
+import csv
+import json
+from itertools import islice
+
+from servicesbladi.spreadsheets import neutralize_formula
+
+from .models import ChatFeedback, ChatMessage, ChatSession
+from .transcripts import feedback_to_dict, message_to_dict, session_to_dict
+
+# Type d'export : (modèle, champ de date pour les filtres, sérialiseur, colonnes)
+EXPORT_KINDS = {
+    'sessions': (ChatSession, 'created_at', session_to_dict, [
+        'id', 'session_id', 'user_id', 'created_at', 'updated_at', 'is_active', 'ip_address', 'user_agent',
+    ]),
+    'messages': (ChatMessage, 'timestamp', message_to_dict, [
+        'id', 'session_id', 'message_type', 'content', 'domain_category', 'timestamp',
+        'response_time_ms', 'api_model_used', 'is_escalated',
+    ]),
+    'feedback': (ChatFeedback, 'created_at', feedback_to_dict, [
+        'id', 'message_id', 'feedback_type', 'comment', 'created_at',
+    ]),
+}
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'jsonl': ('application/x-ndjson; charset=utf-8', 'jsonl'),
+    'columnar': ('application/x-ndjson; charset=utf-8', 'columnar.jsonl'),
+}
+
+
+class _Echo:
+    """Pseudo-fichier dont `write` retourne la valeur écrite (pour csv.writer)"""
+
+    def write(self, value):
+        return value
+
+
+def export_queryset(kind, since=None, until=None):
+    """Enregistrements à exporter, par clé primaire croissante ; bornes de dates incluses"""
+    model, date_field, _, _ = EXPORT_KINDS[kind]
+    queryset = model.objects.order_by('pk')
+    if since:
+        queryset = queryset.filter(**{f'{date_field}__date__gte': since})
+    if until:
+        queryset = queryset.filter(**{f'{date_field}__date__lte': until})
+    return queryset
+
+
+def _batches(queryset, serializer, chunk_size):
+    rows = (serializer(item) for item in queryset.iterator(chunk_size=chunk_size))
+    while True:
+        batch = list(islice(rows, chunk_size))
+        if not batch:
+            return
+        yield batch
+
+
+def iter_export(kind, export_format, since=None, until=None, chunk_size=2000):
+    """Générateur de morceaux de texte, un par lot de `chunk_size` lignes"""
+    if kind not in EXPORT_KINDS:
+        raise ValueError(f"Type d'export inconnu : {kind}")
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Format d'export inconnu : {export_format}")
+
+    _, _, serializer, columns = EXPORT_KINDS[kind]
+    batches = _batches(export_queryset(kind, since, until), serializer, chunk_size)
+
+    if export_format == 'csv':
+        writer = csv.DictWriter(_Echo(), fieldnames=columns)
+        yield writer.writeheader()
+        for batch in batches:
+            yield ''.join(writer.writerow({column: neutralize_formula(value) for column, value in row.items()}) for row in batch)
+    elif export_format == 'jsonl':
+        for batch in batches:
+            yield ''.join(json.dumps(row, ensure_ascii=False) + '\n' for row in batch)
+    else:
+        for batch in batches:
+            chunk = {'rows': len(batch), 'columns': {column: [row[column] for row in batch] for column in columns}}
+            yield json.dumps(chunk, ensure_ascii=False) + '\n'
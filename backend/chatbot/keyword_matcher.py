@@ -0,0 +1,156 @@
+"""
+Détection de mots-clés pour le chatbot MRE
+
+Les mots-clés sont normalisés (minuscules, accents retirés) et rangés une
+seule fois dans un trie de mots. Le texte est découpé en mots par le moteur
+`re`, puis parcouru en une seule passe : chaque mot coûte une recherche dans
+un dictionnaire, quel que soit le nombre de mots-clés. Les correspondances
+se font sur des mots entiers, "ir" ou "is" ne sont donc plus trouvés à
+l'intérieur de n'importe quel mot.
+
+Syntaxe des mots-clés :
+- "impôt"        mot entier (le pluriel en -s / -x est accepté)
+- "état civil"   expression de plusieurs mots
+- "fiscal*"      préfixe d'un seul mot : fiscal, fiscale, fiscalité...
+"""
+
+import re
+import unicodedata
+from functools import lru_cache
+
+from django.conf import settings
+
+
+# Table par défaut : domaine -> mots-clés. Surchargée par settings.CHATBOT_DOMAIN_KEYWORDS
+DOMAIN_KEYWORDS = {
+    'fiscalite': ['impôt', 'taxe', 'déclaration', 'fiscal*', 'tva', 'ir', 'is', 'convention'],
+    'immobilier': ['maison', 'appartement', 'terrain', 'achat', 'vente', 'location', 'immobili*'],
+    'investissement': ['investir', 'invest*', 'placement', 'bourse', 'opcvm', 'action', 'obligation', 'projet'],
+    'administration': ['consulat', 'passeport', 'visa', 'état civil', 'document', 'carte'],
+    'formation': ['formation', 'diplôme', 'certification', 'cours', 'apprentissage', 'métier'],
+}
+
+# Intentions pour les réponses locales, dans l'ordre de priorité.
+# Surchargée par settings.CHATBOT_FALLBACK_KEYWORDS
+FALLBACK_KEYWORDS = {
+    'greeting': ['bonjour', 'salut', 'hello', 'bonsoir'],
+    'services': ['service', 'démarche'],
+    'contact': ['contact*', 'téléphone', 'telephone', 'email', 'adresse'],
+    'pricing': ['prix', 'tarif', 'coût', 'payement', 'paiement'],
+    'thanks': ['merci', 'thanks', 'remercie'],
+}
+
+WORD_RE = re.compile(r'\w+')
+PLURAL_SUFFIXES = ('s', 'x')
+
+# Diacritiques combinants (U+0300 à U+036F) laissés par la décomposition NFKD
+COMBINING_MARKS_RE = re.compile('[\u0300-\u036f]')
+
+
+def fold(text):
+    """Normaliser un texte : minuscules et suppression des accents"""
+    text = text.casefold()
+    if text.isascii():
+        return text
+    return COMBINING_MARKS_RE.sub('', unicodedata.normalize('NFKD', text))
+
+
+class _TrieNode:
+    __slots__ = ('children', 'labels')
+
+    def __init__(self):
+        self.children = {}
+        self.labels = []
+
+
+class KeywordMatcher:
+    """Trie de mots-clés sur des mots entiers, construit une seule fois"""
+
+    def __init__(self, keyword_table):
+        # Les clés conservent l'ordre de la table (utilisé pour départager les égalités)
+        self.labels = list(keyword_table.keys())
+        self._root = _TrieNode()
+        # Préfixes du premier mot (mot-clé "fiscal*"), indexés par longueur
+        self._prefixes = {}
+
+        for label, keywords in keyword_table.items():
+            for keyword in keywords:
+                self._add(label, keyword)
+
+        self._prefix_lengths = sorted(self._prefixes, reverse=True)
+
+    def _add(self, label, keyword):
+        is_prefix = keyword.endswith('*')
+        words = WORD_RE.findall(fold(keyword.rstrip('*')))
+        if not words:
+            return
+
+        if is_prefix and len(words) == 1:
+            self._prefixes.setdefault(len(words[0]), {}).setdefault(words[0], []).append(label)
+            return
+
+        node = self._root
+        for word in words:
+            node = node.children.setdefault(word, _TrieNode())
+        node.labels.append(label)
+
+    def _child(self, node, word):
+        """Descendre d'un mot dans le trie, en tolérant un pluriel en -s / -x"""
+        child = node.children.get(word)
+        if child is None and len(word) > 2 and word[-1] in PLURAL_SUFFIXES:
+            child = node.children.get(word[:-1])
+        return child
+
+    def scores(self, text):
+        """Compter les mots-clés trouvés par catégorie, en une seule passe"""
+        result = {}
+        words = WORD_RE.findall(fold(text))
+        prefixes = self._prefixes
+
+        for index, word in enumerate(words):
+            for length in self._prefix_lengths:
+                if len(word) >= length:
+                    for label in prefixes[length].get(word[:length], ()):
+                        result[label] = result.get(label, 0) + 1
+
+            node = self._child(self._root, word)
+            position = index + 1
+            while node is not None:
+                for label in node.labels:
+                    result[label] = result.get(label, 0) + 1
+                if node.children and position < len(words):
+                    node = self._child(node, words[position])
+                    position += 1
+                else:
+                    node = None
+
+        return result
+
+    def best_match(self, text, default=None):
+        """Retourner la catégorie au score le plus élevé (ordre de la table en cas d'égalité)"""
+        scores = self.scores(text)
+        best_label, best_score = default, 0
+        for label in self.labels:
+            if scores.get(label, 0) > best_score:
+                best_label, best_score = label, scores[label]
+        return best_label
+
+    def first_match(self, text, default=None):
+        """Retourner la première catégorie trouvée selon l'ordre de priorité de la table"""
+        scores = self.scores(text)
+        for label in self.labels:
+            if scores.get(label):
+                return label
+        return default
+
+
+@lru_cache(maxsize=None)
+def get_domain_matcher():
+    """Trie des domaines MRE, construit une fois par processus"""
+    return KeywordMatcher(getattr(settings, 'CHATBOT_DOMAIN_KEYWORDS', DOMAIN_KEYWORDS))
+
+
+@lru_cache(maxsize=None)
+def get_fallback_matcher():
+    """Trie des intentions de réponse locale, construit une fois par processus"""
+    return KeywordMatcher(getattr(settings, 'CHATBOT_FALLBACK_KEYWORDS', FALLBACK_KEYWORDS))
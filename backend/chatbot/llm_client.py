@@ -0,0 +1,377 @@
+"""
+Client pour Azure OpenAI (chat completions)
+
+Un seul client par processus, partagé par toutes les requêtes :
+- pool de connexions keep-alive (httpx) au lieu d'une connexion par appel ;
+- délai maximal par appel, lu dans ChatbotConfiguration (`response_timeout_seconds`) ;
+- nombre d'appels simultanés borné (au-delà, réponse locale immédiate) ;
+- disjoncteur : après plusieurs échecs consécutifs, les appels sont coupés
+  pendant un temps et le chatbot répond avec ses réponses locales ;
+- histogrammes de latence (succès / échecs) consultables dans les analytics.
+
+Le client synchrone sert ChatAPIView. Le streaming de ChatStreamView passe
+par un client asynchrone qui tourne dans une boucle d'événements dédiée
+(un thread du worker) : sous WSGI, chaque requête a sa propre boucle, qui
+ne survit pas à la requête ; les connexions restent ainsi dans un seul pool
+du processus au lieu d'un client créé, et jamais fermé, par requête.
+"""
+
+import asyncio
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from functools import lru_cache
+
+import httpx
+from django.conf import settings
+
+from .models import ChatbotConfiguration
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT_SECONDS = 30
+
+# Bornes supérieures des tranches de l'histogramme, en millisecondes
+LATENCY_BUCKETS_MS = (100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+class LLMClientError(Exception):
+    """Erreur de communication avec le fournisseur LLM"""
+
+
+class LLMCircuitOpenError(LLMClientError):
+    """Le disjoncteur est ouvert : l'appel n'est pas tenté"""
+
+
+class LLMOverloadedError(LLMClientError):
+    """Trop d'appels simultanés vers le fournisseur LLM"""
+
+
+def is_configured():
+    """Vrai si l'endpoint et la clé Azure OpenAI sont renseignés"""
+    return bool(getattr(settings, 'AZURE_OPENAI_ENDPOINT', '') and getattr(settings, 'AZURE_OPENAI_API_KEY', ''))
+
+
+def get_model_name():
+    return getattr(settings, 'AZURE_OPENAI_MODEL', 'gpt-4o')
+
+
+def build_chat_url():
+    """URL du déploiement Azure OpenAI pour les chat completions"""
+    endpoint = settings.AZURE_OPENAI_ENDPOINT.rstrip('/')
+    api_version = getattr(settings, 'AZURE_OPENAI_API_VERSION', '2024-02-15-preview')
+    return f"{endpoint}/openai/deployments/{get_model_name()}/chat/completions?api-version={api_version}"
+
+
+def get_response_timeout():
+    """Délai maximal d'un appel, en secondes (configuration `response_timeout_seconds`)"""
+    value = ChatbotConfiguration.get_value('response_timeout_seconds', DEFAULT_TIMEOUT_SECONDS)
+    try:
+        return max(float(value), 1.0)
+    except (TypeError, ValueError):
+        return DEFAULT_TIMEOUT_SECONDS
+
+
+def parse_sse_line(line):
+    """Extraire le texte d'une ligne `data: {...}` ; None si la ligne ne contient pas de texte"""
+    if not line.startswith('data:'):
+        return None
+    payload = line[5:].strip()
+    if not payload or payload == '[DONE]':
+        return None
+    try:
+        chunk = json.loads(payload)
+    except ValueError:
+        return None
+    text = ''
+    for choice in chunk.get('choices') or []:
+        text += (choice.get('delta') or {}).get('content') or ''
+    return text or None
+
+
+class CircuitBreaker:
+    """Disjoncteur fermé / ouvert / semi-ouvert
+
+    Fermé : les appels passent. Après `failure_threshold` échecs consécutifs il
+    s'ouvre et refuse les appels pendant `reset_timeout` secondes, puis laisse
+    passer un seul appel d'essai (semi-ouvert) : un succès le referme, un
+    échec le rouvre.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_progress = False
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return self.CLOSED
+        if self._clock() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self):
+        """Vrai si un appel peut être tenté maintenant"""
+        with self._lock:
+            state = self._state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_in_progress:
+                self._trial_in_progress = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_progress = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_progress or self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+            self._trial_in_progress = False
+
+    def release_trial(self):
+        """Abandon d'un appel sans résultat (client parti, tâche annulée) : un autre appel d'essai pourra passer"""
+        with self._lock:
+            self._trial_in_progress = False
+
+
+class LatencyHistogram:
+    """Histogramme cumulatif de latences en millisecondes"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._total_ms = 0.0
+
+    def observe(self, duration_ms):
+        with self._lock:
+            self._counts[bisect_left(self.buckets, duration_ms)] += 1
+            self._total_ms += duration_ms
+
+    def snapshot(self):
+        """Nombre d'observations par tranche (`<= borne`, puis `+inf`), total et moyenne"""
+        with self._lock:
+            counts = list(self._counts)
+            total_ms = self._total_ms
+        count = sum(counts)
+        labels = [f'<= {bound} ms' for bound in self.buckets] + ['+inf']
+        return {
+            'buckets': list(zip(labels, counts)),
+            'count': count,
+            'avg_ms': round(total_ms / count, 1) if count else 0,
+        }
+
+
+class LLMClient:
+    """Client Azure OpenAI partagé : pool de connexions, délais, concurrence bornée, disjoncteur"""
+
+    def __init__(self, max_connections=10, max_concurrency=8, breaker=None):
+        self.max_connections = max_connections
+        self.max_concurrency = max_concurrency
+        self.breaker = breaker or CircuitBreaker()
+        self.success_latency = LatencyHistogram()
+        self.failure_latency = LatencyHistogram()
+        self._limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        # Boucle d'événements du streaming et son client, créés à la première utilisation
+        self._loop = None
+        self._async_client = None
+
+    def _headers(self):
+        return {'api-key': settings.AZURE_OPENAI_API_KEY, 'Content-Type': 'application/json'}
+
+    def _payload(self, messages, stream, temperature, max_tokens):
+        return {
+            'messages': messages,
+            'temperature': temperature,
+            'max_tokens': max_tokens,
+            'stream': stream,
+        }
+
+    def _http_timeout(self, timeout):
+        return httpx.Timeout(timeout, connect=min(timeout, 5.0))
+
+    def _get_client(self):
+        # Créé à la première utilisation : avec preload_app, chaque worker a son propre pool
+        with self._client_lock:
+            if self._client is None:
+                self._client = httpx.Client(limits=self._limits)
+            return self._client
+
+    def _get_loop(self):
+        # Même raison que _get_client : le thread est démarré dans le worker, après le fork
+        with self._client_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='llm-client', daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def _before_call(self):
+        if not self.breaker.allow():
+            raise LLMCircuitOpenError("Disjoncteur ouvert")
+
+    def _record(self, start, error=None):
+        duration_ms = (time.monotonic() - start) * 1000
+        if error is None:
+            self.breaker.record_success()
+            self.success_latency.observe(duration_ms)
+        else:
+            self.breaker.record_failure()
+            self.failure_latency.observe(duration_ms)
+            logger.warning("Appel LLM en échec après %.0f ms : %s", duration_ms, error)
+
+    def complete(self, messages, timeout=DEFAULT_TIMEOUT_SECONDS, temperature=0.3, max_tokens=800):
+        """Retourner la réponse complète du modèle (appel bloquant, borné par `timeout`)"""
+        # Pas d'attente : si toutes les places sont prises, la réponse locale est plus utile
+        if not self._slots.acquire(blocking=False):
+            raise LLMOverloadedError("Trop d'appels LLM simultanés")
+
+        start = time.monotonic()
+        try:
+            self._before_call()
+        except LLMCircuitOpenError:
+            self._slots.release()
+            raise
+
+        try:
+            response = self._get_client().post(
+                build_chat_url(),
+                headers=self._headers(),
+                json=self._payload(messages, False, temperature, max_tokens),
+                timeout=self._http_timeout(timeout),
+            )
+            if response.status_code != 200:
+                raise LLMClientError(f"HTTP {response.status_code}: {response.text[:200]}")
+            content = response.json()['choices'][0]['message']['content']
+        except LLMClientError as e:
+            self._record(start, e)
+            raise
+        except (httpx.HTTPError, ValueError, KeyError, IndexError) as e:
+            self._record(start, e)
+            raise LLMClientError(f"{type(e).__name__}: {e}") from e
+        except BaseException:
+            # Interrompu (arrêt du worker...) : ni succès ni échec, l'appel d'essai est rendu
+            self.breaker.release_trial()
+            raise
+        finally:
+            self._slots.release()
+
+        self._record(start)
+        return content
+
+    async def _produce(self, messages, timeout, temperature, max_tokens, emit):
+        # Exécuté dans la boucle dédiée : seule à utiliser le client asynchrone
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(limits=self._limits)
+        async with asyncio.timeout(timeout):
+            async with self._async_client.stream(
+                'POST',
+                build_chat_url(),
+                headers=self._headers(),
+                json=self._payload(messages, True, temperature, max_tokens),
+                timeout=self._http_timeout(timeout),
+            ) as response:
+                if response.status_code != 200:
+                    body = await response.aread()
+                    raise LLMClientError(f"HTTP {response.status_code}: {body[:200].decode('utf-8', 'replace')}")
+
+                async for line in response.aiter_lines():
+                    if line.strip() == 'data: [DONE]':
+                        break
+                    text = parse_sse_line(line)
+                    if text:
+                        emit(text)
+
+    async def stream(self, messages, timeout=DEFAULT_TIMEOUT_SECONDS, temperature=0.3, max_tokens=800):
+        """Générer les fragments de texte de la réponse au fur et à mesure (borné par `timeout`)"""
+        if not self._slots.acquire(blocking=False):
+            raise LLMOverloadedError("Trop d'appels LLM simultanés")
+        try:
+            self._before_call()
+        except LLMCircuitOpenError:
+            self._slots.release()
+            raise
+
+        start = time.monotonic()
+        loop = asyncio.get_running_loop()
+        fragments = asyncio.Queue()
+        done = object()
+
+        def emit(item):
+            try:
+                loop.call_soon_threadsafe(fragments.put_nowait, item)
+            except RuntimeError:
+                pass  # Boucle de la requête déjà fermée : personne n'attend plus
+
+        call = asyncio.run_coroutine_threadsafe(
+            self._produce(messages, timeout, temperature, max_tokens, emit), self._get_loop()
+        )
+        call.add_done_callback(lambda _: emit(done))
+        recorded = False
+        try:
+            while (text := await fragments.get()) is not done:
+                yield text
+            try:
+                call.result()
+            except LLMClientError as e:
+                recorded = True
+                self._record(start, e)
+                raise
+            except (httpx.HTTPError, TimeoutError) as e:
+                recorded = True
+                self._record(start, e)
+                raise LLMClientError(f"{type(e).__name__}: {e}") from e
+            recorded = True
+            self._record(start)
+        finally:
+            # Client parti (GeneratorExit) ou tâche annulée : l'appel s'arrête sans
+            # compter comme un échec, et le disjoncteur ne reste pas bloqué en semi-ouvert
+            if not recorded:
+                call.cancel()
+                self.breaker.release_trial()
+            self._slots.release()
+
+    def stats(self):
+        """État du disjoncteur et histogrammes de latence"""
+        return {
+            'circuit_state': self.breaker.state,
+            'success_latency': self.success_latency.snapshot(),
+            'failure_latency': self.failure_latency.snapshot(),
+        }
+
+
+@lru_cache(maxsize=None)
+def get_client():
+    """Client LLM du processus, configuré par les settings CHATBOT_LLM_*"""
+    return LLMClient(
+        max_connections=getattr(settings, 'CHATBOT_LLM_MAX_CONNECTIONS', 10),
+        max_concurrency=getattr(settings, 'CHATBOT_LLM_MAX_CONCURRENCY', 8),
+        breaker=CircuitBreaker(
+            failure_threshold=getattr(settings, 'CHATBOT_LLM_BREAKER_THRESHOLD', 5),
+            reset_timeout=getattr(settings, 'CHATBOT_LLM_BREAKER_RESET_SECONDS', 30),
+        ),
+    )
@@ -0,0 +1,80 @@
+"""
+Commande de gestion Django pour comparer le trie de mots-clés à l'ancienne
+classification par sous-chaînes (précision et débit)
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from chatbot.keyword_matcher import DOMAIN_KEYWORDS, KeywordMatcher
+
+
+# Petit corpus annoté : (message, domaine attendu)
+SAMPLE_CORPUS = [
+    ('Comment déclarer mes impôts au Maroc ?', 'fiscalite'),
+    ('Quelle est la convention fiscale avec la Belgique ?', 'fiscalite'),
+    ('Je veux acheter un appartement à Tanger', 'immobilier'),
+    ("Conseils pour l'investissement immobilier", 'immobilier'),
+    ('Comment investir en bourse ?', 'investissement'),
+    ('Quels OPCVM pour un placement à long terme ?', 'investissement'),
+    ('Renouvellement de passeport au consulat de Paris', 'administration'),
+    ("Acte d'état civil pour mon enfant", 'administration'),
+    ('Je cherche une formation certifiante en comptabilité', 'formation'),
+    ('Reconnaissance de mon diplôme étranger', 'formation'),
+    ('Bonjour, ceci est un test', 'other'),
+    ('Il fait beau aujourd’hui à Rabat', 'other'),
+    ('Quel est votre avis sur la situation ?', 'other'),
+    ('Mission impossible, je visite ma famille', 'other'),
+]
+
+
+def legacy_classify(message, keywords):
+    """Ancienne implémentation : recherche de sous-chaînes sans frontières de mots"""
+    message_lower = message.lower()
+    for domain, words in keywords.items():
+        if any(word.rstrip('*') in message_lower for word in words):
+            return domain
+    return 'other'
+
+
+class Command(BaseCommand):
+    help = "Mesure la précision et le débit du trie de mots-clés du chatbot"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=2000,
+                            help='Nombre de passages sur le corpus')
+        parser.add_argument('--extra-keywords', type=int, default=0,
+                            help='Mots-clés fictifs ajoutés à chaque domaine pour simuler une table plus grande')
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        keywords = {
+            domain: words + [f'{domain}{index:04d}' for index in range(options['extra_keywords'])]
+            for domain, words in DOMAIN_KEYWORDS.items()
+        }
+        matcher = KeywordMatcher(keywords)
+        messages = [message for message, _ in SAMPLE_CORPUS]
+
+        keyword_count = sum(len(words) for words in keywords.values())
+        self.stdout.write(f'{keyword_count} mots-clés, {len(messages)} messages x {iterations} passages')
+
+        implementations = [
+            ('Sous-chaînes (ancien)', lambda message: legacy_classify(message, keywords)),
+            ('Trie de mots (nouveau)', lambda message: matcher.best_match(message, default='other')),
+        ]
+
+        for label, classify in implementations:
+            correct = sum(1 for message, expected in SAMPLE_CORPUS if classify(message) == expected)
+
+            start = time.perf_counter()
+            for _ in range(iterations):
+                for message in messages:
+                    classify(message)
+            elapsed = time.perf_counter() - start
+
+            total = iterations * len(messages)
+            self.stdout.write(
+                f'{label}: précision {correct}/{len(SAMPLE_CORPUS)}, '
+                f'{total / elapsed:,.0f} messages/s ({elapsed * 1e6 / total:.1f} µs/message)'
+            )
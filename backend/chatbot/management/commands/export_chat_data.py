@@ -0,0 +1,52 @@
+"""
+Commande de gestion Django pour exporter les sessions, messages ou retours
+du chatbot en CSV, JSONL ou lots en colonnes (voir chatbot.export)
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from chatbot.export import EXPORT_FORMATS, EXPORT_KINDS, iter_export
+
+
+def date_option(value):
+    try:
+        date = parse_date(value)
+    except ValueError:
+        date = None
+    if date is None:
+        raise CommandError(f'Date invalide "{value}", format attendu : AAAA-MM-JJ')
+    return date
+
+
+class Command(BaseCommand):
+    help = "Exporte les conversations du chatbot en flux, sans les charger en mémoire"
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(EXPORT_KINDS), help='Données à exporter')
+        parser.add_argument('--format', dest='export_format', choices=list(EXPORT_FORMATS), default='jsonl',
+                            help='Format de sortie (jsonl par défaut)')
+        parser.add_argument('--since', type=date_option, help='Date de début incluse (AAAA-MM-JJ)')
+        parser.add_argument('--until', type=date_option, help='Date de fin incluse (AAAA-MM-JJ)')
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Nombre de lignes lues et écrites par lot')
+        parser.add_argument('--output', help='Fichier de sortie (sortie standard par défaut)')
+
+    def handle(self, *args, **options):
+        chunks = iter_export(
+            options['kind'],
+            options['export_format'],
+            since=options['since'],
+            until=options['until'],
+            chunk_size=options['chunk_size'],
+        )
+
+        if not options['output']:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+
+        with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+            for chunk in chunks:
+                output.write(chunk)
+        self.stderr.write(self.style.SUCCESS(f"Export écrit dans {options['output']}"))
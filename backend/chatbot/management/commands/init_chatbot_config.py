@@ -48,6 +48,16 @@ class Command(BaseCommand):
                 'key': 'feedback_enabled',
                 'value': 'true',
                 'description': 'Activer le système de feedback sur les réponses'
+            },
+            {
+                'key': 'rate_limit_chat',
+                'value': '10/60',
+                'description': 'Messages autorisés par IP et par session ("capacité/secondes", "off" pour désactiver)'
+            },
+            {
+                'key': 'rate_limit_feedback',
+                'value': '30/60',
+                'description': 'Retours autorisés par IP et par session ("capacité/secondes", "off" pour désactiver)'
             }
         ]
 
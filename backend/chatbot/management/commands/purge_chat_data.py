@@ -0,0 +1,63 @@
+"""
+Commande de gestion Django pour appliquer les durées de conservation des
+données du chatbot (sessions, messages, retours)
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from chatbot.retention import DEFAULT_RETENTION_DAYS, RetentionEngine
+
+
+def parse_policy(value):
+    """Option --policy "catégorie=jours" (ou "catégorie=keep" pour conserver)"""
+    try:
+        category, days = value.split('=')
+    except ValueError:
+        raise CommandError(f'Politique invalide "{value}", format attendu : catégorie=jours')
+    if category not in DEFAULT_RETENTION_DAYS:
+        raise CommandError(f'Catégorie inconnue "{category}" ({", ".join(DEFAULT_RETENTION_DAYS)})')
+    if days == 'keep':
+        return category, None
+    try:
+        return category, int(days)
+    except ValueError:
+        raise CommandError(f'Nombre de jours invalide pour "{category}" : {days}')
+
+
+class Command(BaseCommand):
+    help = "Supprime les données du chatbot plus anciennes que leur durée de conservation"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--policy', action='append', default=[],
+                            help='Durée de conservation "catégorie=jours" ou "catégorie=keep" (répétable)')
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Nombre de sessions (ou retours) supprimés par transaction')
+        parser.add_argument('--export-dir',
+                            help='Archiver les lignes supprimées dans ce dossier (JSONL compressé)')
+        parser.add_argument('--pause', type=float, default=0,
+                            help='Pause en secondes entre deux lots')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Compter les lignes concernées sans rien supprimer')
+
+    def handle(self, *args, **options):
+        policies = dict(parse_policy(value) for value in options['policy'])
+        engine = RetentionEngine(
+            policies=policies,
+            chunk_size=options['chunk_size'],
+            export_dir=options['export_dir'],
+            dry_run=options['dry_run'],
+            pause=options['pause'],
+        )
+
+        for category, days in engine.policies.items():
+            self.stdout.write(f"{category} : {'conservé' if days is None else f'{days} jours'}")
+
+        report = engine.run()
+        verb = 'à supprimer' if options['dry_run'] else 'supprimé(s)'
+        for category, result in report.items():
+            self.stdout.write(self.style.SUCCESS(
+                f"{category} : {result['sessions']} sessions, {result['messages']} messages, "
+                f"{result['feedback']} retours {verb}, ~{result['bytes'] / 1024:.1f} Ko de texte"
+            ))
+            if result['export']:
+                self.stdout.write(f"  archive : {result['export']}")
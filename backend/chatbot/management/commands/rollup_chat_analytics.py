@@ -0,0 +1,34 @@
+"""
+Commande de gestion Django pour agréger les nouvelles sessions, réponses et
+retours du chatbot dans ChatAnalytics (à lancer périodiquement, ex. cron)
+"""
+
+from django.core.management.base import BaseCommand
+
+from chatbot.analytics import analytics_counters, reset_rollup, rollup_analytics
+
+
+class Command(BaseCommand):
+    help = "Agrège dans ChatAnalytics les données du chatbot créées depuis le dernier passage"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Nombre maximum de lignes par table et par transaction')
+        parser.add_argument('--lag-seconds', type=int, default=60,
+                            help='Ignorer les lignes plus récentes que ce délai (reprises au passage suivant)')
+        parser.add_argument('--rebuild', action='store_true',
+                            help="Remettre les colonnes du rollup à zéro et tout agréger depuis le début")
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            reset_rollup()
+            self.stdout.write('Colonnes du rollup remises à zéro')
+
+        flushed = analytics_counters.flush()
+        totals = rollup_analytics(batch_size=options['batch_size'], lag_seconds=options['lag_seconds'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Rollup terminé : {totals.get('sessions', 0)} sessions, "
+            f"{totals.get('messages', 0)} messages, {totals.get('feedback', 0)} retours "
+            f"({flushed} jour(s) de compteurs écrits)"
+        ))
@@ -0,0 +1,38 @@
+# Generated by Django 4.2 on 2026-10-19 01:20
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0003_chatanalytics_failed_responses'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatRollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=50, unique=True)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='chatanalytics',
+            name='bot_responses',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chatanalytics',
+            name='feedback_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='chatmessage',
+            name='timestamp',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+    ]
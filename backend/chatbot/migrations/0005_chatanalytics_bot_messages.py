@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-19 02:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0004_chat_analytics_rollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatanalytics',
+            name='bot_messages',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -44,7 +44,7 @@ class ChatMessage(models.Model):
     message_type = models.CharField(max_length=10, choices=MESSAGE_TYPES)
     content = models.TextField()
     domain_category = models.CharField(max_length=20, choices=DOMAIN_CATEGORIES, null=True, blank=True)
-    timestamp = models.DateTimeField(default=timezone.now)
+    timestamp = models.DateTimeField(default=timezone.now, db_index=True)
       # Métadonnées pour analytics
     response_time_ms = models.IntegerField(null=True, blank=True)  # Temps de réponse API
     api_model_used = models.CharField(max_length=50, default='gpt-4o')
@@ -111,6 +111,12 @@ class ChatAnalytics(models.Model):
     satisfaction_avg = models.FloatField(null=True, blank=True)
     failed_responses = models.IntegerField(default=0)  # Ajout du champ manquant
 
+    # Effectifs des moyennes, tenus à jour par le rollup (rollup_chat_analytics)
+    bot_responses = models.IntegerField(default=0)
+    feedback_count = models.IntegerField(default=0)
+    # Messages du bot ; total_messages ne compte que les messages utilisateur
+    bot_messages = models.IntegerField(default=0)
+
     # Conversions
     signups_from_chat = models.IntegerField(default=0)
     service_requests_from_chat = models.IntegerField(default=0)
@@ -123,6 +129,16 @@ class ChatAnalytics(models.Model):
         return f"Analytics {self.date} - {self.total_sessions} sessions"
 
 
+class ChatRollupWatermark(models.Model):
+    """Dernier identifiant agrégé dans ChatAnalytics, par table source"""
+    source = models.CharField(max_length=50, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Rollup {self.source} jusqu'à #{self.last_id}"
+
+
 class ChatbotConfiguration(models.Model):
     """Configuration du chatbot"""
     key = models.CharField(max_length=100, unique=True)
@@ -140,12 +156,9 @@ class ChatbotConfiguration(models.Model):
 
     @classmethod
     def get_value(cls, key, default=None):
-        """Récupérer une valeur de configuration"""
-        try:
-            config = cls.objects.get(key=key, is_active=True)
-            return config.value
-        except cls.DoesNotExist:
-            return default
+        """Récupérer une valeur de configuration (instantané en mémoire, voir chatbot.config)"""
+        from .config import get_config
+        return get_config().get(key, default)
 
     @classmethod
     def set_value(cls, key, value, description="", user=None):
@@ -0,0 +1,165 @@
+"""
+Durée de conservation des données du chatbot et purge
+
+Chaque catégorie a une durée de conservation en jours (None : conservée) :
+- anonymous_sessions : sessions sans utilisateur (IP, user agent), avec
+  leurs messages et retours, d'après la dernière activité (`updated_at`) ;
+- user_sessions : sessions d'utilisateurs connectés, idem ;
+- feedback : retours seuls, d'après `created_at`.
+
+Les valeurs par défaut (DEFAULT_RETENTION_DAYS) sont surchargées par
+settings.CHATBOT_RETENTION_DAYS puis par les options de la commande
+purge_chat_data.
+
+La suppression se fait par lots de `chunk_size` lignes, chacun dans sa
+propre transaction, pour ne jamais garder de verrou longtemps. Chaque lot
+peut être archivé avant suppression dans un fichier JSONL compressé (gzip).
+"""
+
+import gzip
+import json
+import os
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import Length
+from django.utils import timezone
+
+from . import session_state
+from .models import ChatFeedback, ChatMessage, ChatSession
+from .transcripts import feedback_to_dict, message_to_dict, session_to_dict
+
+DEFAULT_RETENTION_DAYS = {
+    'anonymous_sessions': 30,
+    'user_sessions': None,
+    'feedback': None,
+}
+
+
+def get_retention_policies(overrides=None):
+    """Durées de conservation effectives, en jours, par catégorie"""
+    policies = dict(DEFAULT_RETENTION_DAYS)
+    policies.update(getattr(settings, 'CHATBOT_RETENTION_DAYS', {}))
+    policies.update(overrides or {})
+    unknown = set(policies) - set(DEFAULT_RETENTION_DAYS)
+    if unknown:
+        raise ValueError(f"Catégories de conservation inconnues : {', '.join(sorted(unknown))}")
+    return policies
+
+
+def expired_queryset(category, cutoff):
+    """Lignes de la catégorie plus anciennes que `cutoff`"""
+    if category == 'anonymous_sessions':
+        return ChatSession.objects.filter(user__isnull=True, updated_at__lt=cutoff)
+    if category == 'user_sessions':
+        return ChatSession.objects.filter(user__isnull=False, updated_at__lt=cutoff)
+    return ChatFeedback.objects.filter(created_at__lt=cutoff)
+
+
+def _text_bytes(queryset, *fields):
+    """Taille approximative (en caractères) des champs texte d'un ensemble de lignes"""
+    totals = queryset.aggregate(**{field: Sum(Length(field)) for field in fields})
+    return sum(value or 0 for value in totals.values())
+
+
+class RetentionEngine:
+    """Applique les durées de conservation, lot par lot"""
+
+    def __init__(self, policies=None, chunk_size=500, export_dir=None, dry_run=False, pause=0, now=None):
+        self.policies = get_retention_policies(policies)
+        self.chunk_size = chunk_size
+        self.export_dir = export_dir
+        self.dry_run = dry_run
+        self.pause = pause
+        self.now = now or timezone.now()
+
+    def run(self):
+        """Purger toutes les catégories ; retourne un rapport par catégorie"""
+        report = {}
+        for category, days in self.policies.items():
+            if days is None:
+                continue
+            report[category] = self.purge(category, self.now - timedelta(days=days))
+        return report
+
+    def purge(self, category, cutoff):
+        """Purger une catégorie ; retourne les lignes supprimées par table et les octets libérés"""
+        result = {'sessions': 0, 'messages': 0, 'feedback': 0, 'bytes': 0, 'export': None}
+        queryset = expired_queryset(category, cutoff)
+        is_sessions = queryset.model is ChatSession
+
+        if self.dry_run:
+            pks = queryset.values('pk')
+            if is_sessions:
+                messages = ChatMessage.objects.filter(session__in=pks)
+                result['sessions'] = queryset.count()
+                result['messages'] = messages.count()
+                result['feedback'] = ChatFeedback.objects.filter(message__session__in=pks).count()
+                result['bytes'] = _text_bytes(queryset, 'user_agent') + _text_bytes(messages, 'content')
+            else:
+                result['feedback'] = queryset.count()
+                result['bytes'] = _text_bytes(queryset, 'comment')
+            return result
+
+        export_file = None
+        if self.export_dir:
+            os.makedirs(self.export_dir, exist_ok=True)
+            result['export'] = os.path.join(
+                self.export_dir, f"chatbot-{category}-{self.now:%Y%m%d-%H%M%S}.jsonl.gz"
+            )
+            export_file = gzip.open(result['export'], 'at', encoding='utf-8')
+
+        try:
+            while True:
+                pks = list(queryset.values_list('pk', flat=True)[:self.chunk_size])
+                if not pks:
+                    break
+                if is_sessions:
+                    self._purge_sessions(pks, export_file, result)
+                else:
+                    self._purge_feedback(pks, export_file, result)
+                if self.pause:
+                    time.sleep(self.pause)
+        finally:
+            if export_file:
+                export_file.close()
+
+        return result
+
+    def _write(self, export_file, data):
+        export_file.write(json.dumps(data, ensure_ascii=False) + '\n')
+
+    def _purge_sessions(self, pks, export_file, result):
+        with transaction.atomic():
+            sessions = ChatSession.objects.filter(pk__in=pks)
+            messages = ChatMessage.objects.filter(session__in=pks)
+            result['bytes'] += _text_bytes(sessions, 'user_agent') + _text_bytes(messages, 'content')
+
+            if export_file:
+                for session in sessions.prefetch_related('messages__feedback'):
+                    transcript = [
+                        message_to_dict(message, feedback=message.feedback.all())
+                        for message in sorted(session.messages.all(), key=lambda message: message.timestamp)
+                    ]
+                    self._write(export_file, session_to_dict(session, messages=transcript))
+                export_file.flush()
+
+            # Du plus bas au plus haut : chaque DELETE est simple, sans collecte en cascade
+            result['feedback'] += ChatFeedback.objects.filter(message__session__in=pks).delete()[0]
+            result['messages'] += messages.delete()[0]
+            session_ids = list(sessions.values_list('session_id', flat=True))
+            result['sessions'] += sessions.delete()[0]
+            transaction.on_commit(lambda: session_state.forget_sessions(session_ids))
+
+    def _purge_feedback(self, pks, export_file, result):
+        with transaction.atomic():
+            feedback = ChatFeedback.objects.filter(pk__in=pks)
+            result['bytes'] += _text_bytes(feedback, 'comment')
+            if export_file:
+                for item in feedback:
+                    self._write(export_file, feedback_to_dict(item))
+                export_file.flush()
+            result['feedback'] += feedback.delete()[0]
@@ -0,0 +1,278 @@
+"""
+Recherche locale dans les FAQ et les ressources pour le chatbot MRE
+
+Un index inversé BM25 par langue est gardé en mémoire :
+- FAQ : question (comptée deux fois) et réponse ;
+- Resource : titre (compté deux fois) et description, dans chaque langue
+  de `available_languages`.
+
+L'index est construit au premier appel puis mis à jour ligne par ligne par
+les signaux post_save / post_delete (voir chatbot.signals), une fois la
+transaction validée, et seulement si un champ indexé (INDEXED_FIELDS) a
+changé : le compteur de vues d'une ressource ne le touche pas. Les autres
+processus sont prévenus par un compteur de version dans le cache,
+incrémenté à chaque modification, et reconstruisent leur index au plus
+tard CHATBOT_RETRIEVAL_CHECK_SECONDS après la modification.
+"""
+
+import heapq
+import math
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .keyword_matcher import WORD_RE, fold
+
+INDEX_VERSION_KEY = 'chatbot:retrieval:counter'
+
+# Champs dont dépend l'index, par modèle
+INDEXED_FIELDS = {
+    'faq': ('question', 'answer', 'language', 'is_active'),
+    'resource': ('title', 'description', 'available_languages', 'is_active'),
+}
+
+# Mots trop fréquents pour aider au classement
+STOP_WORDS = frozenset(fold(word) for word in (
+    'a au aux avec ce ces comment dans de des du elle en est et il je la le les leur '
+    'ma mais me mes mon ne nous on ou où par pas pour qu que quel quelle quels quelles qui '
+    'sa se ses son sur ta te tes ton tu un une vos votre vous y '
+    'an and are at be can do for how i in is it my of on or the to what when where which with you your'
+).split())
+
+
+def tokenize(text):
+    """Mots normalisés d'un texte, sans mots vides et au singulier"""
+    tokens = []
+    for word in WORD_RE.findall(fold(text)):
+        if word in STOP_WORDS or len(word) < 2:
+            continue
+        if len(word) > 3 and word[-1] in 'sx':
+            word = word[:-1]
+        tokens.append(word)
+    return tokens
+
+
+class BM25Index:
+    """Index inversé BM25 modifiable document par document"""
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings = {}
+        self._documents = {}
+        self._total_length = 0
+        # Normalisation de longueur par document, recalculée après une modification
+        self._norms = None
+
+    def __len__(self):
+        return len(self._documents)
+
+    def add(self, key, tokens, payload):
+        """Ajouter (ou remplacer) un document"""
+        self.remove(key)
+        term_counts = Counter(tokens)
+        self._documents[key] = (len(tokens), payload, tuple(term_counts))
+        self._total_length += len(tokens)
+        self._norms = None
+        for term, count in term_counts.items():
+            self._postings.setdefault(term, {})[key] = count
+
+    def remove(self, key):
+        """Retirer un document ; sans effet s'il n'est pas indexé"""
+        document = self._documents.pop(key, None)
+        if document is None:
+            return
+        self._total_length -= document[0]
+        self._norms = None
+        for term in document[2]:
+            del self._postings[term][key]
+            if not self._postings[term]:
+                del self._postings[term]
+
+    def search(self, tokens, k=3):
+        """Les `k` meilleurs documents : liste de (score, couverture, payload)
+
+        La couverture est la part des mots de la question présents dans le
+        document ; contrairement au score, elle ne dépend pas de la taille
+        du corpus.
+        """
+        if not self._documents:
+            return []
+
+        terms = set(tokens)
+        count = len(self._documents)
+        norms = self._norms
+        if norms is None:
+            average_length = self._total_length / count or 1
+            norms = self._norms = {
+                key: self.k1 * (1 - self.b + self.b * document[0] / average_length)
+                for key, document in self._documents.items()
+            }
+        boost = self.k1 + 1
+        scores = {}
+        matches = Counter()
+        for term in terms:
+            docs = self._postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (count - len(docs) + 0.5) / (len(docs) + 0.5)) * boost
+            for key, frequency in docs.items():
+                scores[key] = scores.get(key, 0.0) + idf * frequency / (frequency + norms[key])
+                matches[key] += 1
+
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(score, matches[key] / len(terms), self._documents[key][1]) for key, score in best]
+
+
+def faq_document(faq):
+    """(langues, jetons, payload) d'une FAQ à indexer"""
+    tokens = tokenize(faq.question) * 2 + tokenize(faq.answer)
+    payload = {'type': 'faq', 'id': faq.pk, 'title': faq.question, 'text': faq.answer}
+    return [faq.language or 'fr'], tokens, payload
+
+
+def resource_document(resource):
+    """(langues, jetons, payload) d'une ressource à indexer"""
+    tokens = tokenize(resource.title) * 2 + tokenize(resource.description)
+    payload = {'type': 'resource', 'id': resource.pk, 'title': resource.title, 'text': resource.description}
+    languages = [language.strip() for language in resource.available_languages.split(',') if language.strip()]
+    return languages or ['fr'], tokens, payload
+
+
+class RetrievalEngine:
+    """Index BM25 par langue sur les FAQ et ressources actives"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._indexes = {}
+        self._languages = {}
+        self.version = None
+        self.checked_at = 0.0
+
+    def rebuild(self):
+        """Reconstruire tous les index depuis la base"""
+        from resources.models import FAQ, Resource
+
+        cache.add(INDEX_VERSION_KEY, 0, None)
+        version = cache.get(INDEX_VERSION_KEY)
+        with self._lock:
+            self._indexes = {}
+            self._languages = {}
+            for faq in FAQ.objects.filter(is_active=True).only('question', 'answer', 'language'):
+                self._add(('faq', faq.pk), *faq_document(faq))
+            for resource in Resource.objects.filter(is_active=True).only('title', 'description', 'available_languages'):
+                self._add(('resource', resource.pk), *resource_document(resource))
+            self.version = version
+            self.checked_at = time.monotonic()
+
+    def _add(self, key, languages, tokens, payload):
+        for language in languages:
+            self._indexes.setdefault(language, BM25Index()).add(key, tokens, payload)
+        self._languages[key] = languages
+
+    def _remove(self, key):
+        for language in self._languages.pop(key, ()):
+            self._indexes[language].remove(key)
+
+    def update(self, instance):
+        """Indexer à nouveau une FAQ ou une ressource (retirée si inactive)"""
+        key = (instance._meta.model_name, instance.pk)
+        with self._lock:
+            self._remove(key)
+            if instance.is_active:
+                if key[0] == 'faq':
+                    self._add(key, *faq_document(instance))
+                else:
+                    self._add(key, *resource_document(instance))
+
+    def remove(self, instance):
+        with self._lock:
+            self._remove((instance._meta.model_name, instance.pk))
+
+    def search(self, query, language='fr', k=3):
+        """Les `k` meilleurs résultats pour une question : liste de (score, couverture, payload)"""
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        index = self._indexes.get(language) or self._indexes.get('fr')
+        if index is None:
+            return []
+        with self._lock:
+            return index.search(tokens, k)
+
+    def is_stale(self):
+        """Vrai si un autre processus a modifié les FAQ ou ressources depuis la construction"""
+        now = time.monotonic()
+        if now - self.checked_at < getattr(settings, 'CHATBOT_RETRIEVAL_CHECK_SECONDS', 10):
+            return False
+        self.checked_at = now
+        return cache.get(INDEX_VERSION_KEY) != self.version
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """Moteur de recherche du processus, construit au premier appel"""
+    global _engine
+
+    engine = _engine
+    if engine is None or engine.is_stale():
+        with _engine_lock:
+            if _engine is None or _engine is engine:
+                engine = RetrievalEngine()
+                engine.rebuild()
+                _engine = engine
+            engine = _engine
+    return engine
+
+
+def _publish_change():
+    """Nouvelle version pour les autres processus
+
+    L'index local, déjà à jour, ne prend la nouvelle version que s'il avait
+    la précédente : sinon un autre processus a publié une modification qu'il
+    n'a pas encore reprise, et il est reconstruit au prochain appel.
+    """
+    global _engine
+
+    cache.add(INDEX_VERSION_KEY, 0, None)
+    try:
+        version = cache.incr(INDEX_VERSION_KEY)
+    except ValueError:
+        # Compteur évincé entre-temps
+        version = None
+    with _engine_lock:
+        if _engine is None:
+            return
+        if version is not None and _engine.version == version - 1:
+            _engine.version = version
+        else:
+            _engine = None
+
+
+def indexed_values(instance):
+    """Valeurs des champs indexés chargés d'une FAQ ou d'une ressource"""
+    return tuple(instance.__dict__.get(field) for field in INDEXED_FIELDS[instance._meta.model_name])
+
+
+def content_changed(instance, deleted=False):
+    """Répercuter la modification d'une FAQ ou d'une ressource sur l'index, après validation"""
+    def apply():
+        if _engine is not None:
+            if deleted:
+                _engine.remove(instance)
+            else:
+                _engine.update(instance)
+        _publish_change()
+
+    transaction.on_commit(apply)
+
+
+def search(query, language='fr', k=3):
+    return get_engine().search(query, language, k)
@@ -0,0 +1,117 @@
+"""
+État des sessions de chat, gardé dans le cache
+
+Pour chaque session active, le cache contient :
+- la ChatSession elle-même, pour ne pas la relire à chaque message ;
+- les derniers messages utilisateur, qui servent à détecter les questions
+  répétées ;
+- le nombre total de messages utilisateur, qui sert à appliquer
+  `max_messages_per_session` sans compter les lignes. Il est incrémenté
+  avec cache.incr, atomique : deux messages simultanés sont bien comptés
+  deux fois ;
+- une clé de "touch" qui limite l'écriture de `updated_at` à une fois par
+  CHATBOT_SESSION_TOUCH_SECONDS.
+
+Les messages d'une session arrivent sur n'importe quel worker : en
+production, le cache doit être partagé (Redis, REDIS_URL). Avec le cache
+en mémoire locale, chaque processus tient son propre compteur et la limite
+n'est appliquée que par worker.
+
+Une session désactivée ou purgée est retirée du cache (forget_sessions,
+appelé par chatbot.signals et chatbot.retention). Si le cache est vidé,
+l'état est reconstruit depuis la base au message suivant.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import ChatMessage, ChatSession
+
+SESSION_KEY = 'chatbot:session:{}'
+RECENT_KEY = 'chatbot:session:{}:recent'
+COUNT_KEY = 'chatbot:session:{}:count'
+TOUCH_KEY = 'chatbot:session:{}:touch'
+
+# Nombre de messages utilisateur gardés dans la fenêtre
+WINDOW_SIZE = 5
+
+
+def state_timeout():
+    return getattr(settings, 'CHATBOT_SESSION_STATE_SECONDS', 1800)
+
+
+def touch_interval():
+    return getattr(settings, 'CHATBOT_SESSION_TOUCH_SECONDS', 60)
+
+
+def get_active_session(session_id):
+    """ChatSession active, depuis le cache ou la base ; None si elle n'existe pas"""
+    session = cache.get(SESSION_KEY.format(session_id))
+    if session is None:
+        session = ChatSession.objects.filter(session_id=session_id, is_active=True).first()
+        if session is not None:
+            cache.set(SESSION_KEY.format(session_id), session, state_timeout())
+    return session
+
+
+def remember_new_session(session):
+    """Mettre en cache une session qui vient d'être créée (fenêtre vide, déjà à jour)"""
+    cache.set_many({
+        SESSION_KEY.format(session.session_id): session,
+        RECENT_KEY.format(session.session_id): [],
+        COUNT_KEY.format(session.session_id): 0,
+    }, state_timeout())
+    cache.add(TOUCH_KEY.format(session.session_id), True, touch_interval())
+
+
+def forget_sessions(session_ids):
+    """Retirer du cache l'état de sessions désactivées ou supprimées"""
+    cache.delete_many([
+        key.format(session_id)
+        for session_id in session_ids
+        for key in (SESSION_KEY, RECENT_KEY, COUNT_KEY, TOUCH_KEY)
+    ])
+
+
+def touch_session(session):
+    """Mettre à jour `updated_at` au plus une fois par intervalle ; True si écrit"""
+    if not cache.add(TOUCH_KEY.format(session.session_id), True, touch_interval()):
+        return False
+    session.updated_at = timezone.now()
+    session.save(update_fields=['updated_at'])
+    return True
+
+
+def get_message_window(session):
+    """Fenêtre {'count': total, 'recent': [(contenu, horodatage), ...]} des messages utilisateur"""
+    recent_key, count_key = RECENT_KEY.format(session.session_id), COUNT_KEY.format(session.session_id)
+    values = cache.get_many([recent_key, count_key])
+    recent, count = values.get(recent_key), values.get(count_key)
+    if recent is None or count is None:
+        user_messages = ChatMessage.objects.filter(session=session, message_type='user')
+        if recent is None:
+            recent = list(user_messages.order_by('-timestamp').values_list('content', 'timestamp')[:WINDOW_SIZE])[::-1]
+            cache.set(recent_key, recent, state_timeout())
+        if count is None:
+            count = user_messages.count()
+            # Un compteur posé entre-temps par un autre worker est gardé
+            if not cache.add(count_key, count, state_timeout()):
+                count = cache.get(count_key, count)
+    return {'count': count, 'recent': recent}
+
+
+def record_user_message(session, message):
+    """Ajouter un message utilisateur enregistré à la fenêtre de sa session"""
+    try:
+        count = cache.incr(COUNT_KEY.format(session.session_id))
+    except ValueError:
+        # Reconstruite depuis la base, qui contient déjà ce message
+        return get_message_window(session)
+    recent = cache.get(RECENT_KEY.format(session.session_id))
+    if recent is None:
+        return get_message_window(session)
+    # Dernier écrit gagne : la fenêtre ne sert qu'à repérer les répétitions
+    recent = (recent + [(message.content, message.timestamp)])[-WINDOW_SIZE:]
+    cache.set(RECENT_KEY.format(session.session_id), recent, state_timeout())
+    return {'count': count, 'recent': recent}
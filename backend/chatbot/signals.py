@@ -0,0 +1,53 @@
+"""
+Signaux du chatbot MRE
+"""
+
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from resources.models import FAQ, Resource
+
+from .config import invalidate_config
+from . import session_state
+from .models import ChatbotConfiguration, ChatSession
+from .retrieval import INDEXED_FIELDS, content_changed, indexed_values
+
+
+@receiver(post_save, sender=ChatbotConfiguration)
+@receiver(post_delete, sender=ChatbotConfiguration)
+def chatbot_configuration_changed(sender, **kwargs):
+    """Invalider l'instantané de configuration après une modification"""
+    invalidate_config()
+
+
+@receiver(post_save, sender=ChatSession)
+def chat_session_saved(sender, instance, **kwargs):
+    """Ne plus servir depuis le cache une session désactivée"""
+    if not instance.is_active:
+        session_state.forget_sessions([instance.session_id])
+
+
+@receiver(post_init, sender=FAQ)
+@receiver(post_init, sender=Resource)
+def chatbot_content_loaded(sender, instance, **kwargs):
+    """Garder les valeurs indexées, pour ignorer les enregistrements qui ne les changent pas"""
+    instance._indexed_values = indexed_values(instance)
+
+
+@receiver(post_save, sender=FAQ)
+@receiver(post_save, sender=Resource)
+def chatbot_content_saved(sender, instance, created, update_fields=None, **kwargs):
+    """Mettre à jour l'index de recherche après la modification d'une FAQ ou ressource"""
+    if not created:
+        if update_fields is not None and not set(update_fields) & set(INDEXED_FIELDS[instance._meta.model_name]):
+            return
+        if indexed_values(instance) == instance._indexed_values:
+            return
+    instance._indexed_values = indexed_values(instance)
+    content_changed(instance)
+
+
+@receiver(post_delete, sender=FAQ)
+@receiver(post_delete, sender=Resource)
+def chatbot_content_deleted(sender, instance, **kwargs):
+    content_changed(instance, deleted=True)
@@ -95,11 +95,25 @@ class ChatbotMRE {
         this.showTyping();
 
         try {
-            const response = await this.callGeminiAPI(message);
-            this.hideTyping();
-            this.addBotMessage(response);
+            // Réponse en streaming si disponible, sinon réponse JSON complète
+            const messageElement = await this.streamBotResponse(message).catch(error => {
+                // Inutile de réessayer avec l'API classique si la limite est atteinte ; une fois
+                // le flux commencé, le message est déjà enregistré et ne doit pas être renvoyé
+                if (error.rateLimited || error.streamStarted) throw error;
+                console.warn('Streaming indisponible, utilisation de l\'API classique:', error);
+                return null;
+            });
+            if (messageElement) {
+                this.finishBotMessage(messageElement);
+            } else {
+                const response = await this.callGeminiAPI(message);
+                this.hideTyping();
+                this.addBotMessage(response);
+            }
         } catch (error) {
             this.hideTyping();
+            // Garder la partie de la réponse déjà affichée
+            if (error.partialMessage) this.finishBotMessage(error.partialMessage);
             this.addErrorMessage(error.message);
         }
     }
@@ -110,15 +124,17 @@ class ChatbotMRE {
         this.scrollToBottom();
     }    addBotMessage(message) {
         const messageElement = this.createMessageElement(message, 'bot');
-        
+        this.chatbotMessages.appendChild(messageElement);
+        this.scrollToBottom();
+        this.finishBotMessage(messageElement);
+    }
+
+    finishBotMessage(messageElement) {
         // Ajouter l'ID du message pour le feedback
         if (this.lastMessageId) {
             messageElement.dataset.messageId = this.lastMessageId;
         }
-        
-        this.chatbotMessages.appendChild(messageElement);
-        this.scrollToBottom();
-        
+
         // Ajouter les boutons de feedback après un délai
         setTimeout(() => {
             this.addFeedbackButtons(messageElement);
@@ -246,7 +262,114 @@ class ChatbotMRE {
         setTimeout(() => {
             this.chatbotMessages.scrollTop = this.chatbotMessages.scrollHeight;
         }, 100);
-    }    async callGeminiAPI(userMessage) {
+    }
+
+    async streamBotResponse(userMessage) {
+        // Lire la réponse en Server-Sent Events et l'afficher au fil de l'eau
+        if (!window.chatbotStreamUrl || !window.ReadableStream || !window.TextDecoder) {
+            return null;
+        }
+
+        const response = await fetch(window.chatbotStreamUrl, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'Accept': 'text/event-stream',
+                'X-CSRFToken': this.getCSRFToken(),
+            },
+            body: JSON.stringify({
+                message: userMessage,
+                session_id: this.sessionId
+            })
+        });
+
+        if (response.status === 429) {
+            const errorData = await response.json().catch(() => null);
+            const error = new Error(errorData?.error || 'Trop de requêtes. Veuillez réessayer dans quelques instants.');
+            error.rateLimited = true;
+            throw error;
+        }
+
+        if (!response.ok || !response.body) {
+            throw new Error(`Erreur serveur (${response.status})`);
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let text = '';
+        let messageElement = null;
+        let finished = false;
+        this.lastMessageId = null;
+
+        const interrupted = (message) => {
+            const error = new Error(message);
+            error.streamStarted = true;
+            error.partialMessage = messageElement;
+            return error;
+        };
+
+        while (true) {
+            let chunk;
+            try {
+                chunk = await reader.read();
+            } catch (e) {
+                throw interrupted('La réponse a été interrompue. Veuillez réessayer.');
+            }
+            const { value, done } = chunk;
+            if (done) break;
+
+            buffer += decoder.decode(value, { stream: true });
+            const blocks = buffer.split('\n\n');
+            buffer = blocks.pop();
+
+            for (const block of blocks) {
+                const event = this.parseSSEEvent(block);
+                if (!event) continue;
+
+                if (event.name === 'meta') {
+                    this.sessionId = event.data.session_id;
+                } else if (event.name === 'delta') {
+                    text += event.data.text;
+                    if (!messageElement) {
+                        this.hideTyping();
+                        messageElement = this.createMessageElement(text, 'bot');
+                        this.chatbotMessages.appendChild(messageElement);
+                    } else {
+                        messageElement.querySelector('.message-content').innerHTML = this.processMessageContent(text, 'bot');
+                    }
+                    this.scrollToBottom();
+                } else if (event.name === 'done') {
+                    this.lastMessageId = event.data.message_id;
+                    finished = true;
+                }
+            }
+        }
+
+        if (!finished || !messageElement) {
+            throw interrupted(messageElement
+                ? 'La réponse a été interrompue. Veuillez réessayer.'
+                : 'Aucune réponse reçue. Veuillez réessayer.');
+        }
+        return messageElement;
+    }
+
+    parseSSEEvent(block) {
+        let name = 'message';
+        let data = '';
+        for (const line of block.split('\n')) {
+            if (line.startsWith('event:')) name = line.slice(6).trim();
+            else if (line.startsWith('data:')) data += line.slice(5).trim();
+        }
+        if (!data) return null;
+        try {
+            return { name, data: JSON.parse(data) };
+        } catch (e) {
+            return null;
+        }
+    }
+
+    async callGeminiAPI(userMessage) {
         // Utiliser l'API Django au lieu d'appeler directement Gemini
         const apiUrl = window.chatbotApiUrl || '/chatbot/api/chat/';
         
@@ -354,7 +477,8 @@ class ChatbotMRE {
                 },
                 body: JSON.stringify({
                     message_id: messageId,
-                    feedback_type: feedbackType
+                    feedback_type: feedbackType,
+                    session_id: this.sessionId
                 })
             });
 
@@ -1,7 +1,36 @@
-from django.test import TestCase, Client
+import asyncio
+import gzip
+import csv
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.test import TestCase, SimpleTestCase, Client, AsyncClient, RequestFactory, override_settings
+from django.contrib.auth.models import AnonymousUser
 from django.urls import reverse
 from django.contrib.auth import get_user_model
-from chatbot.models import ChatMessage, ChatAnalytics
+from django.db.models import F
+from django.utils import timezone
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.signals import request_finished
+from chatbot.models import ChatMessage, ChatAnalytics, ChatSession, ChatbotConfiguration, ChatFeedback, ChatRollupWatermark
+from chatbot.config import CONFIG_VERSION_KEY, invalidate_config
+from chatbot import retrieval, session_state
+from chatbot.retrieval import BM25Index, tokenize
+from resources.models import FAQ, Resource
+from servicesbladi.ratelimit import TokenBucketLimiter, client_ip, parse_rate
+from chatbot.analytics import AnalyticsCounterBuffer, analytics_counters, rollup_analytics
+from chatbot.retention import RetentionEngine
+from chatbot.export import iter_export
+from chatbot.keyword_matcher import KeywordMatcher, get_domain_matcher, get_fallback_matcher
+from chatbot.llm_client import CircuitBreaker, LatencyHistogram, LLMClient, LLMClientError, LLMCircuitOpenError, LLMOverloadedError, get_client, parse_sse_line
+from chatbot.views import ChatAPIView, ChatFeedbackView
 
 User = get_user_model()
 
@@ -66,3 +95,949 @@ class ChatbotViewTest(TestCase):
         self.client.login(email='test@example.com', password='testpass123')
         response = self.client.get(reverse('chatbot:chat'))
         self.assertEqual(response.status_code, 200)
+
+
+class KeywordMatcherTest(SimpleTestCase):
+    """Test the compiled keyword matcher used for domain classification"""
+    
+    # (message, domaine attendu)
+    CORPUS = [
+        ('Comment déclarer mes impôts au Maroc ?', 'fiscalite'),
+        ('Quelle est la convention fiscale entre la France et le Maroc ?', 'fiscalite'),
+        ('Je paie la TVA sur mes factures', 'fiscalite'),
+        ("Est-ce que l'IR s'applique à mes revenus locatifs ?", 'fiscalite'),
+        ('Je veux acheter un appartement à Casablanca', 'immobilier'),
+        ('Vente de terrain à Agadir', 'immobilier'),
+        ("Conseils pour l'investissement immobilier", 'immobilier'),
+        ('Comment investir en bourse depuis l’étranger ?', 'investissement'),
+        ('Quels OPCVM choisir pour un placement ?', 'investissement'),
+        ('Renouvellement de passeport au consulat', 'administration'),
+        ("Acte d'état civil pour mon enfant", 'administration'),
+        ('ETAT CIVIL et carte nationale', 'administration'),
+        ('Je cherche une formation certifiante', 'formation'),
+        ('Reconnaissance de mon diplôme', 'formation'),
+        ('Bonjour, ceci est un test', 'other'),
+        ('Il fait beau aujourd’hui', 'other'),
+        ('Quel est votre avis ?', 'other'),
+        ('Mission impossible', 'other'),
+    ]
+    
+    def test_domain_accuracy_on_corpus(self):
+        """Every message in the corpus is classified into its expected domain"""
+        matcher = get_domain_matcher()
+        for message, expected in self.CORPUS:
+            with self.subTest(message=message):
+                self.assertEqual(matcher.best_match(message, default='other'), expected)
+    
+    def test_short_keywords_need_word_boundaries(self):
+        """'ir' and 'is' no longer match inside other words"""
+        matcher = KeywordMatcher({'fiscalite': ['ir', 'is']})
+        self.assertEqual(matcher.scores('Je voudrais visiter Marrakech'), {})
+        self.assertEqual(matcher.scores("L'IS et l'IR"), {'fiscalite': 2})
+    
+    def test_accents_plurals_and_prefixes(self):
+        """Matching folds accents, accepts plurals and honours prefix keywords"""
+        matcher = KeywordMatcher({'fiscalite': ['impôt', 'fiscal*'], 'administration': ['état civil']})
+        self.assertEqual(matcher.scores('IMPOTS et fiscalité'), {'fiscalite': 2})
+        self.assertEqual(matcher.scores('Etat   civil'), {'administration': 1})
+        self.assertEqual(matcher.scores('état des lieux'), {})
+    
+    def test_fallback_intent_priority(self):
+        """Fallback intents keep the priority order of the keyword table"""
+        matcher = get_fallback_matcher()
+        self.assertEqual(matcher.first_match('Bonjour, quels sont vos tarifs ?'), 'greeting')
+        self.assertEqual(matcher.first_match('Quels sont vos tarifs ?'), 'pricing')
+        self.assertIsNone(matcher.first_match('Quelle heure est-il ?'))
+
+
+class AnalyticsCounterBufferTest(TestCase):
+    """Test the buffered ChatAnalytics counters"""
+    
+    def setUp(self):
+        self.buffer = AnalyticsCounterBuffer(flush_interval=3600)
+        self.today = timezone.now().date()
+    
+    def test_increments_are_buffered_until_flush(self):
+        """Messages are counted in memory and written in one flush"""
+        self.buffer.record_message('fiscalite')
+        self.buffer.record_message('other')
+        self.buffer.increment('failed_responses')
+        self.assertFalse(ChatAnalytics.objects.exists())
+        
+        self.buffer.flush()
+        analytics = ChatAnalytics.objects.get(date=self.today)
+        self.assertEqual(analytics.total_messages, 2)
+        self.assertEqual(analytics.fiscalite_questions, 1)
+        self.assertEqual(analytics.off_topic_questions, 1)
+        self.assertEqual(analytics.failed_responses, 1)
+        self.assertEqual(self.buffer.pending(), {})
+    
+    def test_flush_adds_to_existing_row(self):
+        """Flushes are additive UPDATEs and never overwrite other writers"""
+        ChatAnalytics.objects.create(date=self.today, total_messages=10)
+        self.buffer.record_message('immobilier')
+        self.buffer.flush()
+        # Un autre processus a écrit entre-temps
+        ChatAnalytics.objects.filter(date=self.today).update(total_messages=F('total_messages') + 5)
+        self.buffer.record_message('immobilier')
+        self.buffer.flush()
+        
+        analytics = ChatAnalytics.objects.get(date=self.today)
+        self.assertEqual(analytics.total_messages, 17)
+        self.assertEqual(analytics.immobilier_questions, 2)
+    
+    def test_concurrent_increments_are_exact(self):
+        """Increments from many threads are not lost"""
+        def worker():
+            for _ in range(500):
+                self.buffer.increment('total_messages', date=self.today)
+        
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(self.buffer.pending(), {(self.today, 'total_messages'): 4000})
+        with self.assertNumQueries(4):  # savepoint, création ignorée si existante, UPDATE, release
+            self.buffer.flush()
+        self.assertEqual(ChatAnalytics.objects.get(date=self.today).total_messages, 4000)
+
+
+    def test_flushed_at_the_end_of_a_request_once_due(self):
+        """An idle worker does not keep its counts until the next message"""
+        analytics_counters.flush()
+        with override_settings(CHATBOT_ANALYTICS_FLUSH_SECONDS=3600):
+            analytics_counters.record_message('fiscalite')
+            request_finished.send(sender=self.__class__)
+            self.assertFalse(ChatAnalytics.objects.exists())
+        with override_settings(CHATBOT_ANALYTICS_FLUSH_SECONDS=0):
+            request_finished.send(sender=self.__class__)
+        self.assertEqual(ChatAnalytics.objects.get(date=self.today).total_messages, 1)
+
+
+class FakeAzureHandler(BaseHTTPRequestHandler):
+    """Faux déploiement Azure OpenAI qui répond en streaming SSE"""
+    fragments = ['Bonjour', ', je suis', ' votre assistant.']
+    status = 200
+    delay = 0
+    requests = []
+
+    def do_POST(self):
+        length = int(self.headers['Content-Length'])
+        payload = json.loads(self.rfile.read(length))
+        FakeAzureHandler.requests.append((self.path, self.headers['api-key'], payload))
+        time.sleep(self.delay)
+
+        if self.status != 200 or not payload.get('stream'):
+            body = json.dumps({'choices': [{'message': {'content': ''.join(self.fragments)}}]}).encode()
+            self.send_response(self.status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.end_headers()
+        for fragment in self.fragments:
+            chunk = {'choices': [{'index': 0, 'delta': {'content': fragment}}]}
+            self.wfile.write(f'data: {json.dumps(chunk)}\n\n'.encode())
+            self.wfile.flush()
+        self.wfile.write(b'data: [DONE]\n\n')
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeAzureServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # Le client peut couper la connexion (délai dépassé) : rien à signaler
+        pass
+
+
+def parse_events(body):
+    """Découper un corps SSE en liste de (événement, données)"""
+    events = []
+    for block in body.strip().split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in block.split('\n'))
+        events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+
+class ChatStreamViewTest(TestCase):
+    """Test the SSE streaming chat endpoint"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = FakeAzureServer(('127.0.0.1', 0), FakeAzureHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.endpoint = f'http://127.0.0.1:{cls.server.server_port}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        FakeAzureHandler.requests.clear()
+        get_client.cache_clear()
+
+    def tearDown(self):
+        # Écrire les compteurs dans la base de test plutôt qu'à la sortie du processus
+        analytics_counters.flush()
+
+    async def post_stream(self, message):
+        response = await AsyncClient().post(
+            reverse('chatbot:chat_stream_api'),
+            data=json.dumps({'message': message}),
+            content_type='application/json',
+        )
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        return parse_events(body)
+
+    def test_parse_sse_line(self):
+        self.assertEqual(parse_sse_line('data: {"choices": [{"delta": {"content": "abc"}}]}'), 'abc')
+        self.assertIsNone(parse_sse_line('data: {"choices": [{"delta": {"role": "assistant"}}]}'))
+        self.assertIsNone(parse_sse_line('data: [DONE]'))
+        self.assertIsNone(parse_sse_line(': keep-alive'))
+
+    async def test_streams_llm_fragments_and_saves_message(self):
+        with override_settings(AZURE_OPENAI_ENDPOINT=self.endpoint, AZURE_OPENAI_API_KEY='test-key',
+                               AZURE_OPENAI_MODEL='gpt-4o'):
+            events = await self.post_stream('Comment déclarer mes impôts ?')
+
+        self.assertEqual([name for name, _ in events], ['meta', 'delta', 'delta', 'delta', 'done'])
+        self.assertEqual(''.join(data['text'] for name, data in events if name == 'delta'),
+                         'Bonjour, je suis votre assistant.')
+
+        path, api_key, payload = FakeAzureHandler.requests[0]
+        self.assertTrue(path.startswith('/openai/deployments/gpt-4o/chat/completions'))
+        self.assertEqual(api_key, 'test-key')
+        self.assertTrue(payload['stream'])
+
+        bot_msg = await ChatMessage.objects.aget(id=events[-1][1]['message_id'])
+        self.assertEqual(bot_msg.content, 'Bonjour, je suis votre assistant.')
+        self.assertEqual(bot_msg.domain_category, 'fiscalite')
+        session = await ChatSession.objects.aget(session_id=events[0][1]['session_id'])
+        self.assertEqual(await session.messages.acount(), 2)
+
+    @override_settings(AZURE_OPENAI_ENDPOINT='', AZURE_OPENAI_API_KEY='')
+    async def test_streams_local_fallback_without_llm(self):
+        events = await self.post_stream('Bonjour')
+
+        text = ''.join(data['text'] for name, data in events if name == 'delta')
+        self.assertIn('ServicesBLADI', text)
+        bot_msg = await ChatMessage.objects.aget(id=events[-1][1]['message_id'])
+        self.assertEqual(bot_msg.content, text)
+        self.assertEqual(bot_msg.api_model_used, 'local-fallback')
+
+
+class CircuitBreakerTest(SimpleTestCase):
+    """Test the circuit breaker and latency histogram"""
+
+    def test_opens_after_threshold_and_recovers_after_trial(self):
+        now = [0.0]
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=lambda: now[0])
+
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow())
+
+        now[0] = 10
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())  # un seul appel d'essai
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        now[0] = 20
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_histogram_buckets(self):
+        histogram = LatencyHistogram(buckets=(100, 1000))
+        for duration_ms in (50, 100, 400, 5000):
+            histogram.observe(duration_ms)
+        snapshot = histogram.snapshot()
+        self.assertEqual(snapshot['buckets'], [('<= 100 ms', 2), ('<= 1000 ms', 1), ('+inf', 1)])
+        self.assertEqual(snapshot['count'], 4)
+        self.assertEqual(snapshot['avg_ms'], 1387.5)
+
+
+class LLMClientTest(TestCase):
+    """Test the pooled LLM client against a local fake Azure server"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = FakeAzureServer(('127.0.0.1', 0), FakeAzureHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.settings_override = override_settings(
+            AZURE_OPENAI_ENDPOINT=f'http://127.0.0.1:{cls.server.server_port}',
+            AZURE_OPENAI_API_KEY='test-key',
+        )
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        FakeAzureHandler.requests.clear()
+        get_client.cache_clear()
+
+    def tearDown(self):
+        FakeAzureHandler.status = 200
+        FakeAzureHandler.delay = 0
+        analytics_counters.flush()
+
+    def messages(self):
+        return [{'role': 'user', 'content': 'Bonjour'}]
+
+    def test_complete_reuses_pooled_connection(self):
+        client = LLMClient()
+        self.assertEqual(client.complete(self.messages()), 'Bonjour, je suis votre assistant.')
+        self.assertEqual(client.complete(self.messages()), 'Bonjour, je suis votre assistant.')
+        self.assertIs(client._get_client(), client._client)
+        self.assertEqual(client.stats()['success_latency']['count'], 2)
+        self.assertFalse(FakeAzureHandler.requests[0][2]['stream'])
+
+    def test_deadline_is_enforced(self):
+        FakeAzureHandler.delay = 0.5
+        client = LLMClient()
+        with self.assertRaises(LLMClientError):
+            client.complete(self.messages(), timeout=0.1)
+        self.assertEqual(client.stats()['failure_latency']['count'], 1)
+
+    def test_concurrency_is_bounded(self):
+        client = LLMClient(max_concurrency=1)
+        self.assertTrue(client._slots.acquire(blocking=False))
+        with self.assertRaises(LLMOverloadedError):
+            client.complete(self.messages())
+        client._slots.release()
+        self.assertEqual(FakeAzureHandler.requests, [])
+
+    def test_breaker_trips_to_local_fallback(self):
+        FakeAzureHandler.status = 500
+        with override_settings(CHATBOT_LLM_BREAKER_THRESHOLD=2):
+            view = ChatAPIView()
+            session = ChatSession.objects.create(session_id='breaker-test')
+            responses = [view.get_azure_response(f'Bonjour {index}', session) for index in range(3)]
+
+        # Deux appels en échec, puis le disjoncteur coupe sans appeler le serveur
+        self.assertEqual(len(FakeAzureHandler.requests), 2)
+        self.assertEqual(get_client().breaker.state, CircuitBreaker.OPEN)
+        for response in responses:
+            self.assertIn('ServicesBLADI', str(response))
+        with self.assertRaises(LLMCircuitOpenError):
+            get_client().complete(self.messages())
+
+    def test_stream_pools_connections_across_event_loops(self):
+        client = LLMClient()
+
+        async def collect():
+            return [text async for text in client.stream(self.messages())]
+
+        # Sous WSGI, chaque requête a sa propre boucle d'événements
+        self.assertEqual(''.join(asyncio.run(collect())), 'Bonjour, je suis votre assistant.')
+        async_client = client._async_client
+        self.assertEqual(''.join(asyncio.run(collect())), 'Bonjour, je suis votre assistant.')
+        self.assertIs(client._async_client, async_client)
+        self.assertEqual(client.stats()['success_latency']['count'], 2)
+        self.assertTrue(client._slots.acquire(blocking=False))
+
+    def test_abandoned_stream_releases_breaker_trial(self):
+        now = [0.0]
+        client = LLMClient(max_concurrency=1, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=10,
+                                                                     clock=lambda: now[0]))
+        client.breaker.record_failure()
+        now[0] = 10
+
+        async def read_first_fragment():
+            fragments = client.stream(self.messages())
+            await anext(fragments)
+            await fragments.aclose()  # Le client HTTP s'est déconnecté
+
+        asyncio.run(read_first_fragment())
+        self.assertEqual(client.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(client.breaker.allow())
+        self.assertTrue(client._slots.acquire(blocking=False))
+
+
+class ChatbotConfigurationCacheTest(TestCase):
+    """Test the in-process ChatbotConfiguration snapshot"""
+
+    def setUp(self):
+        cache.clear()
+        invalidate_config()
+        ChatbotConfiguration.set_value('max_messages_per_session', '50')
+
+    def test_reads_hit_the_snapshot(self):
+        self.assertEqual(ChatbotConfiguration.get_value('max_messages_per_session'), '50')
+        with self.assertNumQueries(0):
+            for _ in range(10):
+                self.assertEqual(ChatbotConfiguration.get_value('max_messages_per_session'), '50')
+                self.assertEqual(ChatbotConfiguration.get_value('missing', 'default'), 'default')
+
+    def test_save_and_delete_invalidate(self):
+        self.assertEqual(ChatbotConfiguration.get_value('max_messages_per_session'), '50')
+        ChatbotConfiguration.set_value('max_messages_per_session', '80')
+        self.assertEqual(ChatbotConfiguration.get_value('max_messages_per_session'), '80')
+
+        ChatbotConfiguration.objects.get(key='max_messages_per_session').delete()
+        self.assertIsNone(ChatbotConfiguration.get_value('max_messages_per_session'))
+
+    def test_inactive_values_are_ignored(self):
+        config = ChatbotConfiguration.objects.get(key='max_messages_per_session')
+        config.is_active = False
+        config.save()
+        self.assertEqual(ChatbotConfiguration.get_value('max_messages_per_session', '20'), '20')
+
+    def test_version_key_propagates_changes_from_other_processes(self):
+        self.assertEqual(ChatbotConfiguration.get_value('max_messages_per_session'), '50')
+        # Modification faite par un autre processus : pas de signal ici
+        ChatbotConfiguration.objects.filter(key='max_messages_per_session').update(value='99')
+
+        with override_settings(CHATBOT_CONFIG_CHECK_SECONDS=0):
+            self.assertEqual(ChatbotConfiguration.get_value('max_messages_per_session'), '50')
+            cache.set(CONFIG_VERSION_KEY, 'changed-elsewhere')
+            self.assertEqual(ChatbotConfiguration.get_value('max_messages_per_session'), '99')
+
+    def test_version_is_bumped_on_commit(self):
+        ChatbotConfiguration.get_value('max_messages_per_session')
+        version = cache.get(CONFIG_VERSION_KEY)
+        with self.captureOnCommitCallbacks(execute=True):
+            ChatbotConfiguration.set_value('max_messages_per_session', '60')
+        self.assertNotEqual(cache.get(CONFIG_VERSION_KEY), version)
+
+
+@override_settings(AZURE_OPENAI_ENDPOINT='', AZURE_OPENAI_API_KEY='', CHATBOT_ANALYTICS_FLUSH_SECONDS=3600)
+class ChatSessionStateTest(TestCase):
+    """Test the cached chat session state used by ChatAPIView"""
+
+    def setUp(self):
+        cache.clear()
+        invalidate_config()
+        retrieval._engine = None
+        retrieval.get_engine()
+        self.view = ChatAPIView.as_view()
+
+    def tearDown(self):
+        analytics_counters.flush()
+
+    def post(self, message, session_id=None):
+        request = RequestFactory().post(
+            '/chatbot/api/chat/',
+            data=json.dumps({'message': message, 'session_id': session_id}),
+            content_type='application/json',
+        )
+        request.user = AnonymousUser()
+        return json.loads(self.view(request).content)
+
+    def test_chat_turn_only_writes_messages(self):
+        session_id = self.post('Bonjour')['session_id']
+        with self.assertNumQueries(2):
+            data = self.post('Quels services proposez-vous ?', session_id)
+        self.assertEqual(data['session_id'], session_id)
+        self.assertEqual(ChatMessage.objects.filter(session__session_id=session_id).count(), 4)
+
+    def test_touch_is_throttled(self):
+        session_id = self.post('Bonjour')['session_id']
+        cache.delete(session_state.TOUCH_KEY.format(session_id))
+        view = ChatAPIView()
+
+        with self.assertNumQueries(1) as context:
+            session = view.get_or_create_session(None, session_id)
+        self.assertIn('"updated_at"', context.captured_queries[0]['sql'])
+        self.assertNotIn('"user_agent"', context.captured_queries[0]['sql'])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(view.get_or_create_session(None, session_id).pk, session.pk)
+
+    def test_session_limit_uses_cached_count(self):
+        ChatbotConfiguration.set_value('max_messages_per_session', '2')
+        session_id = self.post('Bonjour')['session_id']
+        self.post('Merci', session_id)
+
+        with self.assertNumQueries(0):
+            data = self.post('Encore une question', session_id)
+        self.assertTrue(data['limit_reached'])
+        self.assertIsNone(data['message_id'])
+        self.assertEqual(ChatMessage.objects.filter(session__session_id=session_id, message_type='user').count(), 2)
+
+    def test_window_is_rebuilt_after_cache_loss(self):
+        session_id = self.post('Bonjour')['session_id']
+        self.post('Bonjour', session_id)
+        cache.clear()
+
+        session = ChatSession.objects.get(session_id=session_id)
+        window = session_state.get_message_window(session)
+        self.assertEqual(window['count'], 2)
+        self.assertTrue(ChatAPIView().is_question_repeated('bonjour', session))
+
+    def test_concurrent_messages_are_all_counted(self):
+        session_id = self.post('Bonjour')['session_id']
+        session = ChatSession.objects.get(session_id=session_id)
+        message = ChatMessage.objects.filter(session=session, message_type='user').first()
+        barrier = threading.Barrier(10)
+
+        def record():
+            barrier.wait()
+            session_state.record_user_message(session, message)
+
+        threads = [threading.Thread(target=record) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(session_state.get_message_window(session)['count'], 11)
+
+    def test_deactivated_session_is_not_served_from_cache(self):
+        session_id = self.post('Bonjour')['session_id']
+        session = ChatSession.objects.get(session_id=session_id)
+        session.is_active = False
+        session.save()
+
+        self.assertIsNone(session_state.get_active_session(session_id))
+        self.assertNotEqual(self.post('Bonjour', session_id)['session_id'], session_id)
+
+
+class BM25IndexTest(SimpleTestCase):
+    """Test the BM25 inverted index"""
+
+    def setUp(self):
+        self.index = BM25Index()
+        self.index.add('impots', tokenize('Déclarer ses impôts au Maroc quand on réside en France'), 'impots')
+        self.index.add('passeport', tokenize('Renouveler son passeport au consulat'), 'passeport')
+        self.index.add('terrain', tokenize('Acheter un terrain au Maroc depuis la France'), 'terrain')
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize('Quels impôts pour les MRE ?'), ['impot', 'mre'])
+
+    def test_ranking_and_coverage(self):
+        results = self.index.search(tokenize('Comment déclarer mes impôts ?'))
+        self.assertEqual(results[0][2], 'impots')
+        self.assertEqual(results[0][1], 1.0)
+        self.assertEqual(len(results), 1)
+
+        results = self.index.search(tokenize('terrain au Maroc'))
+        self.assertEqual([payload for _, _, payload in results], ['terrain', 'impots'])
+        self.assertEqual(results[1][1], 0.5)
+
+    def test_replace_and_remove(self):
+        self.index.add('passeport', tokenize('Carte consulaire'), 'passeport')
+        self.assertEqual(self.index.search(tokenize('passeport')), [])
+        self.index.remove('terrain')
+        self.index.remove('terrain')
+        self.assertEqual(len(self.index), 2)
+        self.assertEqual(self.index.search(tokenize('terrain')), [])
+
+
+class RetrievalEngineTest(TestCase):
+    """Test the FAQ / Resource retrieval engine and grounded fallback answers"""
+
+    def setUp(self):
+        cache.clear()
+        retrieval._engine = None
+        self.faq = FAQ.objects.create(
+            question='Comment déclarer mes revenus locatifs au Maroc ?',
+            answer='Les revenus locatifs se déclarent auprès de la DGI avant fin février.',
+            language='fr',
+        )
+        FAQ.objects.create(question='How do I renew my passport?', answer='Book an appointment at the consulate.', language='en')
+        Resource.objects.create(
+            category='fiscal', title='Guide fiscal des MRE',
+            description='Revenus locatifs, conventions fiscales et déclaration au Maroc.',
+            available_languages='fr,en',
+        )
+
+    def test_search_per_language(self):
+        results = retrieval.search('déclarer revenus locatifs', 'fr')
+        self.assertEqual(results[0][2]['id'], self.faq.pk)
+        self.assertEqual({payload['type'] for _, _, payload in results}, {'faq', 'resource'})
+
+        results = retrieval.search('renew passport', 'en')
+        self.assertEqual(results[0][2]['title'], 'How do I renew my passport?')
+        # Langue sans index : repli sur le français
+        self.assertEqual(retrieval.search('revenus locatifs', 'ar')[0][2]['id'], self.faq.pk)
+
+    def test_index_follows_changes_without_rebuild(self):
+        retrieval.get_engine()
+        self.faq.question = 'Comment payer la taxe d\'habitation ?'
+        self.faq.answer = 'Auprès de la commune.'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.faq.save()
+            # Pas avant la validation de la transaction
+            self.assertEqual(retrieval.search('taxe habitation', 'fr'), [])
+
+        with self.assertNumQueries(0):
+            results = retrieval.search('taxe habitation', 'fr')
+        self.assertEqual(results[0][2]['id'], self.faq.pk)
+
+        self.faq.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.faq.save()
+        self.assertEqual(retrieval.search('taxe habitation', 'fr'), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.faq.delete()
+        self.assertEqual([payload['type'] for _, _, payload in retrieval.search('revenus locatifs', 'fr')], ['resource'])
+
+    def test_saves_without_indexed_changes_keep_the_index(self):
+        resource = Resource.objects.get()
+        with self.captureOnCommitCallbacks() as callbacks:
+            resource.view_count += 1
+            resource.save()
+            resource.download_count += 1
+            resource.save(update_fields=['download_count'])
+            Resource.objects.get(pk=resource.pk).save()
+        self.assertEqual(callbacks, [])
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            resource.title = 'Guide fiscal 2026'
+            resource.save()
+            resource.save()
+        self.assertEqual(len(callbacks), 1)
+
+    def test_other_processes_rebuild_on_version_change(self):
+        engine = retrieval.get_engine()
+        with self.captureOnCommitCallbacks(execute=True):
+            FAQ.objects.filter(pk=self.faq.pk).update(question='Question modifiée ailleurs')
+            retrieval.content_changed(self.faq)
+        # Un autre processus a encore l'ancienne version
+        engine.version = 'ancienne'
+        with override_settings(CHATBOT_RETRIEVAL_CHECK_SECONDS=0):
+            self.assertIsNot(retrieval.get_engine(), engine)
+
+    def test_change_published_elsewhere_is_not_skipped(self):
+        engine = retrieval.get_engine()
+        # Un autre processus a modifié une ressource, pas encore reprise ici
+        Resource.objects.filter(title='Guide fiscal des MRE').update(title='Guide des conventions fiscales')
+        cache.incr(retrieval.INDEX_VERSION_KEY)
+
+        self.faq.answer = 'Auprès de la DGI.'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.faq.save()
+        self.assertIsNot(retrieval.get_engine(), engine)
+        self.assertEqual(retrieval.search('conventions', 'fr')[0][2]['title'], 'Guide des conventions fiscales')
+
+    def test_fallback_answers_from_faq(self):
+        response = ChatAPIView().get_intelligent_fallback_response('Comment déclarer mes revenus locatifs ?')
+        self.assertIn('DGI', response)
+        self.assertIn('Guide fiscal des MRE', response)
+
+        # Les salutations gardent leur réponse dédiée
+        self.assertIn('assistant virtuel', str(ChatAPIView().get_intelligent_fallback_response('Bonjour')))
+
+
+class TokenBucketLimiterTest(SimpleTestCase):
+    """Test the cache-backed token bucket"""
+
+    def setUp(self):
+        cache.clear()
+        self.now = [1000.0]
+        self.limiter = TokenBucketLimiter('test', capacity=2, period=10, clock=lambda: self.now[0])
+
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate('10/60'), (10, 60.0))
+        self.assertIsNone(parse_rate('dix/minute'))
+        self.assertEqual(parse_rate('0/60', (5, 60)), (5, 60))
+
+    def test_bucket_empties_and_refills(self):
+        self.assertEqual(self.limiter.hit(['ip:1']), (True, 0.0))
+        self.assertEqual(self.limiter.hit(['ip:1']), (True, 0.0))
+        allowed, retry_after = self.limiter.hit(['ip:1'])
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(retry_after, 5.0)
+
+        self.now[0] += 5
+        self.assertTrue(self.limiter.hit(['ip:1'])[0])
+        self.assertFalse(self.limiter.hit(['ip:1'])[0])
+
+    def test_all_buckets_must_have_tokens(self):
+        self.limiter.hit(['ip:1', 'session:a'])
+        self.limiter.hit(['ip:1', 'session:a'])
+        # Nouvelle IP, même session : refusé, et le seau de la nouvelle IP reste plein
+        self.assertFalse(self.limiter.hit(['ip:2', 'session:a'])[0])
+        self.assertTrue(self.limiter.hit(['ip:2', 'session:b'])[0])
+        self.assertTrue(self.limiter.hit(['ip:2', 'session:c'])[0])
+
+    def test_concurrent_hits_cannot_share_a_token(self):
+        limiter = TokenBucketLimiter('test', capacity=5, period=3600)
+        results = []
+        barrier = threading.Barrier(20)
+
+        def hit():
+            barrier.wait()
+            results.append(limiter.hit(['ip:1'])[0])
+
+        threads = [threading.Thread(target=hit) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results.count(True), 5)
+
+    def test_client_ip_trusts_only_proxy_hops(self):
+        factory = RequestFactory()
+        request = factory.get('/', REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR='6.6.6.6, 203.0.113.7')
+        self.assertEqual(client_ip(request), '10.0.0.1')
+        with override_settings(TRUSTED_PROXY_COUNT=1):
+            # Le client a ajouté 6.6.6.6 ; le proxy a ajouté l'adresse qu'il a vue
+            self.assertEqual(client_ip(request), '203.0.113.7')
+            self.assertEqual(client_ip(factory.get('/', REMOTE_ADDR='10.0.0.1')), '10.0.0.1')
+
+
+@override_settings(AZURE_OPENAI_ENDPOINT='', AZURE_OPENAI_API_KEY='', CHATBOT_ANALYTICS_FLUSH_SECONDS=3600)
+class ChatRateLimitTest(TestCase):
+    """Test 429 responses on the chatbot endpoints"""
+
+    def setUp(self):
+        cache.clear()
+        invalidate_config()
+        ChatbotConfiguration.set_value('rate_limit_chat', '2/60')
+        ChatbotConfiguration.set_value('rate_limit_feedback', '1/60')
+
+    def tearDown(self):
+        analytics_counters.flush()
+
+    def post(self, view, data, ip='10.0.0.1'):
+        request = RequestFactory().post('/', data=json.dumps(data), content_type='application/json', REMOTE_ADDR=ip)
+        request.user = AnonymousUser()
+        return view.as_view()(request)
+
+    def test_chat_returns_429_with_retry_after(self):
+        session_id = json.loads(self.post(ChatAPIView, {'message': 'Bonjour'}).content)['session_id']
+        self.assertEqual(self.post(ChatAPIView, {'message': 'Merci', 'session_id': session_id}).status_code, 200)
+
+        response = self.post(ChatAPIView, {'message': 'Encore', 'session_id': session_id})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertEqual(ChatMessage.objects.filter(message_type='user').count(), 2)
+
+        # Le seau de la session (un seul message jusqu'ici) limite aussi les autres IP
+        self.assertEqual(self.post(ChatAPIView, {'message': 'Encore', 'session_id': session_id}, ip='10.0.0.2').status_code, 200)
+        self.assertEqual(self.post(ChatAPIView, {'message': 'Encore', 'session_id': session_id}, ip='10.0.0.2').status_code, 429)
+        self.assertEqual(self.post(ChatAPIView, {'message': 'Bonjour'}, ip='10.0.0.2').status_code, 200)
+
+    def test_limits_are_per_endpoint_and_configurable(self):
+        self.post(ChatAPIView, {'message': 'Bonjour'})
+        self.post(ChatAPIView, {'message': 'Bonjour'})
+        data = {'message_id': 999999, 'feedback_type': 'helpful'}
+        self.assertEqual(self.post(ChatFeedbackView, data).status_code, 404)
+        self.assertEqual(self.post(ChatFeedbackView, data).status_code, 429)
+
+        ChatbotConfiguration.set_value('rate_limit_chat', 'off')
+        self.assertEqual(self.post(ChatAPIView, {'message': 'Bonjour'}).status_code, 200)
+
+
+class ChatAnalyticsRollupTest(TestCase):
+    """Test the watermark-based ChatAnalytics rollup"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='rollup@example.com', password='testpass123')
+        self.today = timezone.now().date()
+
+    def add_turn(self, session, response_time_ms, escalated=False, feedback_type=None):
+        ChatMessage.objects.create(session=session, message_type='user', content='Question', is_escalated=escalated)
+        bot_msg = ChatMessage.objects.create(session=session, message_type='bot', content='Réponse',
+                                             response_time_ms=response_time_ms)
+        if feedback_type:
+            ChatFeedback.objects.create(message=bot_msg, feedback_type=feedback_type)
+
+    def test_rollup_is_incremental(self):
+        user_session = ChatSession.objects.create(session_id='s1', user=self.user, ip_address='10.0.0.1')
+        anonymous = ChatSession.objects.create(session_id='s2', ip_address='10.0.0.2')
+        self.add_turn(user_session, 100, feedback_type='helpful')
+        self.add_turn(anonymous, 300, escalated=True, feedback_type='incorrect')
+
+        self.assertEqual(rollup_analytics(lag_seconds=0), {'sessions': 2, 'messages': 4, 'feedback': 2})
+        row = ChatAnalytics.objects.get(date=self.today)
+        self.assertEqual((row.total_sessions, row.unique_users, row.bot_responses, row.feedback_count), (2, 2, 2, 2))
+        self.assertEqual(row.avg_response_time_ms, 200)
+        self.assertEqual(row.escalation_rate, 0.5)
+        self.assertEqual(row.satisfaction_avg, 3)
+
+        # Deuxième passage : seules les nouvelles lignes sont lues
+        self.assertEqual(rollup_analytics(lag_seconds=0), {})
+        same_ip = ChatSession.objects.create(session_id='s3', ip_address='10.0.0.2')
+        self.add_turn(same_ip, 500, feedback_type='helpful')
+        self.assertEqual(rollup_analytics(lag_seconds=0), {'sessions': 1, 'messages': 2, 'feedback': 1})
+
+        row.refresh_from_db()
+        self.assertEqual((row.total_sessions, row.unique_users, row.bot_responses, row.feedback_count), (3, 2, 3, 3))
+        self.assertEqual(row.bot_messages, 3)
+        self.assertEqual(row.avg_response_time_ms, 300)
+        self.assertAlmostEqual(row.escalation_rate, 1 / 3)
+        self.assertAlmostEqual(row.satisfaction_avg, 11 / 3)
+        self.assertEqual(ChatRollupWatermark.objects.get(source='messages').last_id,
+                         ChatMessage.objects.order_by('-pk').first().pk)
+
+    def test_small_batches_and_rebuild_give_same_totals(self):
+        session = ChatSession.objects.create(session_id='s1', ip_address='10.0.0.1')
+        for response_time_ms in (100, 200, 300, 400):
+            self.add_turn(session, response_time_ms, feedback_type='helpful')
+
+        self.assertEqual(rollup_analytics(batch_size=3, lag_seconds=0)['messages'], 8)
+        row = ChatAnalytics.objects.get(date=self.today)
+        self.assertEqual((row.bot_responses, row.avg_response_time_ms, row.satisfaction_avg), (4, 250, 5))
+
+        call_command('rollup_chat_analytics', '--rebuild', '--lag-seconds=0', stdout=open(os.devnull, 'w'))
+        row.refresh_from_db()
+        self.assertEqual((row.total_sessions, row.bot_responses, row.avg_response_time_ms), (1, 4, 250))
+        self.assertEqual(row.bot_messages, 4)
+
+    def test_recent_rows_wait_for_the_next_run(self):
+        session = ChatSession.objects.create(session_id='s1', ip_address='10.0.0.1')
+        self.add_turn(session, 100)
+        self.assertEqual(rollup_analytics(lag_seconds=60), {})
+        self.assertEqual(rollup_analytics(lag_seconds=0)['messages'], 2)
+
+
+class ChatRetentionTest(TestCase):
+    """Purge des données du chatbot selon leur durée de conservation"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='retention@example.com', password='testpass123')
+        self.old = timezone.now() - timedelta(days=40)
+
+    def add_session(self, session_id, user=None, old=True, feedback_type='helpful'):
+        session = ChatSession.objects.create(session_id=session_id, user=user, ip_address='10.0.0.1', user_agent='Mozilla')
+        ChatMessage.objects.create(session=session, message_type='user', content='Bonjour')
+        bot = ChatMessage.objects.create(session=session, message_type='bot', content='Bonjour, comment puis-je vous aider ?')
+        ChatFeedback.objects.create(message=bot, feedback_type=feedback_type, comment='Merci')
+        if old:
+            ChatSession.objects.filter(pk=session.pk).update(updated_at=self.old)
+            ChatFeedback.objects.filter(message=bot).update(created_at=self.old)
+        return session
+
+    def test_purges_old_anonymous_sessions_only(self):
+        self.add_session('old-1')
+        self.add_session('old-2')
+        self.add_session('recent', old=False)
+        self.add_session('user', user=self.user)
+
+        report = RetentionEngine(chunk_size=1).run()
+
+        self.assertEqual(list(report), ['anonymous_sessions'])
+        result = report['anonymous_sessions']
+        self.assertEqual((result['sessions'], result['messages'], result['feedback']), (2, 4, 2))
+        self.assertGreater(result['bytes'], 0)
+        self.assertEqual(set(ChatSession.objects.values_list('session_id', flat=True)), {'recent', 'user'})
+        self.assertEqual(ChatMessage.objects.count(), 4)
+        self.assertEqual(ChatFeedback.objects.count(), 2)
+
+    def test_dry_run_deletes_nothing(self):
+        self.add_session('old-1')
+        self.add_session('user', user=self.user)
+
+        report = RetentionEngine(policies={'user_sessions': 30}, dry_run=True).run()
+
+        self.assertEqual(report['anonymous_sessions']['sessions'], 1)
+        self.assertEqual(report['user_sessions']['messages'], 2)
+        self.assertEqual(ChatSession.objects.count(), 2)
+        self.assertEqual(ChatFeedback.objects.count(), 2)
+
+    def test_export_before_delete(self):
+        session = self.add_session('old-1')
+        with tempfile.TemporaryDirectory() as export_dir:
+            result = RetentionEngine(export_dir=export_dir).run()['anonymous_sessions']
+            with gzip.open(result['export'], 'rt', encoding='utf-8') as export_file:
+                rows = [json.loads(line) for line in export_file]
+
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['session_id'], session.session_id)
+        self.assertEqual([message['message_type'] for message in rows[0]['messages']], ['user', 'bot'])
+        self.assertEqual(rows[0]['messages'][1]['feedback'][0]['comment'], 'Merci')
+
+    def test_feedback_policy_keeps_sessions(self):
+        self.add_session('user', user=self.user)
+        self.add_session('recent', old=False)
+
+        result = RetentionEngine(policies={'anonymous_sessions': None, 'feedback': 30}).run()['feedback']
+
+        self.assertEqual(result['feedback'], 1)
+        self.assertEqual(ChatSession.objects.count(), 2)
+        self.assertEqual(ChatMessage.objects.count(), 4)
+        self.assertEqual(ChatFeedback.objects.count(), 1)
+
+    def test_unknown_category(self):
+        with self.assertRaises(ValueError):
+            RetentionEngine(policies={'messages': 10})
+
+    def test_command(self):
+        self.add_session('old-1')
+        call_command('purge_chat_data', '--policy', 'anonymous_sessions=30', '--chunk-size', '1',
+                     stdout=open(os.devnull, 'w'))
+        self.assertFalse(ChatSession.objects.exists())
+
+
+class ChatExportTest(TestCase):
+    """Export en flux des conversations"""
+
+    def setUp(self):
+        self.staff = User.objects.create_user(email='staff@example.com', password='testpass123', is_staff=True)
+        self.user = User.objects.create_user(email='user@example.com', password='testpass123')
+        self.session = ChatSession.objects.create(session_id='s1', ip_address='10.0.0.1')
+        for index in range(5):
+            ChatMessage.objects.create(session=self.session, message_type='user', content=f'Question, "{index}"\nsuite')
+        self.url = reverse('chatbot:export')
+
+    def test_formats_give_the_same_rows(self):
+        text = ''.join(iter_export('messages', 'csv', chunk_size=2))
+        csv_rows = list(csv.DictReader(io.StringIO(text)))
+        jsonl_rows = [json.loads(line) for line in ''.join(iter_export('messages', 'jsonl', chunk_size=2)).splitlines()]
+        chunks = [json.loads(line) for line in ''.join(iter_export('messages', 'columnar', chunk_size=2)).splitlines()]
+
+        self.assertEqual([row['content'] for row in csv_rows], [row['content'] for row in jsonl_rows])
+        self.assertEqual(jsonl_rows[0]['content'], 'Question, "0"\nsuite')
+        self.assertEqual([chunk['rows'] for chunk in chunks], [2, 2, 1])
+        self.assertEqual(sum((chunk['columns']['id'] for chunk in chunks), []), [row['id'] for row in jsonl_rows])
+
+    def test_csv_neutralizes_formulas(self):
+        ChatMessage.objects.create(session=self.session, message_type='user', content='=HYPERLINK("http://x")')
+        ChatMessage.objects.create(session=self.session, message_type='user', content='\t=1+1')
+        ChatMessage.objects.create(session=self.session, message_type='user', content='@SUM(A1)')
+        rows = list(csv.DictReader(io.StringIO(''.join(iter_export('messages', 'csv')))))
+        self.assertEqual([row['content'] for row in rows[-3:]], ['\'=HYPERLINK("http://x")', "'\t=1+1", "'@SUM(A1)"])
+        # Le JSON garde le texte tel quel
+        self.assertEqual(json.loads(''.join(iter_export('messages', 'jsonl')).splitlines()[-1])['content'], '@SUM(A1)')
+
+    def test_date_filters(self):
+        ChatSession.objects.create(session_id='s2', ip_address='10.0.0.2')
+        ChatSession.objects.filter(session_id='s2').update(created_at=timezone.now() - timedelta(days=10))
+        since = timezone.now().date() - timedelta(days=1)
+        rows = ''.join(iter_export('sessions', 'jsonl', since=since)).splitlines()
+        self.assertEqual([json.loads(row)['session_id'] for row in rows], ['s1'])
+
+    def test_view_streams_for_staff_only(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get(self.url, {'format': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'since': '2024-02-30'}).status_code, 400)
+
+        response = self.client.get(self.url, {'kind': 'messages', 'format': 'csv'})
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment; filename="chatbot-messages-', response['Content-Disposition'])
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(len(rows), 5)
+
+    def test_command_writes_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'sessions.jsonl')
+            call_command('export_chat_data', 'sessions', '--output', path, stderr=open(os.devnull, 'w'))
+            with open(path, encoding='utf-8') as output:
+                self.assertEqual(json.loads(output.readline())['session_id'], 's1')
@@ -0,0 +1,53 @@
+"""
+Représentation des conversations du chatbot en dictionnaires sérialisables
+(exports JSONL / CSV, archives avant purge)
+"""
+
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+
+def feedback_to_dict(feedback):
+    return {
+        'id': feedback.pk,
+        'message_id': feedback.message_id,
+        'feedback_type': feedback.feedback_type,
+        'comment': feedback.comment,
+        'created_at': _isoformat(feedback.created_at),
+    }
+
+
+def message_to_dict(message, feedback=None):
+    """Message ; `feedback` : liste de retours déjà chargés à inclure, le cas échéant"""
+    data = {
+        'id': message.pk,
+        'session_id': message.session_id,
+        'message_type': message.message_type,
+        'content': message.content,
+        'domain_category': message.domain_category,
+        'timestamp': _isoformat(message.timestamp),
+        'response_time_ms': message.response_time_ms,
+        'api_model_used': message.api_model_used,
+        'is_escalated': message.is_escalated,
+    }
+    if feedback is not None:
+        data['feedback'] = [feedback_to_dict(item) for item in feedback]
+    return data
+
+
+def session_to_dict(session, messages=None):
+    """Session ; `messages` : liste de dictionnaires de messages à inclure, le cas échéant"""
+    data = {
+        'id': session.pk,
+        'session_id': session.session_id,
+        'user_id': session.user_id,
+        'created_at': _isoformat(session.created_at),
+        'updated_at': _isoformat(session.updated_at),
+        'is_active': session.is_active,
+        'ip_address': session.ip_address,
+        'user_agent': session.user_agent,
+    }
+    if messages is not None:
+        data['messages'] = messages
+    return data
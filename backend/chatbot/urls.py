@@ -9,8 +9,10 @@ urlpatterns = [
     
     # API endpoints
     path('api/chat/', views.ChatAPIView.as_view(), name='chat_api'),
+    path('api/chat/stream/', views.ChatStreamView.as_view(), name='chat_stream_api'),
     path('api/feedback/', views.ChatFeedbackView.as_view(), name='feedback_api'),
     
     # Analytics (admin only)
     path('analytics/', views.chatbot_analytics_view, name='analytics'),
+    path('export/', views.chatbot_export_view, name='export'),
 ]
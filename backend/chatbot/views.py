@@ -1,7 +1,7 @@
 # filepath: c:\\Users\\Airzo\\Desktop\\sb-style_whit Notification Mail\\sb_style responsive\\sb_style responsive\\backend\\chatbot\\views.py
 # filepath: c:\\Users\\Airzo\\Desktop\\sb-style_whit Notification Mail\\sb_style responsive\\sb_style responsive\\backend\\chatbot\\views_fixed.py
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.utils.decorators import method_decorator
@@ -12,15 +12,44 @@ from django.utils import timezone
 from django.core.paginator import Paginator
 from django.conf import settings
 from django.utils.translation import gettext_lazy as _ # Added _
+from django.utils.translation import get_language
+from django.utils.dateparse import parse_date
 from django.db import transaction
+from asgiref.sync import sync_to_async
 import json
 import uuid
 import time
-import requests
 import re
 from datetime import datetime, timedelta
 
 from .models import ChatSession, ChatMessage, ChatFeedback, ChatAnalytics, ChatbotConfiguration
+from .keyword_matcher import get_domain_matcher, get_fallback_matcher
+from .analytics import DOMAIN_COUNTERS, analytics_counters
+from .export import EXPORT_FORMATS, EXPORT_KINDS, iter_export
+from . import llm_client, retrieval, session_state
+from servicesbladi.ratelimit import TokenBucketLimiter, client_ip, parse_rate, too_many_requests
+
+# Limites par défaut "capacité/période", surchargées par ChatbotConfiguration (rate_limit_<scope>)
+RATE_LIMIT_DEFAULTS = {
+    'chat': '10/60',
+    'feedback': '30/60',
+}
+
+
+def check_rate_limit(scope, ip_address, session_id=None):
+    """Consommer un jeton pour l'IP et la session ; retourne une réponse 429 ou None"""
+    value = ChatbotConfiguration.get_value(f'rate_limit_{scope}', RATE_LIMIT_DEFAULTS[scope])
+    if str(value).strip().lower() == 'off':
+        return None
+    capacity, period = parse_rate(value) or parse_rate(RATE_LIMIT_DEFAULTS[scope])
+    limiter = TokenBucketLimiter(f'chatbot:{scope}', capacity, period)
+    allowed, retry_after = limiter.hit([
+        f'ip:{ip_address}',
+        f'session:{session_id}' if session_id else None,
+    ])
+    if not allowed:
+        return too_many_requests(retry_after)
+    return None
 
 
 class ChatbotView(View):
@@ -46,19 +75,26 @@ class ChatAPIView(View):
             user_message = data.get('message', '').strip()
             session_id = data.get('session_id')
             
+            limited = check_rate_limit('chat', self.get_client_ip(request), session_id)
+            if limited:
+                return limited
+            
             if not user_message:
                 return JsonResponse({'error': 'Message requis'}, status=400)
             
             # Créer ou récupérer la session
             session = self.get_or_create_session(request, session_id)
             
+            if self.is_session_limit_reached(session):
+                return JsonResponse({
+                    'response': self.get_session_limit_response(),
+                    'session_id': session.session_id,
+                    'message_id': None,
+                    'limit_reached': True
+                })
+            
             # Enregistrer le message utilisateur
-            user_msg = ChatMessage.objects.create(
-                session=session,
-                message_type='user',
-                content=user_message,
-                domain_category=self.classify_domain(user_message)
-            )
+            user_msg = self.save_user_message(session, user_message)
             
             # Générer la réponse du bot
             start_time = time.time()
@@ -89,15 +125,12 @@ class ChatAPIView(View):
             return JsonResponse({'error': str(e)}, status=500)
     
     def get_or_create_session(self, request, session_id=None):
-        """Créer ou récupérer une session de chat"""
+        """Créer ou récupérer une session de chat (état en cache, voir chatbot.session_state)"""
         if session_id:
-            try:
-                session = ChatSession.objects.get(session_id=session_id, is_active=True)
-                session.updated_at = timezone.now()
-                session.save()
+            session = session_state.get_active_session(session_id)
+            if session is not None:
+                session_state.touch_session(session)
                 return session
-            except ChatSession.DoesNotExist:
-                pass
         
         # Créer une nouvelle session
         session = ChatSession.objects.create(
@@ -106,35 +139,40 @@ class ChatAPIView(View):
             user_agent=request.META.get('HTTP_USER_AGENT', ''),
             ip_address=self.get_client_ip(request)
         )
+        session_state.remember_new_session(session)
         return session
+
+    def save_user_message(self, session, user_message):
+        """Enregistrer le message utilisateur et l'ajouter à la fenêtre de la session"""
+        user_msg = ChatMessage.objects.create(
+            session=session,
+            message_type='user',
+            content=user_message,
+            domain_category=self.classify_domain(user_message)
+        )
+        session_state.record_user_message(session, user_msg)
+        return user_msg
+
+    def is_session_limit_reached(self, session):
+        """Vrai si la session a atteint `max_messages_per_session` (0 ou absent : illimité)"""
+        try:
+            max_messages = int(ChatbotConfiguration.get_value('max_messages_per_session', 0))
+        except (TypeError, ValueError):
+            return False
+        return max_messages > 0 and session_state.get_message_window(session)['count'] >= max_messages
+
+    def get_session_limit_response(self):
+        return _("""Cette conversation a atteint le nombre maximum de messages.
+
+Pour continuer, rechargez la page afin de démarrer une nouvelle conversation, ou créez une demande de service pour être accompagné par un expert.""")
     
     def get_client_ip(self, request):
         """Récupérer l'IP du client"""
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0]
-        else:
-            ip = request.META.get('REMOTE_ADDR')
-        return ip
+        return client_ip(request)
     
     def classify_domain(self, message):
         """Classifier le domaine de la question"""
-        message_lower = message.lower()
-        
-        # Mots-clés par domaine
-        keywords = {
-            'fiscalite': ['impôt', 'taxe', 'déclaration', 'fiscal', 'tva', 'ir', 'is', 'convention'],
-            'immobilier': ['maison', 'appartement', 'terrain', 'achat', 'vente', 'location', 'immobilier'],
-            'investissement': ['investir', 'placement', 'bourse', 'opcvm', 'action', 'obligation', 'projet'],
-            'administration': ['consulat', 'passeport', 'visa', 'état civil', 'document', 'carte'],
-            'formation': ['formation', 'diplôme', 'certification', 'cours', 'apprentissage', 'métier']
-        }
-        
-        for domain, words in keywords.items():
-            if any(word in message_lower for word in words):
-                return domain
-        
-        return 'other'
+        return get_domain_matcher().best_match(message, default='other')
     
     def generate_bot_response(self, user_message, session):
         """Générer une réponse du bot avec un système de fallback local"""
@@ -154,10 +192,16 @@ class ChatAPIView(View):
     
     def get_intelligent_fallback_response(self, user_message):
         """Générer une réponse intelligente basée sur des mots-clés locaux"""
-        message_lower = user_message.lower()
+        intent = get_fallback_matcher().first_match(user_message)
+        
+        # Réponse tirée des FAQ et ressources de la plateforme si elles couvrent la question
+        if intent not in ('greeting', 'thanks'):
+            retrieval_response = self.get_retrieval_response(user_message)
+            if retrieval_response:
+                return retrieval_response
         
         # Réponses basées sur les mots-clés
-        if any(word in message_lower for word in ['bonjour', 'salut', 'hello', 'bonsoir']):
+        if intent == 'greeting':
             return _("""Bonjour ! Je suis l'assistant virtuel de ServicesBLADI. 
             
 Je peux vous aider avec :
@@ -168,7 +212,7 @@ Je peux vous aider avec :
 
 Comment puis-je vous aider aujourd'hui ?""")
         
-        elif any(word in message_lower for word in ['service', 'services', 'démarche', 'demarche']):
+        elif intent == 'services':
             return _("""ServicesBLADI offre de nombreux services au Maroc :
 
 • **Services administratifs** : cartes d'identité, passeports, actes de naissance
@@ -178,7 +222,7 @@ Comment puis-je vous aider aujourd'hui ?""")
 
 Vous pouvez consulter la liste complète des services sur notre plateforme ou poser une question plus spécifique.""")
         
-        elif any(word in message_lower for word in ['contact', 'telephone', 'téléphone', 'email', 'adresse']):
+        elif intent == 'contact':
             return _("""Pour nous contacter :
 
 • **Via la plateforme** : Utilisez notre système de messagerie intégré
@@ -187,7 +231,7 @@ Vous pouvez consulter la liste complète des services sur notre plateforme ou po
 
 Notre équipe d'experts est disponible pour vous accompagner dans vos démarches.""")
         
-        elif any(word in message_lower for word in ['prix', 'tarif', 'coût', 'cout', 'payement', 'paiement']):
+        elif intent == 'pricing':
             return _("""Les tarifs varient selon le type de service :
 
 • **Consultation de base** : Gratuite
@@ -197,7 +241,7 @@ Notre équipe d'experts est disponible pour vous accompagner dans vos démarches
 
 Pour connaître le tarif exact de votre service, je vous recommande de créer une demande sur la plateforme.""")
         
-        elif any(word in message_lower for word in ['merci', 'thanks', 'remercie']):
+        elif intent == 'thanks':
             return _("""Je vous en prie ! N'hésitez pas si vous avez d'autres questions.
             
 L'équipe ServicesBLADI est toujours là pour vous accompagner dans vos démarches.""")
@@ -214,24 +258,29 @@ Bien que je ne puisse pas donner une réponse spécifique à cette question pour
 
 Puis-je vous aider avec autre chose ou souhaitez-vous que je vous oriente vers un service particulier ?""")
 
+    def get_retrieval_response(self, user_message):
+        """Construire une réponse à partir des FAQ et ressources les plus proches de la question"""
+        language = (get_language() or settings.LANGUAGE_CODE)[:2]
+        min_coverage = getattr(settings, 'CHATBOT_RETRIEVAL_MIN_COVERAGE', 0.5)
+        results = [
+            payload for score, coverage, payload in retrieval.search(user_message, language, k=3)
+            if coverage >= min_coverage
+        ]
+        if not results:
+            return None
+
+        parts = []
+        faq = next((payload for payload in results if payload['type'] == 'faq'), None)
+        if faq:
+            parts.append(f"**{faq['title']}**\n\n{faq['text']}")
+        resources = [payload for payload in results if payload['type'] == 'resource']
+        if resources:
+            parts.append(str(_("Ressources utiles :")) + "\n" + "\n".join(f"• {payload['title']}" for payload in resources))
+        return "\n\n".join(parts)
+
     def get_azure_response(self, user_message, session):
-        """Méthode originale pour Azure OpenAI (conservée pour compatibilité future)"""
+        """Réponse d'Azure OpenAI via le client partagé (pool, délai, disjoncteur)"""
         try:
-            # Récupérer la configuration Azure OpenAI depuis les settings
-            endpoint = getattr(settings, 'AZURE_OPENAI_ENDPOINT', '')
-            api_key = getattr(settings, 'AZURE_OPENAI_API_KEY', '')
-            api_version = getattr(settings, 'AZURE_OPENAI_API_VERSION', '2024-02-15-preview')
-            model = getattr(settings, 'AZURE_OPENAI_MODEL', 'gpt-4o')
-            
-            print(f"DEBUG: Chatbot: Azure Endpoint: {'SET' if endpoint else 'NOT SET'}")
-            print(f"DEBUG: Chatbot: Azure API Key: {'SET' if api_key else 'NOT SET'}")
-            print(f"DEBUG: Chatbot: Azure API Version: {api_version}")
-            print(f"DEBUG: Chatbot: Azure Model: {model}")
-
-            if not endpoint or not api_key:
-                print("ERROR: Chatbot: Azure OpenAI endpoint or API key is missing in settings.")
-                return self.get_fallback_response("Missing Azure Configuration")
-
             # Vérifier si la question est similaire aux questions précédentes
             if self.is_question_repeated(user_message, session):
                 print("DEBUG: Chatbot: Repeated question detected.")
@@ -243,9 +292,17 @@ Pour vous aider au mieux, pourriez-vous :
 • Me dire si ma réponse précédente n\'était pas claire
 
 Je suis là pour vous aider avec précision !""")
-            
-            # Simple fallback since Azure is disabled
-            return self.get_fallback_response("Azure OpenAI Disabled")
+
+            messages = [
+                {'role': 'system', 'content': self.get_system_prompt(session.user)},
+                {'role': 'user', 'content': user_message},
+            ]
+            return llm_client.get_client().complete(messages, timeout=llm_client.get_response_timeout())
+        except llm_client.LLMClientError as e:
+            # Fournisseur indisponible, lent ou disjoncteur ouvert : réponse locale
+            print(f"WARNING: Chatbot: Azure OpenAI unavailable ({type(e).__name__}: {e}), using local response")
+            analytics_counters.increment('failed_responses')
+            return self.get_intelligent_fallback_response(user_message)
         except Exception as e:
             print(f"ERROR: Chatbot: Unexpected error in Azure response: {type(e).__name__} - {str(e)}")
             return self.get_fallback_response(f"Unexpected Server Error: {type(e).__name__}")
@@ -254,10 +311,7 @@ Je suis là pour vous aider avec précision !""")
         """Retourner une réponse de secours générique avec le type d'erreur pour le débogage."""
         print(f"DEBUG: Chatbot: Using fallback response due to: {error_type}")
         # Log this specific fallback event
-        ChatAnalytics.objects.update_or_create(
-            date=timezone.now().date(), 
-            defaults={'fallback_responses': F('fallback_responses') + 1}
-        )
+        analytics_counters.increment('failed_responses')
         # Show the error type in the fallback message for debugging
         fallback_message = getattr(settings, 'CHATBOT_FALLBACK_MESSAGE', 
                                  _(f"Je rencontre une difficulté technique temporaire pour traiter votre demande. Veuillez réessayer dans quelques instants. [Erreur: {error_type}]")
@@ -300,35 +354,16 @@ STYLE DE RÉPONSE:
 Réponds en français uniquement."""
     
     def update_analytics(self, domain_category):
-        """Mettre à jour les analytics quotidiennes"""
-        today = timezone.now().date()
-        analytics, created = ChatAnalytics.objects.get_or_create(date=today)
-        
-        analytics.total_messages += 1
-          # Incrémenter le compteur de domaine
-        if domain_category == 'fiscalite':
-            analytics.fiscalite_questions += 1
-        elif domain_category == 'immobilier':
-            analytics.immobilier_questions += 1
-        elif domain_category == 'investissement':
-            analytics.investissement_questions += 1
-        elif domain_category == 'administration':
-            analytics.administration_questions += 1
-        elif domain_category == 'formation':
-            analytics.formation_questions += 1
-        else:
-            analytics.off_topic_questions += 1
-        
-        analytics.save()
+        """Mettre à jour les analytics quotidiennes (écriture groupée, voir chatbot.analytics)"""
+        analytics_counters.record_message(domain_category)
 
     def is_question_repeated(self, user_message, session):
         """Détecte si la question de l'utilisateur est similaire à la précédente dans la session, envoyée très récemment (30s)."""
         # Get the last user message (excluding the current one being saved)
-        recent_messages = ChatMessage.objects.filter(session=session, message_type='user').order_by('-timestamp')[:2]
-        if len(recent_messages) == 2:
-            last_message = recent_messages[1]
-            last_content = last_message.content.strip().lower()
-            last_time = last_message.timestamp
+        recent_messages = session_state.get_message_window(session)['recent']
+        if len(recent_messages) >= 2:
+            last_content, last_time = recent_messages[-2]
+            last_content = last_content.strip().lower()
             now = timezone.now()
             # Only consider repeated if last message is identical and sent within 30 seconds
             if user_message.strip().lower() == last_content and (now - last_time).total_seconds() < 30:
@@ -336,6 +371,112 @@ Réponds en français uniquement."""
         return False
 
 
+def sse_event(event, data):
+    """Formater un événement Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class ChatStreamView(ChatAPIView):
+    """API de chat en streaming (Server-Sent Events)
+
+    Même contrat que ChatAPIView, mais la réponse est envoyée fragment par
+    fragment : `meta` (session), puis des `delta` (texte), puis `done`
+    (identifiant du message). La vue est asynchrone : servie par l'application
+    ASGI, elle n'occupe pas de worker pendant l'attente du modèle. Sous WSGI,
+    Django lit le flux en entier avant de l'envoyer.
+    """
+
+    async def post(self, request):
+        """Démarrer le flux de réponse pour un message utilisateur"""
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            return JsonResponse({'error': 'JSON invalide'}, status=400)
+
+        limited = await sync_to_async(check_rate_limit)('chat', self.get_client_ip(request), data.get('session_id'))
+        if limited:
+            return limited
+
+        user_message = data.get('message', '').strip()
+        if not user_message:
+            return JsonResponse({'error': 'Message requis'}, status=400)
+
+        session = await sync_to_async(self.get_or_create_session)(request, data.get('session_id'))
+        if await sync_to_async(self.is_session_limit_reached)(session):
+            events = self.stream_limit_events(session)
+        else:
+            user_msg = await sync_to_async(self.save_user_message)(session, user_message)
+            await sync_to_async(self.update_analytics)(user_msg.domain_category)
+            system_prompt = await sync_to_async(self.get_system_prompt)(request.user)
+            events = self.stream_events(user_message, session, user_msg.domain_category, system_prompt)
+
+        response = StreamingHttpResponse(events, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Désactiver la mise en tampon côté nginx pour que les fragments partent immédiatement
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    async def stream_events(self, user_message, session, domain_category, system_prompt):
+        """Générer les événements SSE et enregistrer la réponse complète à la fin"""
+        start_time = time.time()
+        chunks = []
+        model_used = llm_client.get_model_name() if llm_client.is_configured() else 'local-fallback'
+        bot_msg = None
+
+        yield sse_event('meta', {'session_id': session.session_id})
+        try:
+            async for text in self.stream_bot_response(user_message, system_prompt):
+                chunks.append(text)
+                yield sse_event('delta', {'text': text})
+        except llm_client.LLMClientError as e:
+            # Fournisseur indisponible, lent ou disjoncteur ouvert : réponse locale
+            print(f"WARNING: Chatbot: Streaming error ({type(e).__name__}: {e}), using local response")
+            await sync_to_async(analytics_counters.increment)('failed_responses')
+            model_used = 'local-fallback'
+            text = str(await sync_to_async(self.get_intelligent_fallback_response)(user_message))
+            # Compléter une réponse interrompue plutôt que de la remplacer
+            if chunks:
+                text = '\n\n' + text
+            chunks.append(text)
+            yield sse_event('delta', {'text': text})
+        finally:
+            # Enregistrer ce qui a été généré, même si le client s'est déconnecté
+            response_time = int((time.time() - start_time) * 1000)
+            bot_msg = await ChatMessage.objects.acreate(
+                session=session,
+                message_type='bot',
+                content=''.join(chunks),
+                response_time_ms=response_time,
+                domain_category=domain_category,
+                api_model_used=model_used
+            )
+
+        yield sse_event('done', {'message_id': bot_msg.id, 'response_time': response_time})
+
+    async def stream_limit_events(self, session):
+        """Flux d'une seule réponse quand la session a atteint sa limite de messages"""
+        yield sse_event('meta', {'session_id': session.session_id, 'limit_reached': True})
+        yield sse_event('delta', {'text': str(self.get_session_limit_response())})
+        yield sse_event('done', {'message_id': None, 'response_time': 0})
+
+    async def stream_bot_response(self, user_message, system_prompt):
+        """Fragments de la réponse : modèle Azure OpenAI, ou réponse locale découpée en mots"""
+        if not llm_client.is_configured():
+            response = str(await sync_to_async(self.get_intelligent_fallback_response)(user_message))
+            for text in re.findall(r'\S+\s*|\s+', response):
+                yield text
+            return
+
+        timeout = await sync_to_async(llm_client.get_response_timeout)()
+        messages = [
+            {'role': 'system', 'content': system_prompt},
+            {'role': 'user', 'content': user_message},
+        ]
+        async for text in llm_client.get_client().stream(messages, timeout=timeout):
+            yield text
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class ChatFeedbackView(View):
     """API pour les retours utilisateur"""
@@ -348,6 +489,10 @@ class ChatFeedbackView(View):
             feedback_type = data.get('feedback_type')
             comment = data.get('comment', '')
             
+            limited = check_rate_limit('feedback', self.get_client_ip(request), data.get('session_id'))
+            if limited:
+                return limited
+            
             if not message_id or not feedback_type:
                 return JsonResponse({'error': 'Données requises manquantes'}, status=400)
             
@@ -378,12 +523,7 @@ class ChatFeedbackView(View):
     
     def get_client_ip(self, request):
         """Récupérer l'IP du client"""
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0]
-        else:
-            ip = request.META.get('REMOTE_ADDR')
-        return ip
+        return client_ip(request)
 
 
 @login_required
@@ -392,29 +532,70 @@ def chatbot_analytics_view(request):
     if not request.user.is_staff:
         return JsonResponse({'error': 'Non autorisé'}, status=403)
     
+    # Écrire les compteurs en attente de ce processus avant de lire
+    analytics_counters.flush()
+    
     # Analytics des 30 derniers jours
     thirty_days_ago = timezone.now().date() - timedelta(days=30)
     analytics = ChatAnalytics.objects.filter(date__gte=thirty_days_ago).order_by('-date')
     
-    # Statistiques globales
-    total_sessions = ChatSession.objects.count()
-    total_messages = ChatMessage.objects.count()
-    total_feedback = ChatFeedback.objects.count()
+    # Statistiques globales, lues dans les rollups (une ligne par jour, voir rollup_chat_analytics) :
+    # les messages utilisateur et ceux du bot, comme ChatMessage.objects.count()
+    totals = ChatAnalytics.objects.aggregate(
+        total_sessions=Sum('total_sessions'),
+        total_messages=Sum(F('total_messages') + F('bot_messages')),
+        total_feedback=Sum('feedback_count'),
+    )
     
-    # Répartition par domaine
-    domain_stats = ChatMessage.objects.filter(
-        timestamp__gte=thirty_days_ago,
-        message_type='user'
-    ).values('domain_category').annotate(
-        count=Count('id')
-    ).order_by('-count')
+    # Répartition par domaine sur 30 jours
+    domain_fields = dict(DOMAIN_COUNTERS, other='off_topic_questions')
+    domain_totals = analytics.aggregate(**{domain: Sum(field) for domain, field in domain_fields.items()})
+    domain_stats = sorted(
+        ({'domain_category': domain, 'count': count or 0} for domain, count in domain_totals.items()),
+        key=lambda row: row['count'],
+        reverse=True
+    )
     
     context = {
         'analytics': analytics,
-        'total_sessions': total_sessions,
-        'total_messages': total_messages,
-        'total_feedback': total_feedback,
+        'total_sessions': totals['total_sessions'] or 0,
+        'total_messages': totals['total_messages'] or 0,
+        'total_feedback': totals['total_feedback'] or 0,
         'domain_stats': domain_stats,
+        'llm_stats': llm_client.get_client().stats(),
     }
     
     return render(request, 'chatbot/analytics.html', context)
+
+
+@login_required
+def chatbot_export_view(request):
+    """Export en flux des sessions, messages ou retours (admin seulement)
+
+    Paramètres GET : kind (sessions, messages, feedback), format (csv, jsonl,
+    columnar), since et until (AAAA-MM-JJ, inclus).
+    """
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Non autorisé'}, status=403)
+    
+    kind = request.GET.get('kind', 'messages')
+    export_format = request.GET.get('format', 'csv')
+    if kind not in EXPORT_KINDS or export_format not in EXPORT_FORMATS:
+        return JsonResponse({'error': "Type ou format d'export invalide"}, status=400)
+    
+    dates = {}
+    for name in ('since', 'until'):
+        value = request.GET.get(name)
+        if value:
+            try:
+                dates[name] = parse_date(value)
+            except ValueError:
+                dates[name] = None
+            if dates[name] is None:
+                return JsonResponse({'error': f'Date invalide : {name}'}, status=400)
+    
+    content_type, extension = EXPORT_FORMATS[export_format]
+    response = StreamingHttpResponse(iter_export(kind, export_format, **dates), content_type=content_type)
+    filename = f"chatbot-{kind}-{timezone.now():%Y%m%d}.{extension}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -2,7 +2,10 @@ from django.shortcuts import redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import JsonResponse
+from django.urls import reverse
 from accounts.models import Utilisateur
+from custom_requests.bulk_jobs import job_progress, start_job
+from custom_requests.models import BulkJob
 
 @login_required
 def admin_bulk_toggle_users_status(request):
@@ -59,9 +62,24 @@ def admin_bulk_toggle_users_status(request):
     
     return redirect('admin_users')
 
+def _job_started(request, job, message, redirect_to):
+    """Response of a bulk action whose job was started in the background"""
+    messages.info(request, message)
+    
+    # If this is an AJAX request, return JSON response with the progress URL
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return JsonResponse({
+            'success': True,
+            'message': message,
+            'job_id': job.pk,
+            'progress_url': reverse('admin_bulk_job_status', args=[job.pk]),
+        }, status=202)
+    
+    return redirect(redirect_to)
+
 @login_required
 def admin_bulk_delete_users(request):
-    """Delete multiple users at once"""
+    """Delete multiple users at once, in chunks in the background"""
     
     # Check if user is admin
     if request.user.account_type.lower() != 'admin':
@@ -78,20 +96,10 @@ def admin_bulk_delete_users(request):
             messages.error(request, "Veuillez sélectionner des utilisateurs à supprimer.")
             return redirect('admin_users')
             
-        # Get the count before deletion for messaging
-        count = len(user_ids)
-        
-        # Delete users - this will cascade delete related objects
-        Utilisateur.objects.filter(id__in=user_ids).delete()
+        # Deleting a user cascades over all their data: run it chunk by chunk
+        job = start_job('delete_users', user_ids, created_by=request.user)
         
-        messages.success(request, f"{count} utilisateurs ont été supprimés avec succès.")
-        
-        # If this is an AJAX request, return JSON response
-        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-            return JsonResponse({
-                'success': True,
-                'message': f"{count} utilisateurs ont été supprimés avec succès."
-            })
+        return _job_started(request, job, f"Suppression de {job.total} utilisateurs en cours.", 'admin_users')
     
     except Exception as e:
         messages.error(request, f"Erreur lors de la suppression: {str(e)}")
@@ -107,7 +115,7 @@ def admin_bulk_delete_users(request):
 
 @login_required
 def admin_bulk_verify_documents(request):
-    """Verify multiple documents at once"""
+    """Verify multiple documents at once, in chunks in the background"""
     
     # Check if user is admin
     if request.user.account_type.lower() != 'admin':
@@ -118,30 +126,15 @@ def admin_bulk_verify_documents(request):
     
     try:
         # Get list of selected document IDs from the form
-        from custom_requests.models import Document
-        from django.utils import timezone
-        
         document_ids = request.POST.getlist('selected_documents')
         
         if not document_ids:
             messages.error(request, "Veuillez sélectionner des documents à vérifier.")
             return redirect('admin_documents')
             
-        # Update all selected documents
-        updated = Document.objects.filter(id__in=document_ids).update(
-            status='verified',
-            verified_by=request.user,
-            verified_at=timezone.now()
-        )
-        
-        messages.success(request, f"{updated} documents ont été vérifiés avec succès.")
+        job = start_job('verify_documents', document_ids, created_by=request.user)
         
-        # If this is an AJAX request, return JSON response
-        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-            return JsonResponse({
-                'success': True,
-                'message': f"{updated} documents ont été vérifiés avec succès."
-            })
+        return _job_started(request, job, f"Vérification de {job.total} documents en cours.", 'admin_documents')
     
     except Exception as e:
         messages.error(request, f"Erreur: {str(e)}")
@@ -157,7 +150,7 @@ def admin_bulk_verify_documents(request):
 
 @login_required
 def admin_bulk_reject_documents(request):
-    """Reject multiple documents at once"""
+    """Reject multiple documents at once, in chunks in the background"""
     
     # Check if user is admin
     if request.user.account_type.lower() != 'admin':
@@ -168,9 +161,6 @@ def admin_bulk_reject_documents(request):
     
     try:
         # Get list of selected document IDs from the form
-        from custom_requests.models import Document
-        from django.utils import timezone
-        
         document_ids = request.POST.getlist('selected_documents')
         rejection_reason = request.POST.get('rejection_reason', 'Rejeté par l\'administrateur')
         
@@ -178,22 +168,9 @@ def admin_bulk_reject_documents(request):
             messages.error(request, "Veuillez sélectionner des documents à rejeter.")
             return redirect('admin_documents')
             
-        # Update all selected documents
-        updated = Document.objects.filter(id__in=document_ids).update(
-            status='rejected',
-            verified_by=request.user,
-            verified_at=timezone.now(),
-            rejection_reason=rejection_reason
-        )
-        
-        messages.success(request, f"{updated} documents ont été rejetés avec succès.")
+        job = start_job('reject_documents', document_ids, created_by=request.user, rejection_reason=rejection_reason)
         
-        # If this is an AJAX request, return JSON response
-        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-            return JsonResponse({
-                'success': True,
-                'message': f"{updated} documents ont été rejetés avec succès."
-            })
+        return _job_started(request, job, f"Rejet de {job.total} documents en cours.", 'admin_documents')
     
     except Exception as e:
         messages.error(request, f"Erreur: {str(e)}")
@@ -207,6 +184,21 @@ def admin_bulk_reject_documents(request):
     
     return redirect('admin_documents')
 
+@login_required
+def admin_bulk_job_status(request, job_id):
+    """Progress of a bulk job (JSON), polled by the admin pages"""
+    
+    # Check if user is admin
+    if request.user.account_type.lower() != 'admin':
+        return JsonResponse({'success': False, 'message': 'Accès non autorisé'}, status=403)
+    
+    try:
+        job = BulkJob.objects.get(pk=job_id)
+    except BulkJob.DoesNotExist:
+        return JsonResponse({'success': False, 'message': 'Tâche introuvable'}, status=404)
+    
+    return JsonResponse({'success': True, 'job': job_progress(job)})
+
 @login_required
 def generate_documents_report(request):
     """Generate a report of document uploads"""
@@ -0,0 +1,288 @@
+"""
+CSV and XLSX exports of the admin listings.
+
+The rows come from the same filters as the HTML listings
+(custom_requests.admin_listings) and are read as tuples with
+`.values_list().iterator(chunk_size=...)`: no model instance is built and,
+on PostgreSQL, a server-side cursor fetches them chunk by chunk. Each chunk
+is encoded and handed to the StreamingHttpResponse before the next one is
+read, so the memory used does not depend on the number of rows and the
+first bytes reach the client right away.
+
+XLSX files are written without a spreadsheet library: the worksheet is a
+single XML part, appended row by row to a zip archive that is itself
+streamed (zipfile writes data descriptors when the output is not seekable),
+with strings inlined instead of collected in a shared strings table.
+
+Gunicorn's sync worker timeout covers the whole response: exports too large
+for it should be run with the export_admin_listing management command.
+"""
+
+import csv
+import re
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from itertools import islice
+from xml.sax.saxutils import escape
+
+from django.utils import timezone
+
+from servicesbladi.spreadsheets import neutralize_formula
+
+from .admin_listings import appointments_listing, documents_listing, requests_listing, users_listing
+
+CHUNK_SIZE = 2000
+
+# Listing: (filtered queryset from GET parameters, [(header, field path), ...])
+EXPORTS = {
+    'requests': (requests_listing, [
+        ('ID', 'id'),
+        ('Title', 'title'),
+        ('Status', 'status'),
+        ('Priority', 'priority'),
+        ('Service', 'service__title'),
+        ('Client email', 'client__email'),
+        ('Client name', 'client__name'),
+        ('Client first name', 'client__first_name'),
+        ('Expert email', 'expert__email'),
+        ('Urgent', 'is_urgent'),
+        ('Desired date', 'desired_date'),
+        ('Created at', 'created_at'),
+        ('Updated at', 'updated_at'),
+    ]),
+    'users': (users_listing, [
+        ('ID', 'id'),
+        ('Email', 'email'),
+        ('Name', 'name'),
+        ('First name', 'first_name'),
+        ('Phone', 'phone'),
+        ('Account type', 'account_type'),
+        ('Active', 'is_active'),
+        ('Joined', 'date_joined'),
+        ('Last login', 'last_login'),
+    ]),
+    'documents': (documents_listing, [
+        ('ID', 'id'),
+        ('Name', 'name'),
+        ('Type', 'type'),
+        ('Status', 'status'),
+        ('Reference number', 'reference_number'),
+        ('Uploaded by', 'uploaded_by__email'),
+        ('Request', 'service_request__title'),
+        ('Size (KB)', 'file_size'),
+        ('Uploaded at', 'upload_date'),
+        ('Verified at', 'verified_at'),
+    ]),
+    'appointments': (appointments_listing, [
+        ('ID', 'id'),
+        ('Date and time', 'date_time'),
+        ('Duration (min)', 'duration'),
+        ('Consultation type', 'consultation_type'),
+        ('Status', 'status'),
+        ('Client email', 'client__email'),
+        ('Expert email', 'expert__email'),
+        ('Service', 'service__title'),
+        ('Request', 'service_request__title'),
+        ('Notes', 'notes'),
+    ]),
+}
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def _choice_labels(model, path):
+    """Labels of the choices of the field at `path`, or None if it has no choices."""
+    *relations, name = path.split('__')
+    for relation in relations:
+        model = model._meta.get_field(relation).related_model
+    field = model._meta.get_field(name)
+    if not field.choices:
+        return None
+    return {value: str(label) for value, label in field.flatchoices}
+
+
+def export_rows(listing, params, chunk_size=CHUNK_SIZE):
+    """Headers and a generator of row tuples of a filtered listing; choices are shown by label."""
+    build_queryset, columns = EXPORTS[listing]
+    queryset = build_queryset(params)
+    paths = [path for _, path in columns]
+    labels = [_choice_labels(queryset.model, path) for path in paths]
+
+    def rows():
+        for row in queryset.values_list(*paths).iterator(chunk_size=chunk_size):
+            yield tuple(
+                choices.get(value, value) if choices else value
+                for value, choices in zip(row, labels)
+            )
+
+    return [header for header, _ in columns], rows()
+
+
+def _batches(rows, size):
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+class _Echo:
+    """File-like object whose `write` returns the written value (for csv.writer)."""
+
+    def write(self, value):
+        return value
+
+
+def _csv_value(value):
+    if isinstance(value, datetime):
+        return timezone.localtime(value).strftime('%Y-%m-%d %H:%M:%S') if timezone.is_aware(value) else value.isoformat(' ')
+    if value is None:
+        return ''
+    return neutralize_formula(value)
+
+
+def iter_csv(headers, rows, chunk_size=CHUNK_SIZE):
+    """Text chunks of a CSV file, one per `chunk_size` rows."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(headers)
+    for batch in _batches(rows, chunk_size):
+        yield ''.join(writer.writerow([_csv_value(value) for value in row]) for row in batch)
+
+
+class _ZipOutput:
+    """Write-only, non-seekable buffer from which the zip archive is drained."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+XLSX_STATIC_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Export" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '<Relationship Id="rId2" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+        'Target="styles.xml"/>'
+        '</Relationships>'
+    ),
+    # Cell styles: 0 default, 1 date and time (built-in format 22), 2 date (built-in format 14)
+    'xl/styles.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+        '<fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="3"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="22" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+        '<xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+        '</styleSheet>'
+    ),
+}
+
+SHEET_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+SHEET_FOOTER = '</sheetData></worksheet>'
+
+EXCEL_EPOCH = datetime(1899, 12, 30)
+
+# Characters that are not allowed in XML 1.0
+_XML_ILLEGAL = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+
+def _xlsx_cell(value):
+    if value is None or value == '':
+        return '<c/>'
+    if isinstance(value, bool):
+        return f'<c t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float, Decimal)):
+        return f'<c><v>{value}</v></c>'
+    if isinstance(value, datetime):
+        if timezone.is_aware(value):
+            value = timezone.make_naive(value)
+        return f'<c s="1"><v>{(value - EXCEL_EPOCH).total_seconds() / 86400:.6f}</v></c>'
+    if isinstance(value, date):
+        return f'<c s="2"><v>{(value - EXCEL_EPOCH.date()).days}</v></c>'
+    text = escape(_XML_ILLEGAL.sub('', str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_row(values):
+    return '<row>' + ''.join(_xlsx_cell(value) for value in values) + '</row>'
+
+
+def iter_xlsx(headers, rows, chunk_size=CHUNK_SIZE):
+    """Byte chunks of an XLSX workbook with one sheet, one per `chunk_size` rows."""
+    output = _ZipOutput()
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, content in XLSX_STATIC_PARTS.items():
+            archive.writestr(name, content)
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write((SHEET_HEADER + _xlsx_row(headers)).encode())
+            yield output.drain()
+            for batch in _batches(rows, chunk_size):
+                sheet.write(''.join(_xlsx_row(row) for row in batch).encode())
+                yield output.drain()
+            sheet.write(SHEET_FOOTER.encode())
+    yield output.drain()
+
+
+def iter_export(listing, export_format, params, chunk_size=CHUNK_SIZE):
+    """Chunks of the export of a filtered listing in `export_format` (csv or xlsx)."""
+    if listing not in EXPORTS:
+        raise ValueError(f'Unknown listing: {listing}')
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f'Unknown export format: {export_format}')
+    headers, rows = export_rows(listing, params, chunk_size)
+    encode = iter_csv if export_format == 'csv' else iter_xlsx
+    return encode(headers, rows, chunk_size)
@@ -0,0 +1,121 @@
+"""
+Filters of the admin listings (requests, users, documents, appointments).
+
+Each function takes the GET parameters of its listing and returns the
+filtered, ordered queryset, so the HTML views and the exports of
+custom_requests.admin_export always show the same rows.
+"""
+
+from datetime import timedelta
+
+from django.utils import timezone
+
+from accounts.models import Utilisateur
+from .admin_search import filter_appointments, filter_documents, filter_requests, filter_users
+from .models import Document, RendezVous, ServiceRequest
+
+
+def requests_listing(params):
+    """Service requests; GET parameters: status, category, period (today/week/month), search"""
+    service_requests = ServiceRequest.objects.all()
+    status_filter = params.get('status', '')
+    category_filter = params.get('category', '')
+    period_filter = params.get('period', '')
+    search_query = params.get('search', '')
+
+    if status_filter:
+        service_requests = service_requests.filter(status=status_filter)
+
+    if category_filter:
+        service_requests = service_requests.filter(service__category=category_filter)
+
+    if period_filter:
+        today = timezone.now().date()
+        if period_filter == 'today':
+            service_requests = service_requests.filter(created_at__date=today)
+        elif period_filter == 'week':
+            service_requests = service_requests.filter(created_at__date__gte=today - timedelta(days=7))
+        elif period_filter == 'month':
+            service_requests = service_requests.filter(created_at__date__gte=today - timedelta(days=30))
+
+    if search_query:
+        service_requests = filter_requests(service_requests, search_query)
+
+    return service_requests.order_by('-created_at', 'pk')
+
+
+def users_listing(params):
+    """Users; GET parameters: user_type, status (active/inactive), search"""
+    users = Utilisateur.objects.all()
+    user_type = params.get('user_type', '')
+    status_filter = params.get('status', '')
+    search_query = params.get('search', '')
+
+    if user_type:
+        users = users.filter(account_type__iexact=user_type)
+
+    if status_filter == 'active':
+        users = users.filter(is_active=True)
+    elif status_filter == 'inactive':
+        users = users.filter(is_active=False)
+
+    if search_query:
+        users = filter_users(users, search_query)
+
+    return users.order_by('-date_joined')
+
+
+def documents_listing(params):
+    """Documents; GET parameters: status, type, client (uploader id), search"""
+    documents = Document.objects.all()
+    status_filter = params.get('status', '')
+    document_type = params.get('type', '')
+    client_id = params.get('client', '')
+    search_query = params.get('search', '')
+
+    if status_filter:
+        documents = documents.filter(status=status_filter)
+
+    if document_type:
+        documents = documents.filter(type=document_type)
+
+    if client_id:
+        documents = documents.filter(uploaded_by__id=client_id)
+
+    if search_query:
+        documents = filter_documents(documents, search_query)
+
+    return documents.order_by('-upload_date')
+
+
+def appointments_listing(params):
+    """Appointments; GET parameters: status, date (today/tomorrow/week), client, expert, search"""
+    appointments = RendezVous.objects.all()
+    status_filter = params.get('status', '')
+    date_filter = params.get('date', '')
+    client_id = params.get('client', '')
+    expert_id = params.get('expert', '')
+    search_query = params.get('search', '')
+
+    if status_filter:
+        appointments = appointments.filter(status=status_filter)
+
+    if date_filter:
+        today = timezone.now().date()
+        if date_filter == 'today':
+            appointments = appointments.filter(date_time__date=today)
+        elif date_filter == 'tomorrow':
+            appointments = appointments.filter(date_time__date=today + timedelta(days=1))
+        elif date_filter == 'week':
+            appointments = appointments.filter(date_time__date__gte=today, date_time__date__lte=today + timedelta(days=7))
+
+    if client_id:
+        appointments = appointments.filter(client_id=client_id)
+
+    if expert_id:
+        appointments = appointments.filter(expert_id=expert_id)
+
+    if search_query:
+        appointments = filter_appointments(appointments, search_query)
+
+    return appointments.order_by('date_time')
@@ -0,0 +1,160 @@
+"""
+Admin search across users, service requests, documents and appointments.
+
+Text matching is `icontains`. On PostgreSQL, migration 0008 adds pg_trgm GIN
+indexes on UPPER(column), the expression Django's icontains compares, so
+these filters are index scans instead of sequential scans, and results are
+ranked by trigram similarity. Elsewhere (SQLite in development and tests)
+the same filters run unindexed and results are ranked by where the query
+matches (whole value, prefix, substring).
+
+A search on the name of a related user (client, expert, uploader) looks up
+the matching users in a subquery served by the user indexes, then filters
+by foreign key, instead of joining the users table into every OR-chain.
+"""
+
+from django.db import connections
+from django.db.models import Case, FloatField, Q, Value, When
+from django.db.models.functions import Coalesce, Greatest, Upper
+from django.urls import reverse
+
+from accounts.models import Utilisateur
+from services.models import Service
+from .models import Document, RendezVous, ServiceRequest
+
+MIN_QUERY_LENGTH = 2
+MAX_LIMIT = 50
+
+USER_FIELDS = ('email', 'name', 'first_name', 'phone')
+REQUEST_FIELDS = ('title', 'description')
+DOCUMENT_FIELDS = ('name', 'reference_number', 'type')
+APPOINTMENT_FIELDS = ('notes',)
+SERVICE_FIELDS = ('title',)
+
+
+def _text_filter(fields, query):
+    condition = Q()
+    for field in fields:
+        condition |= Q(**{f'{field}__icontains': query})
+    return condition
+
+
+def matching_users(query):
+    """Primary keys of the users matching `query`, as a subquery."""
+    return Utilisateur.objects.filter(_text_filter(USER_FIELDS, query)).values('pk')
+
+
+def matching_services(query):
+    return Service.objects.filter(_text_filter(SERVICE_FIELDS, query)).values('pk')
+
+
+def filter_users(queryset, query):
+    return queryset.filter(_text_filter(USER_FIELDS, query))
+
+
+def filter_requests(queryset, query):
+    users = matching_users(query)
+    return queryset.filter(
+        _text_filter(REQUEST_FIELDS, query) |
+        Q(service__in=matching_services(query)) |
+        Q(client__in=users) |
+        Q(expert__in=users)
+    )
+
+
+def filter_documents(queryset, query):
+    return queryset.filter(_text_filter(DOCUMENT_FIELDS, query) | Q(uploaded_by__in=matching_users(query)))
+
+
+def filter_appointments(queryset, query):
+    users = matching_users(query)
+    return queryset.filter(
+        _text_filter(APPOINTMENT_FIELDS, query) |
+        Q(service_request__service__in=matching_services(query)) |
+        Q(client__in=users) |
+        Q(expert__in=users)
+    )
+
+
+def rank(queryset, fields, query):
+    """Relevance of each row for `query` on `fields`, between 0 and 1."""
+    if connections[queryset.db].vendor == 'postgresql':
+        from django.contrib.postgres.search import TrigramSimilarity
+
+        scores = [Coalesce(TrigramSimilarity(Upper(field), query.upper()), 0.0) for field in fields]
+    else:
+        scores = [
+            Case(
+                When(**{f'{field}__iexact': query}, then=Value(1.0)),
+                When(**{f'{field}__istartswith': query}, then=Value(0.75)),
+                When(**{f'{field}__icontains': query}, then=Value(0.5)),
+                default=Value(0.0),
+                output_field=FloatField(),
+            )
+            for field in fields
+        ]
+    return scores[0] if len(scores) == 1 else Greatest(*scores)
+
+
+def _user_result(user):
+    return {
+        'title': f'{user.name} {user.first_name}'.strip() or user.email,
+        'subtitle': f'{user.email} · {user.account_type}',
+        'url': reverse('admin_user_detail', args=[user.pk]),
+    }
+
+
+def _request_result(service_request):
+    client = service_request.client
+    return {
+        'title': service_request.title,
+        'subtitle': f'{client.name} {client.first_name} · {service_request.get_status_display()}',
+        'url': reverse('admin_request_detail', args=[service_request.pk]),
+    }
+
+
+def _document_result(document):
+    return {
+        'title': document.name,
+        'subtitle': f'{document.get_type_display()} · {document.uploaded_by.email}',
+        'url': reverse('custom_requests:view_document', args=[document.pk]) if document.file else '',
+    }
+
+
+def _appointment_result(appointment):
+    return {
+        'title': f'{appointment.client.name} / {appointment.expert.name}',
+        'subtitle': f"{appointment.date_time:%d/%m/%Y %H:%M} · {appointment.get_status_display()}",
+        'url': reverse('admin_rendezvous'),
+    }
+
+
+# Result type: (base queryset, filter, ranked fields, tie-breaking order, serializer)
+SEARCH_TYPES = {
+    'users': (lambda: Utilisateur.objects.all(), filter_users, USER_FIELDS, '-date_joined', _user_result),
+    'requests': (lambda: ServiceRequest.objects.select_related('client'), filter_requests,
+                 REQUEST_FIELDS, '-created_at', _request_result),
+    'documents': (lambda: Document.objects.select_related('uploaded_by'), filter_documents,
+                  DOCUMENT_FIELDS, '-upload_date', _document_result),
+    'appointments': (lambda: RendezVous.objects.select_related('client', 'expert'), filter_appointments,
+                     APPOINTMENT_FIELDS, '-date_time', _appointment_result),
+}
+
+
+def admin_search(query, types=None, limit=10):
+    """Best matches of `query` per type: {type: [{'type', 'id', 'title', 'subtitle', 'url', 'score'}, ...]}"""
+    query = (query or '').strip()
+    if len(query) < MIN_QUERY_LENGTH:
+        return {}
+    limit = max(1, min(limit, MAX_LIMIT))
+
+    results = {}
+    for search_type in types or SEARCH_TYPES:
+        base, search_filter, fields, ordering, serialize = SEARCH_TYPES[search_type]
+        queryset = search_filter(base(), query)
+        queryset = queryset.annotate(score=rank(queryset, fields, query)).order_by('-score', ordering)
+        results[search_type] = [
+            dict(serialize(item), type=search_type, id=item.pk, score=round(item.score, 3))
+            for item in queryset[:limit]
+        ]
+    return results
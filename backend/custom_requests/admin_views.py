@@ -1,5 +1,5 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.contrib.auth.decorators import login_required
 from django.db.models import Count, Q, Sum, F, CharField, Value
 from django.db.models.functions import Concat
@@ -11,6 +11,7 @@ from accounts.models import Utilisateur, Expert  # Add Expert import
 import json, csv
 import os
 from io import StringIO
+from urllib.parse import urlencode
 from django.utils.translation import gettext_lazy as _
 from django.core.mail import send_mail
 from django.template.loader import render_to_string
@@ -25,6 +26,11 @@ from custom_requests.models import ServiceRequest, Document, RendezVous, Message
 from services.models import Service, ServiceCategory
 from resources.models import Resource, ResourceFile
 from services.email_notifications import EmailNotificationService
+from .admin_search import admin_search, MAX_LIMIT, SEARCH_TYPES
+from .admin_export import EXPORT_FORMATS, EXPORTS, iter_export
+from .admin_listings import appointments_listing, documents_listing, requests_listing, users_listing
+from .pagination import KeysetPaginator
+from .stats import request_status_stats
 
 @login_required
 def admin_requests_view(request):
@@ -41,49 +47,11 @@ def admin_requests_view(request):
         period_filter = request.GET.get('period', '')
         search_query = request.GET.get('search', '')
         
-        # Base queryset
-        service_requests = ServiceRequest.objects.select_related(
-            'client', 
-            'expert',
-            'service'
-        )
-        
-        # Apply filters
-        if status_filter:
-            service_requests = service_requests.filter(status=status_filter)
+        # Filtered queryset, shared with the CSV/XLSX export
+        service_requests = requests_listing(request.GET).select_related('client', 'expert', 'service')
             
-        if category_filter:
-            service_requests = service_requests.filter(service__category=category_filter)
-            
-        if period_filter:
-            today = timezone.now().date()
-            if period_filter == 'today':
-                service_requests = service_requests.filter(created_at__date=today)
-            elif period_filter == 'week':
-                week_ago = today - timedelta(days=7)
-                service_requests = service_requests.filter(created_at__date__gte=week_ago)
-            elif period_filter == 'month':
-                month_ago = today - timedelta(days=30)
-                service_requests = service_requests.filter(created_at__date__gte=month_ago)
-                
-        if search_query:
-            service_requests = service_requests.filter(
-                Q(description__icontains=search_query) |
-                Q(service__title__icontains=search_query) |
-                Q(client__first_name__icontains=search_query) |
-                Q(client__name__icontains=search_query) |
-                Q(expert__first_name__icontains=search_query) |
-                Q(expert__name__icontains=search_query)
-            )
-            
-        # Order by creation date (newest first)
-        service_requests = service_requests.order_by('-created_at')
-        
-        # Get statistics for dashboard
-        total_requests = service_requests.count()
-        pending_requests = service_requests.filter(status__in=['new', 'pending_info']).count()
-        in_progress_requests = service_requests.filter(status='in_progress').count()
-        completed_requests = service_requests.filter(status='completed').count()
+        # Get statistics for dashboard (one aggregate over the filtered set)
+        stats = request_status_stats(service_requests)
         
         # Get categories for filter
         categories = ServiceCategory.objects.all()
@@ -91,18 +59,19 @@ def admin_requests_view(request):
         # Get all experts for assignment
         experts = Utilisateur.objects.filter(account_type='expert')
         
-        # Pagination
-        paginator = Paginator(service_requests, 10)  # 10 requests per page
-        page = request.GET.get('page')
+        # Keyset pagination, newest first: 10 requests per page
+        paginator = KeysetPaginator(service_requests, 10)
+        requests_page = paginator.page(after=request.GET.get('after'), before=request.GET.get('before'))
         
-        try:
-            requests_page = paginator.page(page)
-        except PageNotAnInteger:
-            # If page is not an integer, deliver first page
-            requests_page = paginator.page(1)
-        except EmptyPage:
-            # If page is out of range, deliver last page of results
-            requests_page = paginator.page(paginator.num_pages)
+        # Filters to keep in the pagination links
+        filter_query = urlencode({
+            key: value for key, value in (
+                ('status', status_filter),
+                ('category', category_filter),
+                ('period', period_filter),
+                ('search', search_query),
+            ) if value
+        })
         
         context = {
             'user': request.user,
@@ -113,18 +82,14 @@ def admin_requests_view(request):
             'category_filter': category_filter,
             'period_filter': period_filter,
             'search_query': search_query,
+            'filter_query': filter_query,
             # Variables directes pour le template
-            'total_requests': total_requests,
-            'pending_requests': pending_requests,
-            'in_progress_requests': in_progress_requests,
-            'completed_requests': completed_requests,
+            'total_requests': stats['total'],
+            'pending_requests': stats['pending'],
+            'in_progress_requests': stats['in_progress'],
+            'completed_requests': stats['completed'],
             # Garder la structure stats également
-            'stats': {
-                'total': total_requests,
-                'pending': pending_requests,
-                'in_progress': in_progress_requests,
-                'completed': completed_requests
-            }
+            'stats': stats
         }
         
         return render(request, 'admin/demandes.html', context)
@@ -150,29 +115,8 @@ def admin_users_view(request):
         status_filter = request.GET.get('status', '')
         search_query = request.GET.get('search', '')
         
-        # Base queryset
-        users = Utilisateur.objects.all()
-        
-        # Apply filters
-        if user_type:
-            users = users.filter(account_type__iexact=user_type)
-            
-        if status_filter:
-            if status_filter == 'active':
-                users = users.filter(is_active=True)
-            elif status_filter == 'inactive':
-                users = users.filter(is_active=False)
-                
-        if search_query:
-            users = users.filter(
-                Q(email__icontains=search_query) |
-                Q(first_name__icontains=search_query) |
-                Q(name__icontains=search_query) |
-                Q(phone__icontains=search_query)
-            )
-            
-        # Order by registration date
-        users = users.order_by('-date_joined')
+        # Filtered queryset ordered by registration date, shared with the CSV/XLSX export
+        users = users_listing(request.GET)
         
         # Debug logging
         print(f"ADMIN USERS VIEW - Query: {str(users.query)}")
@@ -1160,29 +1104,8 @@ def admin_documents_view(request):
         client_id = request.GET.get('client', '')
         search_query = request.GET.get('search', '')
         
-        # Base queryset - correct the field names based on Document model
-        documents = Document.objects.select_related('uploaded_by', 'service_request')
-        
-        # Apply filters
-        if status_filter:
-            documents = documents.filter(status=status_filter)
-            
-        if document_type:
-            documents = documents.filter(type=document_type)
-            
-        if client_id:
-            documents = documents.filter(uploaded_by__id=client_id)
-                
-        if search_query:
-            documents = documents.filter(
-                Q(name__icontains=search_query) |
-                Q(type__icontains=search_query) |
-                Q(uploaded_by__first_name__icontains=search_query) |
-                Q(uploaded_by__name__icontains=search_query)
-            )
-            
-        # Order by upload date (newest first)
-        documents = documents.order_by('-upload_date')
+        # Filtered queryset, newest first, shared with the CSV/XLSX export
+        documents = documents_listing(request.GET).select_related('uploaded_by', 'service_request')
         
         # Get statistics for dashboard
         total_documents = Document.objects.count()
@@ -1257,46 +1180,8 @@ def admin_appointments_view(request):
         expert_id = request.GET.get('expert', '')
         search_query = request.GET.get('search', '')
         
-        # Base queryset avec les relations correctes
-        appointments = RendezVous.objects.select_related(
-            'client', 
-            'expert', 
-            'service_request'
-        )
-        
-        # Apply filters
-        if status_filter:
-            appointments = appointments.filter(status=status_filter)
-            
-        if date_filter:
-            today = timezone.now().date()
-            if date_filter == 'today':
-                appointments = appointments.filter(date_time__date=today)
-            elif date_filter == 'tomorrow':
-                tomorrow = today + timedelta(days=1)
-                appointments = appointments.filter(date_time__date=tomorrow)
-            elif date_filter == 'week':
-                week_later = today + timedelta(days=7)
-                appointments = appointments.filter(date_time__date__gte=today, date_time__date__lte=week_later)
-            
-        if client_id:
-            appointments = appointments.filter(client_id=client_id)
-            
-        if expert_id:
-            appointments = appointments.filter(expert_id=expert_id)
-                
-        if search_query:
-            appointments = appointments.filter(
-                Q(client__first_name__icontains=search_query) |
-                Q(client__name__icontains=search_query) |
-                Q(expert__first_name__icontains=search_query) |
-                Q(expert__name__icontains=search_query) |
-                Q(service_request__service__title__icontains=search_query) |
-                Q(notes__icontains=search_query)
-            )
-            
-        # Order by date and time
-        appointments = appointments.order_by('date_time')
+        # Filtered queryset ordered by date and time, shared with the CSV/XLSX export
+        appointments = appointments_listing(request.GET).select_related('client', 'expert', 'service_request')
         
         # Get statistics for dashboard
         total_appointments = appointments.count()
@@ -1595,6 +1480,42 @@ def admin_request_detail(request, request_id):
         messages.error(request, f"Erreur: {str(e)}")
         return redirect('admin_demandes')
 
+@login_required
+def admin_search_api(request):
+    """JSON search across users, requests, documents and appointments"""
+    if request.user.account_type.lower() != 'admin':
+        return JsonResponse({'success': False, 'message': 'Accès non autorisé'}, status=403)
+
+    types = [t for t in request.GET.get('types', '').split(',') if t]
+    unknown = set(types) - set(SEARCH_TYPES)
+    if unknown:
+        return JsonResponse({'success': False, 'message': f"Unknown types: {', '.join(sorted(unknown))}"}, status=400)
+    try:
+        limit = min(int(request.GET.get('limit', 10)), MAX_LIMIT)
+    except ValueError:
+        limit = 10
+
+    query = request.GET.get('q', '')
+    return JsonResponse({'success': True, 'query': query, 'results': admin_search(query, types or None, limit)})
+
+@login_required
+def admin_export_view(request, listing):
+    """Stream a listing as CSV or XLSX, with the filters of its HTML page (GET parameters)"""
+    if request.user.account_type.lower() != 'admin':
+        return JsonResponse({'success': False, 'message': 'Accès non autorisé'}, status=403)
+
+    export_format = request.GET.get('format', 'csv')
+    if listing not in EXPORTS or export_format not in EXPORT_FORMATS:
+        return JsonResponse({'success': False, 'message': 'Unknown listing or format'}, status=400)
+
+    response = StreamingHttpResponse(iter_export(listing, export_format, request.GET),
+                                     content_type=EXPORT_FORMATS[export_format])
+    filename = f"{listing}-{timezone.now():%Y%m%d-%H%M}.{export_format}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    # Send each chunk as soon as it is written instead of buffering it in nginx
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 @login_required
 def admin_send_message(request):
     """Handle sending a message from admin"""
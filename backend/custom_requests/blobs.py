@@ -0,0 +1,132 @@
+"""
+Reference counting of the document blobs (see custom_requests.storage).
+
+The receivers in custom_requests.signals call add_reference when a document
+starts using a blob (creation, or file replaced) and remove_reference when
+it stops (deletion, or file replaced). The count is updated in the current
+transaction; a blob whose count drops to zero is removed, row and file,
+once the transaction commits, unless a document references it again.
+
+Between storing a file and saving its document there is a short window
+where a duplicate blob is not referenced yet; storage marks a reused blob as
+just modified and blobs modified in the last BLOB_GRACE_SECONDS are never
+removed. The reconcile_document_blobs command recounts the references and
+collects the blobs left behind.
+"""
+
+import os
+
+from django.conf import settings
+from django.db import transaction
+from django.core.files.storage import default_storage
+from django.db.models import Count, F
+
+from .models import Document, DocumentBlob
+from .previews import blob_preview_name
+from .storage import BLOB_PREFIX, blob_sha256
+
+
+def grace_seconds():
+    return getattr(settings, 'BLOB_GRACE_SECONDS', 60)
+
+
+def _storage():
+    return Document._meta.get_field('file').storage
+
+
+def add_reference(name):
+    sha256 = blob_sha256(name)
+    if sha256 is None:
+        return
+    DocumentBlob.objects.get_or_create(sha256=sha256, defaults={'name': name, 'size': _storage().size(name)})
+    DocumentBlob.objects.filter(pk=sha256).update(ref_count=F('ref_count') + 1)
+
+
+def remove_reference(name):
+    sha256 = blob_sha256(name)
+    if sha256 is None:
+        return
+    DocumentBlob.objects.filter(pk=sha256).update(ref_count=F('ref_count') - 1)
+    transaction.on_commit(lambda: release_blob(name))
+
+
+def release_blob(name, grace=None):
+    """Remove a blob, row and file, if no document references it; returns True if removed"""
+    sha256 = blob_sha256(name)
+    if sha256 is None:
+        return False
+    storage = _storage()
+    with transaction.atomic():
+        blob = DocumentBlob.objects.select_for_update().filter(pk=sha256).first()
+        if blob is not None and blob.ref_count > 0:
+            return False
+        if Document.objects.filter(file=name).exists():
+            return False
+        if storage.modified_recently(name, grace_seconds() if grace is None else grace):
+            return False
+        if blob is not None:
+            blob.delete()
+    storage.delete(name)
+    default_storage.delete(blob_preview_name(sha256))
+    return True
+
+
+def store_legacy_files():
+    """Move the files stored before content addressing into blobs; returns the number of documents moved"""
+    storage = _storage()
+    count = 0
+    for document in Document.objects.exclude(file='').exclude(file__startswith=BLOB_PREFIX + '/').iterator():
+        old_name = document.file.name
+        if not storage.exists(old_name):
+            continue
+        with storage.open(old_name, 'rb') as content:
+            name = storage.save(old_name, content)
+        # Queryset update: the counts are rebuilt by recount_references
+        Document.objects.filter(pk=document.pk, file=old_name).update(file=name)
+        if not Document.objects.filter(file=old_name).exists():
+            storage.delete(old_name)
+        count += 1
+    return count
+
+
+def recount_references():
+    """Set every ref_count from the documents; returns the number of blobs corrected"""
+    storage = _storage()
+    counts = dict(
+        Document.objects.filter(file__startswith=BLOB_PREFIX + '/')
+        .values('file').annotate(n=Count('pk')).values_list('file', 'n')
+    )
+    blobs = {blob.name: blob for blob in DocumentBlob.objects.all()}
+    corrected = 0
+    for name, n in counts.items():
+        blob = blobs.get(name)
+        if blob is None:
+            if storage.exists(name):
+                DocumentBlob.objects.create(sha256=blob_sha256(name), name=name, size=storage.size(name), ref_count=n)
+                corrected += 1
+        elif blob.ref_count != n:
+            DocumentBlob.objects.filter(pk=blob.pk).update(ref_count=n)
+            corrected += 1
+    for name, blob in blobs.items():
+        if name not in counts and blob.ref_count != 0:
+            DocumentBlob.objects.filter(pk=blob.pk).update(ref_count=0)
+            corrected += 1
+    return corrected
+
+
+def collect_unreferenced_blobs():
+    """Remove the blob files no document references, past the grace period; returns their number"""
+    root = _storage().path(BLOB_PREFIX)
+    removed = 0
+    for directory, _, files in os.walk(root):
+        for filename in files:
+            if filename.endswith('.part'):
+                continue  # Being written, see ContentAddressedStorage._save
+            name = os.path.relpath(os.path.join(directory, filename), _storage().location).replace(os.sep, '/')
+            if release_blob(name):
+                removed += 1
+    # Rows whose file is already gone
+    for name in DocumentBlob.objects.filter(ref_count__lte=0).values_list('name', flat=True):
+        if release_blob(name):
+            removed += 1
+    return removed
@@ -0,0 +1,207 @@
+"""
+Admin bulk actions run in chunks, outside the request.
+
+A bulk action creates a BulkJob row holding the action, its parameters and
+the selected ids, and returns right away. The job is then run chunk by
+chunk: each chunk is processed in its own transaction together with the
+update of the job's progress, so locks are only held for one chunk and a
+job that is interrupted resumes after the last committed chunk.
+
+Jobs are started, once the creating transaction commits, by:
+- a daemon thread of the web process (BULK_JOBS_RUNNER = 'thread', the
+  default), so no extra process is needed;
+- the run_bulk_jobs management command (BULK_JOBS_RUNNER = 'worker'),
+  run as a separate worker process (the `worker` entry of the Procfile).
+In both cases a job whose last heartbeat is older than
+BULK_JOB_STALE_SECONDS is picked up again: its runner died, e.g. a gunicorn
+worker recycled after max_requests takes its daemon threads with it. The
+worker command polls for such jobs; the thread runner resumes them after
+each job it runs.
+
+Claiming a job gives the runner a token (BulkJob.claimed_by). Every chunk
+starts by refreshing the heartbeat of the job it still owns: that UPDATE
+locks the job row until the chunk commits, so a runner trying to take the
+job over as stalled waits for the chunk and then finds a fresh heartbeat.
+A runner whose token was replaced stops without running another chunk.
+
+Queryset update() and bulk_create() do not send signals, so the actions
+invalidate the cached dashboards of the users they touch themselves.
+
+The same runner renders the document previews (generate_previews, started
+by custom_requests.signals when a document gets a new file). Other apps add
+their own actions with register_action, e.g. accounts for the profile
+picture renditions.
+"""
+
+import logging
+import threading
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from accounts.models import Utilisateur
+from .dashboard_data import invalidate_dashboards
+from .models import BulkJob, Document, Notification
+from .previews import generate_preview
+
+logger = logging.getLogger(__name__)
+
+
+def stale_after():
+    return getattr(settings, 'BULK_JOB_STALE_SECONDS', 300)
+
+
+def _delete_users(job, ids):
+    # The admin running the job is never deleted by it
+    users = Utilisateur.objects.filter(pk__in=ids).exclude(pk=job.created_by_id)
+    count = users.count()
+    # Cascades over requests, appointments, messages, documents and chat sessions
+    users.delete()
+    return count
+
+
+def _review_documents(job, ids, status):
+    documents = Document.objects.filter(pk__in=ids)
+    owners = list(documents.values_list('pk', 'name', 'uploaded_by_id'))
+    values = {'status': status, 'verified_by_id': job.created_by_id, 'verified_at': timezone.now()}
+    if status == 'rejected':
+        values['rejection_reason'] = job.params.get('rejection_reason', '')
+        title, message = "Document rejeté", "Votre document « {} » a été rejeté."
+    else:
+        title, message = "Document vérifié", "Votre document « {} » a été vérifié."
+    count = documents.update(**values)
+
+    Notification.objects.bulk_create([
+        Notification(user_id=user_id, type='document', title=title, content=message.format(name))
+        for _, name, user_id in owners
+    ])
+    invalidate_dashboards({user_id for _, _, user_id in owners})
+    return count
+
+
+def _generate_previews(job, ids):
+    return sum(generate_preview(document) for document in Document.objects.filter(pk__in=ids))
+
+
+# Action: (chunk size, function(job, ids) returning the number of objects processed)
+BULK_ACTIONS = {
+    'delete_users': (20, _delete_users),
+    'verify_documents': (500, lambda job, ids: _review_documents(job, ids, 'verified')),
+    'reject_documents': (500, lambda job, ids: _review_documents(job, ids, 'rejected')),
+    'generate_previews': (10, _generate_previews),
+}
+
+
+def register_action(action, chunk_size, function):
+    """Add a bulk action; `function(job, ids)` returns the number of objects processed."""
+    BULK_ACTIONS[action] = (chunk_size, function)
+
+
+def start_job(action, object_ids, created_by=None, **params):
+    """Create a job for a bulk action; it starts once the current transaction commits."""
+    if action not in BULK_ACTIONS:
+        raise ValueError(f'Unknown bulk action: {action}')
+    object_ids = sorted({int(object_id) for object_id in object_ids})
+    job = BulkJob.objects.create(
+        action=action, params=params, object_ids=object_ids, total=len(object_ids), created_by=created_by,
+    )
+    if getattr(settings, 'BULK_JOBS_RUNNER', 'thread') == 'thread':
+        transaction.on_commit(lambda: _start_thread(job.pk))
+    return job
+
+
+def _start_thread(job_id):
+    threading.Thread(target=_run_in_thread, args=(job_id,), name=f'bulk-job-{job_id}', daemon=True).start()
+
+
+def _run_in_thread(job_id):
+    try:
+        run_job(job_id)
+        # The jobs left behind by threads of dead processes
+        for stalled_id in stalled_jobs():
+            run_job(stalled_id)
+    finally:
+        close_old_connections()
+
+
+def _stalled_q():
+    stale = timezone.now() - timedelta(seconds=stale_after())
+    return Q(status='pending', created_at__lt=stale) | Q(status='running', updated_at__lt=stale)
+
+
+def stalled_jobs():
+    """Ids of the jobs no runner has worked on for BULK_JOB_STALE_SECONDS, oldest first."""
+    return list(BulkJob.objects.filter(_stalled_q()).order_by('created_at').values_list('pk', flat=True))
+
+
+def claim_job(job_id):
+    """Mark a pending or stalled job as running; returns the claim token, or None if another runner owns it."""
+    now = timezone.now()
+    token = uuid.uuid4().hex
+    claimable = Q(status='pending') | Q(status='running', updated_at__lt=now - timedelta(seconds=stale_after()))
+    claimed = BulkJob.objects.filter(claimable, pk=job_id).update(status='running', claimed_by=token, updated_at=now)
+    return token if claimed else None
+
+
+def run_job(job_id):
+    """Run the remaining chunks of a job; returns the job, or None if it could not be claimed or was taken over."""
+    token = claim_job(job_id)
+    if token is None:
+        return None
+    job = BulkJob.objects.get(pk=job_id)
+    owned = BulkJob.objects.filter(pk=job.pk, claimed_by=token)
+    chunk_size, action = BULK_ACTIONS[job.action]
+
+    try:
+        while job.processed < job.total:
+            ids = job.object_ids[job.processed:job.processed + chunk_size]
+            with transaction.atomic():
+                # Heartbeat, and lock on the job until the chunk commits
+                if not owned.update(updated_at=timezone.now()):
+                    logger.warning("Bulk job %s was taken over by another runner", job.pk)
+                    return None
+                succeeded = action(job, ids)
+                owned.update(
+                    processed=F('processed') + len(ids),
+                    succeeded=F('succeeded') + succeeded,
+                    updated_at=timezone.now(),
+                )
+            job.processed += len(ids)
+            job.succeeded += succeeded
+    except Exception as e:
+        logger.exception("Bulk job %s failed", job.pk)
+        owned.update(status='failed', error=str(e), finished_at=timezone.now())
+    else:
+        owned.update(status='completed', finished_at=timezone.now())
+
+    job.refresh_from_db()
+    return job
+
+
+def runnable_jobs():
+    """Ids of the pending jobs and of the running jobs without a recent heartbeat, oldest first."""
+    stale = timezone.now() - timedelta(seconds=stale_after())
+    return list(
+        BulkJob.objects.filter(Q(status='pending') | Q(status='running', updated_at__lt=stale))
+        .order_by('created_at').values_list('pk', flat=True)
+    )
+
+
+def job_progress(job):
+    """JSON-serializable progress of a job, for the progress endpoint."""
+    return {
+        'id': job.pk,
+        'action': job.action,
+        'status': job.status,
+        'total': job.total,
+        'processed': job.processed,
+        'succeeded': job.succeeded,
+        'progress': job.progress,
+        'error': job.error,
+        'created_at': job.created_at.isoformat(),
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
@@ -0,0 +1,133 @@
+"""
+Data loader for the client and expert dashboards.
+
+A cold load reads the user with their profile, UserStats row and the unread
+notification / upcoming appointment counts in one query, the recent
+notifications, requests and upcoming appointments with three sliced
+prefetches, and the recent documents with one more query. The active
+services list is shared by every dashboard and cached separately.
+
+The result is cached per user for DASHBOARD_CACHE_SECONDS (60 by default),
+so a warm dashboard needs no query at all. custom_requests.signals deletes
+the fragment after every committed write that changes what a user sees.
+Upcoming appointments depend on the current time and may therefore lag by
+up to the cache timeout.
+
+The cache must be shared by all workers (Redis, REDIS_URL): a write served
+by one worker could not delete the fragments cached in the memory of the
+others. Without REDIS_URL the settings set DASHBOARD_CACHE_SECONDS to 0 and
+every dashboard is loaded from the database.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Prefetch, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from accounts.models import Utilisateur
+from services.models import Service
+from .models import Document, Notification, RendezVous, ServiceRequest
+from .platform_stats import get_user_stats
+
+DASHBOARD_KEY = 'dashboard:user:{}'
+SERVICES_KEY = 'dashboard:services'
+
+UPCOMING_APPOINTMENT_STATUSES = ['scheduled', 'confirmed']
+
+
+def dashboard_timeout():
+    return getattr(settings, 'DASHBOARD_CACHE_SECONDS', 60)
+
+
+def _count_subquery(queryset, field):
+    """Correlated count of `queryset`, filtered on `field=OuterRef('pk')`; 0 when empty."""
+    counts = queryset.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(count=Count('pk')).values('count')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def _load(user_id, role):
+    now = timezone.now()
+    other = 'expert' if role == 'client' else 'client'
+
+    upcoming = RendezVous.objects.filter(date_time__gte=now, status__in=UPCOMING_APPOINTMENT_STATUSES)
+    user = (
+        Utilisateur.objects
+        .select_related(f'{role}_profile', 'dashboard_stats')
+        .annotate(
+            unread_notifications_count=_count_subquery(Notification.objects.filter(is_read=False), 'user'),
+            upcoming_appointments_count=_count_subquery(upcoming, role),
+        )
+        .prefetch_related(
+            Prefetch('request_notifications', to_attr='recent_notifications',
+                     queryset=Notification.objects.order_by('-created_at')[:5]),
+            Prefetch(f'{role}_requests', to_attr='recent_requests',
+                     queryset=ServiceRequest.objects.select_related(other).order_by('-created_at')[:3]),
+            Prefetch(f'{role}_rendezvous', to_attr='upcoming_appointments',
+                     queryset=upcoming.select_related(other, 'service').order_by('date_time')[:3]),
+        )
+        .get(pk=user_id)
+    )
+    # Raises Client.DoesNotExist / Expert.DoesNotExist without a profile
+    profile = getattr(user, f'{role}_profile')
+
+    try:
+        stats = user.dashboard_stats
+    except Utilisateur.dashboard_stats.RelatedObjectDoesNotExist:
+        stats = get_user_stats(user)
+
+    recent_documents = list(Document.objects.filter(
+        Q(**{f'service_request__{role}': user}) |
+        Q(**{f'rendez_vous__{role}': user}) |
+        Q(uploaded_by=user)
+    ).distinct().order_by('-upload_date')[:3])
+
+    return {
+        'profile': profile,
+        'stats': stats,
+        'notifications': user.recent_notifications,
+        'unread_notifications_count': user.unread_notifications_count,
+        'upcoming_appointments': user.upcoming_appointments,
+        'upcoming_appointments_count': user.upcoming_appointments_count,
+        'recent_requests': user.recent_requests,
+        'recent_documents': recent_documents,
+    }
+
+
+def get_dashboard_data(user, role):
+    """Dashboard data of a client or expert (`role`), from the cache when possible."""
+    if dashboard_timeout() <= 0:
+        return dict(_load(user.pk, role), role=role)
+    key = DASHBOARD_KEY.format(user.pk)
+    data = cache.get(key)
+    if data is None or data['role'] != role:
+        data = dict(_load(user.pk, role), role=role)
+        cache.set(key, data, dashboard_timeout())
+    return data
+
+
+def get_active_services():
+    """Active services with their category, shared by all dashboards."""
+    if dashboard_timeout() <= 0:
+        return list(Service.objects.filter(is_active=True).select_related('service_type__category'))
+    services = cache.get(SERVICES_KEY)
+    if services is None:
+        services = list(Service.objects.filter(is_active=True).select_related('service_type__category'))
+        cache.set(SERVICES_KEY, services, dashboard_timeout() * 5)
+    return services
+
+
+def _delete_dashboards(user_ids):
+    cache.delete_many([DASHBOARD_KEY.format(user_id) for user_id in user_ids])
+
+
+def invalidate_dashboards(user_ids):
+    """Forget the cached dashboards of some users once the transaction commits."""
+    user_ids = {user_id for user_id in user_ids if user_id}
+    if user_ids:
+        transaction.on_commit(lambda: _delete_dashboards(user_ids))
+
+
+def invalidate_services():
+    transaction.on_commit(lambda: cache.delete(SERVICES_KEY))
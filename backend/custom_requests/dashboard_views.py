@@ -6,6 +6,8 @@ from django.utils import timezone
 from accounts.models import Client, Utilisateur, Expert
 from services.models import Service, ServiceCategory
 from .models import ServiceRequest, Document, RendezVous, Notification, Message
+from .dashboard_data import get_active_services, get_dashboard_data
+from .stats import get_admin_dashboard_stats
 
 def get_service_icon(service):
     """Helper function to get appropriate icon for a service"""
@@ -54,109 +56,37 @@ def client_dashboard_view(request):
     print(f"Starting client_dashboard_view for user {request.user.email}, account_type={request.user.account_type}")
     
     try:
-        # Debug more details about the user
-        print(f"User details: id={request.user.id}, email={request.user.email}, name={request.user.name}, account_type={request.user.account_type}")
-        
-        # Check if client profile exists - using case-insensitive check for account_type
+        # Check account type - using case-insensitive check for account_type
         if request.user.account_type.lower() != 'client':
             print(f"User account type is {request.user.account_type}, not client. Redirecting to home.")
             return redirect('home')
         
-        # Check if client profile exists
-        client_exists = Client.objects.filter(user=request.user).exists()
-        print(f"Client profile exists for user: {client_exists}")
-        
-        if not client_exists:
-            # Query by email directly for debugging
-            client_by_email = Client.objects.filter(user__email=request.user.email)
-            print(f"Client profile by email check: {client_by_email.exists()}")
+        # Counters, notifications, appointments, requests and documents (cached per user)
+        try:
+            data = get_dashboard_data(request.user, 'client')
+        except Client.DoesNotExist:
             print(f"Client profile not found for user {request.user.email}, redirecting to home")
             return redirect('home')
         
-        # Get client profile
-        client_profile = Client.objects.get(user=request.user)
-        print(f"Found client profile for {client_profile}")
-        
-        # Count of active service requests
-        active_requests = ServiceRequest.objects.filter(
-            client=request.user,
-            status__in=['new', 'in_progress', 'pending_info']
-        ).count()
-        print(f"Active requests count: {active_requests}")
-        
-        # Count of completed service requests
-        completed_requests = ServiceRequest.objects.filter(
-            client=request.user,
-            status='completed'
-        ).count()
-        print(f"Completed requests count: {completed_requests}")
-        
-        # Count of documents
-        documents_count = Document.objects.filter(
-            Q(service_request__client=request.user) |
-            Q(rendez_vous__client=request.user) |
-            Q(uploaded_by=request.user)
-        ).distinct().count()
-        print(f"Documents count: {documents_count}")
-        
-        # Get recent notifications
-        notifications = Notification.objects.filter(
-            user=request.user
-        ).order_by('-created_at')[:5]
-        print(f"Retrieved {len(notifications)} notifications")
-        
-        # Count unread notifications
-        unread_notifications_count = Notification.objects.filter(
-            user=request.user,
-            is_read=False
-        ).count()
-        print(f"Unread notifications count: {unread_notifications_count}")
-        
-        # Get upcoming appointments
-        upcoming_appointments = RendezVous.objects.filter(
-            client=request.user,
-            date_time__gte=timezone.now(),
-            status__in=['scheduled', 'confirmed']
-        ).order_by('date_time')[:3]
-        print(f"Retrieved {len(upcoming_appointments)} upcoming appointments")
-        
-        # Get available services
-        available_services = Service.objects.filter(is_active=True).select_related('service_type__category')
-        print(f"Retrieved {len(available_services)} available services")
-        
         # Enrich services with icons
         services_with_icons = []
-        for service in available_services:
+        for service in get_active_services():
             service.icon = get_service_icon(service)
             services_with_icons.append(service)
         
-        # Get recent documents
-        recent_documents = Document.objects.filter(
-            Q(service_request__client=request.user) |
-            Q(rendez_vous__client=request.user) |
-            Q(uploaded_by=request.user)
-        ).distinct().order_by('-upload_date')[:3]
-        print(f"Retrieved {len(recent_documents)} recent documents")
-        
-        # Get recent service requests
-        recent_requests = ServiceRequest.objects.filter(
-            client=request.user
-        ).order_by('-created_at')[:3]
-        print(f"Retrieved {len(recent_requests)} recent requests")
-        
         # Prepare context for template
         context = {
-            'active_requests': active_requests,
-            'completed_requests': completed_requests,
-            'documents_count': documents_count,
-            'notifications': notifications,
-            'unread_notifications_count': unread_notifications_count,
-            'upcoming_appointments': upcoming_appointments,
+            'active_requests': data['stats'].requests_active,
+            'completed_requests': data['stats'].requests_completed,
+            'documents_count': data['stats'].documents_count,
+            'notifications': data['notifications'],
+            'unread_notifications_count': data['unread_notifications_count'],
+            'upcoming_appointments': data['upcoming_appointments'],
             'available_services': services_with_icons,
-            'recent_documents': recent_documents,
-            'recent_requests': recent_requests,
+            'recent_documents': data['recent_documents'],
+            'recent_requests': data['recent_requests'],
             'resources_count': 8,  # Placeholder value - replace with actual count when Resource model is available
-            'client': client_profile,
+            'client': data['profile'],
             'user': request.user
         }
         
@@ -196,108 +126,32 @@ def expert_dashboard_view(request):
         if request.user.account_type.lower() != 'expert':
             print(f"User account type is {request.user.account_type}, not expert. Redirecting to home.")
             return redirect('home')
-            
-        # Get expert profile
-        expert_profile = Expert.objects.get(user=request.user)
-        print(f"Found expert profile for {expert_profile}")
-        
-        # Count of total service requests
-        total_requests = ServiceRequest.objects.filter(
-            expert=expert_profile.user
-        ).count()
-        print(f"Total requests count: {total_requests}")
-        
-        # Count of pending service requests
-        pending_requests = ServiceRequest.objects.filter(
-            expert=expert_profile.user,
-            status__in=['new', 'pending', 'pending_info']
-        ).count()
-        print(f"Pending requests count: {pending_requests}")
-        
-        # Count of completed service requests
-        completed_requests = ServiceRequest.objects.filter(
-            expert=expert_profile.user,
-            status='completed'
-        ).count()
-        print(f"Completed requests count: {completed_requests}")
-        
-        # Count of documents
-        documents_count = Document.objects.filter(
-            Q(service_request__expert=expert_profile.user) |
-            Q(rendez_vous__expert=expert_profile.user) |
-            Q(uploaded_by=request.user)
-        ).distinct().count()
-        print(f"Documents count: {documents_count}")
-        
-        # Get recent notifications
-        notifications = Notification.objects.filter(
-            user=request.user
-        ).order_by('-created_at')[:5]
-        print(f"Retrieved {len(notifications)} notifications")
         
-        # Count unread notifications
-        unread_notifications_count = Notification.objects.filter(
-            user=request.user,
-            is_read=False
-        ).count()
-        print(f"Unread notifications count: {unread_notifications_count}")
+        # Counters, notifications, appointments, requests and documents (cached per user)
+        data = get_dashboard_data(request.user, 'expert')
+        expert_profile = data['profile']
         
-        # Get upcoming appointments
-        upcoming_appointments = RendezVous.objects.filter(
-            expert=expert_profile.user,
-            date_time__gte=timezone.now(),
-            status__in=['scheduled', 'confirmed']
-        ).order_by('date_time')[:3]
-        print(f"Retrieved {len(upcoming_appointments)} upcoming appointments")
-        
-        # Count upcoming appointments
-        upcoming_appointments_count = RendezVous.objects.filter(
-            expert=expert_profile.user,
-            date_time__gte=timezone.now(),
-            status__in=['scheduled', 'confirmed']
-        ).count()
-        print(f"Upcoming appointments count: {upcoming_appointments_count}")
-        
-        # Get services related to this expert's specialty
-        expert_services = Service.objects.filter(
-            is_active=True,
-            service_type__category__name__icontains=expert_profile.specialty
-        ).select_related('service_type__category')
-        print(f"Retrieved {len(expert_services)} expert services")
-        
-        # Enrich services with icons
+        # Services related to this expert's specialty, enriched with icons
+        specialty = expert_profile.specialty.lower()
         services_with_icons = []
-        for service in expert_services:
-            service.icon = get_service_icon(service)
-            services_with_icons.append(service)
-        
-        # Get recent documents
-        recent_documents = Document.objects.filter(
-            Q(service_request__expert=expert_profile.user) |
-            Q(rendez_vous__expert=expert_profile.user) |
-            Q(uploaded_by=request.user)
-        ).distinct().order_by('-upload_date')[:3]
-        print(f"Retrieved {len(recent_documents)} recent documents")
-        
-        # Get recent service requests
-        recent_requests = ServiceRequest.objects.filter(
-            expert=expert_profile.user
-        ).order_by('-created_at')[:3]
-        print(f"Retrieved {len(recent_requests)} recent requests")
+        for service in get_active_services():
+            if specialty in service.service_type.category.name.lower():
+                service.icon = get_service_icon(service)
+                services_with_icons.append(service)
         
         # Prepare context for template
         context = {
-            'total_requests': total_requests,
-            'pending_requests': pending_requests,
-            'completed_requests': completed_requests,
-            'upcoming_appointments': upcoming_appointments_count,
-            'documents_count': documents_count,
-            'notifications': notifications,
-            'unread_notifications_count': unread_notifications_count,
-            'upcoming_appointments_list': upcoming_appointments,
+            'total_requests': data['stats'].requests_total,
+            'pending_requests': data['stats'].requests_pending,
+            'completed_requests': data['stats'].requests_completed,
+            'upcoming_appointments': data['upcoming_appointments_count'],
+            'documents_count': data['stats'].documents_count,
+            'notifications': data['notifications'],
+            'unread_notifications_count': data['unread_notifications_count'],
+            'upcoming_appointments_list': data['upcoming_appointments'],
             'expert_services': services_with_icons,
-            'recent_documents': recent_documents,
-            'recent_requests': recent_requests,
+            'recent_documents': data['recent_documents'],
+            'recent_requests': data['recent_requests'],
             'resources_count': 8,  # Placeholder value - replace with actual count when Resource model is available
             'expert': expert_profile,
             'user': request.user
@@ -324,106 +178,41 @@ def admin_dashboard_view(request):
         return redirect('accounts:admin_login_view')
     
     try:
-        from django.db.models import Count
-        from django.utils import timezone
-        from datetime import timedelta
-        from accounts.models import Utilisateur, Client, Expert
-        from resources.models import Resource
-        from custom_requests.models import ServiceRequest, RendezVous, Document, Message
-        
-        # Get user statistics
-        total_users = Utilisateur.objects.count()
-        total_clients = Client.objects.count()
-        total_experts = Expert.objects.count()
-        total_admins = Utilisateur.objects.filter(account_type__iexact='admin').count()
-        
-        # Get service statistics
-        total_requests = ServiceRequest.objects.count()
-        pending_requests = ServiceRequest.objects.filter(status__in=['new', 'pending_info']).count()
-        completed_requests = ServiceRequest.objects.filter(status='completed').count()
-        
-        # Get appointment statistics
-        total_appointments = RendezVous.objects.count()
-        upcoming_appointments = RendezVous.objects.filter(
-            date_time__gte=timezone.now()
-        ).count()
-        
-        # Get document statistics
-        total_documents = Document.objects.count()
-        
-        # Get resource statistics
-        total_resources = Resource.objects.count()
+        stats = get_admin_dashboard_stats()
+        users = stats['users']
         
         # Get recent activity
         recent_users = Utilisateur.objects.order_by('-date_joined')[:5]
         recent_requests = ServiceRequest.objects.order_by('-created_at')[:5]
         recent_appointments = RendezVous.objects.order_by('-created_at')[:5]
         
-        # Activity by date (last 7 days)
-        today = timezone.now().date()
-        last_week = today - timedelta(days=7)
-        
-        # Daily signups for the last 7 days
-        daily_signups = []
-        for i in range(7):
-            day = last_week + timedelta(days=i+1)
-            count = Utilisateur.objects.filter(
-                date_joined__year=day.year,
-                date_joined__month=day.month,
-                date_joined__day=day.day
-            ).count()
-            daily_signups.append({'date': day.strftime('%d/%m'), 'count': count})        # Get services data for chart
-        from services.models import Service
-        service_requests = ServiceRequest.objects.values('service__title').annotate(
-            count=Count('id')
-        ).order_by('-count')[:5]
-        
-        # Rename the field for template compatibility
-        service_requests_data = [
-            {
-                'name': item['service__title'] or 'Unknown Service',
-                'count': item['count']
-            }
-            for item in service_requests        ]
-        
         context = {
             'user': request.user,
             # Direct variables for the template
-            'total_users': total_users,
-            'total_clients': total_clients,
-            'total_experts': total_experts,
-            'total_admins': total_admins,
-            'total_requests': total_requests,
-            'pending_requests': pending_requests,
-            'completed_requests': completed_requests,
-            'total_appointments': total_appointments,            'recent_users': recent_users,
+            'total_users': users['total'],
+            'total_clients': users['clients'],
+            'total_experts': users['experts'],
+            'total_admins': users['admins'],
+            'total_requests': stats['services']['total'],
+            'pending_requests': stats['services']['pending'],
+            'completed_requests': stats['services']['completed'],
+            'total_appointments': stats['appointments']['total'],
+            'recent_users': recent_users,
             'recent_requests': recent_requests,
-            'service_requests': service_requests_data,
-            'daily_signups': daily_signups,
+            'service_requests': stats['service_requests'],
+            'daily_signups': stats['daily_signups'],
             'user_type_counts': {
-                'client': total_clients,
-                'expert': total_experts,
-                'admin': total_admins
+                'client': users['clients'],
+                'expert': users['experts'],
+                'admin': users['admins']
             },
             # Keep the original structured data as well
             'stats': {
-                'users': {
-                    'total': total_users,
-                    'clients': total_clients,
-                    'experts': total_experts,
-                    'admins': total_admins
-                },
-                'services': {
-                    'total': total_requests,
-                    'pending': pending_requests,
-                    'completed': completed_requests
-                },
-                'appointments': {
-                    'total': total_appointments,
-                    'upcoming': upcoming_appointments
-                },
-                'documents': total_documents,
-                'resources': total_resources
+                'users': users,
+                'services': stats['services'],
+                'appointments': stats['appointments'],
+                'documents': stats['documents'],
+                'resources': stats['resources']
             },
             'recent': {
                 'users': recent_users,
@@ -431,7 +220,7 @@ def admin_dashboard_view(request):
                 'appointments': recent_appointments
             },
             'charts': {
-                'daily_signups': daily_signups
+                'daily_signups': stats['daily_signups']
             }
         }
         return render(request, 'admin/dashboard.html', context)
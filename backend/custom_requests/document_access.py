@@ -0,0 +1,55 @@
+"""
+Who may read a document, as one SQL condition.
+
+A client reads the documents of their requests and appointments, an expert
+those of the requests and appointments assigned to them, and both the
+documents they uploaded; admins read every document. document_access_q
+builds that condition, so a listing filters accessible documents in its own
+query and a single-document check is one query (LEFT JOINs on the request
+and the appointment, no profile or related object loaded).
+"""
+
+from django.core.exceptions import PermissionDenied
+from django.db.models import Q
+from django.http import Http404
+
+from .models import Document
+
+
+def is_document_admin(user):
+    return user.is_staff or (user.account_type or '').lower() == 'admin'
+
+
+def document_access_q(user):
+    """Condition on Document matching the documents `user` may read"""
+    if not user.is_authenticated:
+        return Q(pk__in=[])
+    if is_document_admin(user):
+        return Q()
+    account_type = (user.account_type or '').lower()
+    if account_type == 'client':
+        return Q(service_request__client_id=user.pk) | Q(rendez_vous__client_id=user.pk) | Q(uploaded_by_id=user.pk)
+    if account_type == 'expert':
+        return Q(service_request__expert_id=user.pk) | Q(rendez_vous__expert_id=user.pk) | Q(uploaded_by_id=user.pk)
+    return Q(pk__in=[])
+
+
+def accessible_documents(user, queryset=None):
+    """Documents of `queryset` (all by default) that `user` may read"""
+    queryset = Document.objects.all() if queryset is None else queryset
+    return queryset.filter(document_access_q(user))
+
+
+def can_access_document(user, document_id):
+    return accessible_documents(user).filter(pk=document_id).exists()
+
+
+def get_accessible_document(user, document_id):
+    """The document if `user` may read it, in one query; Http404 or PermissionDenied otherwise"""
+    document = accessible_documents(user).filter(pk=document_id).first()
+    if document is None:
+        # Only failures pay for telling a missing document from a forbidden one
+        if Document.objects.filter(pk=document_id).exists():
+            raise PermissionDenied("You don't have permission to access this document.")
+        raise Http404("Document not found.")
+    return document
@@ -10,6 +10,7 @@ import json
 
 from accounts.models import Utilisateur, Expert, Client
 from custom_requests.models import ServiceRequest, Document, RendezVous, Message, Notification
+from custom_requests.document_access import accessible_documents
 from services.email_notifications import EmailNotificationService
 
 @login_required
@@ -21,12 +22,8 @@ def expert_documents_view(request):
     try:
         expert = Expert.objects.get(user=request.user)
         
-        # Get documents associated with this expert
-        documents = Document.objects.filter(
-            Q(service_request__expert=expert.user) |
-            Q(rendez_vous__expert=expert.user) |
-            Q(uploaded_by=request.user)
-        ).distinct().order_by('-upload_date')
+        # Get documents associated with this expert (same policy as downloads)
+        documents = accessible_documents(request.user).order_by('-upload_date')
         
         # Get this expert's requests for the dropdown
         my_requests = ServiceRequest.objects.filter(expert=expert.user).order_by('-created_at')
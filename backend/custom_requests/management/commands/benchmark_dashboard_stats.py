@@ -0,0 +1,74 @@
+"""
+Django management command comparing the admin dashboard statistics service
+with the previous one-count()-per-figure implementation (queries and time).
+"""
+
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from accounts.models import Client, Expert, Utilisateur
+from resources.models import Resource
+from custom_requests.models import Document, RendezVous, ServiceRequest
+from custom_requests.stats import get_admin_dashboard_stats
+
+
+def legacy_admin_stats():
+    """Previous implementation: one count() per figure and per day."""
+    stats = {
+        'users': Utilisateur.objects.count(),
+        'clients': Client.objects.count(),
+        'experts': Expert.objects.count(),
+        'admins': Utilisateur.objects.filter(account_type__iexact='admin').count(),
+        'requests': ServiceRequest.objects.count(),
+        'pending': ServiceRequest.objects.filter(status__in=['new', 'pending_info']).count(),
+        'completed': ServiceRequest.objects.filter(status='completed').count(),
+        'appointments': RendezVous.objects.count(),
+        'upcoming': RendezVous.objects.filter(date_time__gte=timezone.now()).count(),
+        'documents': Document.objects.count(),
+        'resources': Resource.objects.count(),
+    }
+    last_week = timezone.now().date() - timedelta(days=7)
+    stats['daily_signups'] = []
+    for i in range(7):
+        day = last_week + timedelta(days=i + 1)
+        stats['daily_signups'].append(Utilisateur.objects.filter(
+            date_joined__year=day.year, date_joined__month=day.month, date_joined__day=day.day
+        ).count())
+    stats['service_requests'] = list(
+        ServiceRequest.objects.values('service__title').annotate(count=Count('id')).order_by('-count')[:5]
+    )
+    return stats
+
+
+class Command(BaseCommand):
+    help = "Measures the queries and time spent computing the admin dashboard statistics"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50,
+                            help='Number of times each implementation is run')
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        implementations = [
+            ('count() per figure (old)', legacy_admin_stats),
+            ('stats service (new)', get_admin_dashboard_stats),
+        ]
+
+        for label, compute in implementations:
+            with CaptureQueriesContext(connection) as queries:
+                compute()
+
+            start = time.perf_counter()
+            for _ in range(iterations):
+                compute()
+            elapsed = time.perf_counter() - start
+
+            self.stdout.write(
+                f'{label}: {len(queries)} queries, {elapsed * 1000 / iterations:.2f} ms per dashboard'
+            )
@@ -0,0 +1,43 @@
+"""
+Django management command exporting an admin listing (requests, users,
+documents, appointments) to CSV or XLSX, for exports too large to be
+downloaded within the web server timeout (see custom_requests.admin_export).
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from custom_requests.admin_export import CHUNK_SIZE, EXPORT_FORMATS, EXPORTS, iter_export
+
+
+def filter_option(value):
+    name, sep, filter_value = value.partition('=')
+    if not sep or not name:
+        raise CommandError(f'Invalid filter "{value}", expected name=value')
+    return name, filter_value
+
+
+class Command(BaseCommand):
+    help = "Streams a filtered admin listing to a CSV or XLSX file without loading it in memory"
+
+    def add_arguments(self, parser):
+        parser.add_argument('listing', choices=list(EXPORTS), help='Listing to export')
+        parser.add_argument('--format', dest='export_format', choices=list(EXPORT_FORMATS), default='csv',
+                            help='Output format (csv by default)')
+        parser.add_argument('--filter', dest='filters', type=filter_option, action='append', default=[],
+                            help='Listing filter, as in its URL query (e.g. --filter status=completed); repeatable')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                            help='Number of rows read and written per chunk')
+        parser.add_argument('--output', required=True, help='Output file')
+
+    def handle(self, *args, **options):
+        chunks = iter_export(options['listing'], options['export_format'], dict(options['filters']),
+                             chunk_size=options['chunk_size'])
+
+        if options['export_format'] == 'csv':
+            output = open(options['output'], 'w', encoding='utf-8', newline='')
+        else:
+            output = open(options['output'], 'wb')
+        with output:
+            for chunk in chunks:
+                output.write(chunk)
+        self.stdout.write(self.style.SUCCESS(f"Export written to {options['output']}"))
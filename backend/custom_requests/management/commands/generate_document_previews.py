@@ -0,0 +1,23 @@
+"""
+Django management command rendering the missing document previews (see
+custom_requests.previews), e.g. for the documents uploaded before previews
+existed.
+"""
+
+from django.core.management.base import BaseCommand
+
+from custom_requests.models import Document
+from custom_requests.previews import generate_preview, previewable
+
+
+class Command(BaseCommand):
+    help = "Renders the previews of the documents that have none"
+
+    def handle(self, *args, **options):
+        count = rendered = 0
+        for document in Document.objects.exclude(file='').filter(preview='').iterator():
+            # Documents sharing a file reuse the preview rendered for the first one
+            if previewable(document):
+                count += 1
+                rendered += generate_preview(document)
+        self.stdout.write(self.style.SUCCESS(f"{rendered} of {count} previews rendered"))
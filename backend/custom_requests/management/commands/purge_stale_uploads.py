@@ -0,0 +1,22 @@
+"""
+Django management command deleting the chunked uploads abandoned before
+completion and their part files (see custom_requests.uploads).
+"""
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from custom_requests.uploads import purge_stale_uploads
+
+
+class Command(BaseCommand):
+    help = "Deletes the unfinished chunked uploads inactive for a while, with their temporary files"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=24,
+                            help='Inactivity after which an upload is abandoned (24 by default)')
+
+    def handle(self, *args, **options):
+        count = purge_stale_uploads(timedelta(hours=options['hours']))
+        self.stdout.write(self.style.SUCCESS(f"{count} abandoned uploads deleted"))
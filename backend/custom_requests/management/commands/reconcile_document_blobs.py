@@ -0,0 +1,31 @@
+"""
+Django management command reconciling the content-addressed document files
+(see custom_requests.storage) with the documents (to run periodically, e.g.
+nightly cron).
+"""
+
+from django.core.management.base import BaseCommand
+
+from custom_requests.blobs import collect_unreferenced_blobs, recount_references, store_legacy_files
+
+
+class Command(BaseCommand):
+    help = "Recounts the document blob references and deletes the blobs no document uses"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--store-legacy', action='store_true',
+                            help='First move the files stored before content addressing into blobs')
+
+    def handle(self, *args, **options):
+        if options['store_legacy']:
+            count = store_legacy_files()
+            self.stdout.write(f'{count} legacy document files moved into blobs')
+
+        corrected = recount_references()
+        if corrected:
+            self.stdout.write(self.style.WARNING(f'{corrected} blob reference counts corrected'))
+        else:
+            self.stdout.write('Blob reference counts were up to date')
+
+        removed = collect_unreferenced_blobs()
+        self.stdout.write(self.style.SUCCESS(f'{removed} unreferenced blobs deleted'))
@@ -0,0 +1,31 @@
+"""
+Django management command running the pending admin bulk jobs and resuming
+the stalled ones (see custom_requests.bulk_jobs). Runs as a worker process,
+or once (e.g. from cron) with --once.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from custom_requests.bulk_jobs import run_job, runnable_jobs
+
+
+class Command(BaseCommand):
+    help = "Runs the pending and stalled admin bulk jobs, chunk by chunk"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Run the jobs waiting now, then exit')
+        parser.add_argument('--interval', type=float, default=2,
+                            help='Seconds between two polls when idle (2 by default)')
+
+    def handle(self, *args, **options):
+        while True:
+            for job_id in runnable_jobs():
+                job = run_job(job_id)
+                if job is not None:
+                    self.stdout.write(f"Job {job.pk} ({job.action}): {job.status}, {job.succeeded}/{job.total}")
+            if options['once']:
+                return
+            time.sleep(options['interval'])
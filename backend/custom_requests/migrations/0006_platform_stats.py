@@ -0,0 +1,52 @@
+# Generated by Django 4.2 on 2026-10-19 01:28
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_remove_expert_country'),
+        ('custom_requests', '0005_document_rejection_reason_document_status_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlatformStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('users_total', models.IntegerField(default=0)),
+                ('users_clients', models.IntegerField(default=0)),
+                ('users_experts', models.IntegerField(default=0)),
+                ('users_admins', models.IntegerField(default=0)),
+                ('requests_total', models.IntegerField(default=0)),
+                ('requests_pending', models.IntegerField(default=0)),
+                ('requests_completed', models.IntegerField(default=0)),
+                ('appointments_total', models.IntegerField(default=0)),
+                ('documents_total', models.IntegerField(default=0)),
+                ('reconciled_at', models.DateTimeField(blank=True, null=True, verbose_name='reconciled at')),
+            ],
+            options={
+                'verbose_name': 'platform statistics',
+                'verbose_name_plural': 'platform statistics',
+            },
+        ),
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='dashboard_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('requests_total', models.IntegerField(default=0)),
+                ('requests_active', models.IntegerField(default=0)),
+                ('requests_pending', models.IntegerField(default=0)),
+                ('requests_completed', models.IntegerField(default=0)),
+                ('documents_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='updated at')),
+            ],
+            options={
+                'verbose_name': 'user statistics',
+                'verbose_name_plural': 'user statistics',
+            },
+        ),
+    ]
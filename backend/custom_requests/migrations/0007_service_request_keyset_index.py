@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-19 01:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('custom_requests', '0006_platform_stats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='servicerequest',
+            index=models.Index(fields=['-created_at', 'id'], name='request_created_keyset_idx'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2 on 2026-10-19 02:10
+
+from django.db import migrations
+
+# Django compiles `icontains` to UPPER(column::text) LIKE UPPER(%s) on
+# PostgreSQL, so the trigram indexes are built on that expression.
+TRIGRAM_INDEXES = {
+    'accounts_utilisateur': ('email', 'name', 'first_name', 'phone'),
+    'custom_requests_servicerequest': ('title', 'description'),
+    'custom_requests_document': ('name', 'reference_number', 'type'),
+    'custom_requests_rendezvous': ('notes',),
+    'services_service': ('title',),
+}
+
+
+def _index_name(table, column):
+    return f'{table}_{column}_trgm'
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table, columns in TRIGRAM_INDEXES.items():
+        for column in columns:
+            schema_editor.execute(
+                f'CREATE INDEX IF NOT EXISTS "{_index_name(table, column)}" '
+                f'ON "{table}" USING gin (UPPER(("{column}")::text) gin_trgm_ops)'
+            )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, columns in TRIGRAM_INDEXES.items():
+        for column in columns:
+            schema_editor.execute(f'DROP INDEX IF EXISTS "{_index_name(table, column)}"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_remove_expert_country'),
+        ('services', '0003_merge_20250703_0951'),
+        ('custom_requests', '0007_service_request_keyset_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
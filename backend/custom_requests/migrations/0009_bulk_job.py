@@ -0,0 +1,39 @@
+# Generated by Django 4.2 on 2026-10-19 01:41
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('custom_requests', '0008_admin_search_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BulkJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(max_length=50, verbose_name='action')),
+                ('params', models.JSONField(blank=True, default=dict, verbose_name='parameters')),
+                ('object_ids', models.JSONField(default=list, verbose_name='object ids')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=20, verbose_name='status')),
+                ('total', models.IntegerField(default=0, verbose_name='total')),
+                ('processed', models.IntegerField(default=0, verbose_name='processed')),
+                ('succeeded', models.IntegerField(default=0, verbose_name='succeeded')),
+                ('error', models.TextField(blank=True, verbose_name='error')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='created at')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='updated at')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='finished at')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='bulk_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'bulk job',
+                'verbose_name_plural': 'bulk jobs',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
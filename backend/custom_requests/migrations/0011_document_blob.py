@@ -0,0 +1,33 @@
+# Generated by Django 4.2 on 2026-10-19 01:48
+
+import custom_requests.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('custom_requests', '0010_upload_session'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentBlob',
+            fields=[
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='SHA-256')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='storage name')),
+                ('size', models.BigIntegerField(default=0, verbose_name='size in bytes')),
+                ('ref_count', models.IntegerField(default=0, verbose_name='reference count')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='created at')),
+            ],
+            options={
+                'verbose_name': 'document blob',
+                'verbose_name_plural': 'document blobs',
+            },
+        ),
+        migrations.AlterField(
+            model_name='document',
+            name='file',
+            field=models.FileField(storage=custom_requests.storage.ContentAddressedStorage(), upload_to='documents/%Y/%m/', verbose_name='file'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-19 01:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('custom_requests', '0011_document_blob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='preview',
+            field=models.FileField(blank=True, upload_to='previews/', verbose_name='preview'),
+        ),
+    ]
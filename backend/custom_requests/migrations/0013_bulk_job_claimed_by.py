@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-19 02:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('custom_requests', '0012_document_preview'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bulkjob',
+            name='claimed_by',
+            field=models.CharField(blank=True, max_length=32, verbose_name='claimed by'),
+        ),
+    ]
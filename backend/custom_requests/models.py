@@ -1,7 +1,10 @@
+import uuid
+
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 from accounts.models import Utilisateur
 from services.models import Service
+from .storage import ContentAddressedStorage
 
 DOCUMENT_TYPES = (
     ('identity', _('Identity Document')),
@@ -49,6 +52,10 @@ class ServiceRequest(models.Model):
         verbose_name = _('service request')
         verbose_name_plural = _('service requests')
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of the admin listing, see custom_requests.pagination
+            models.Index(fields=['-created_at', 'id'], name='request_created_keyset_idx'),
+        ]
 
 class RendezVous(models.Model):
     """Model for appointments between clients and experts"""
@@ -105,10 +112,13 @@ class Document(models.Model):
     is_official = models.BooleanField(_('is official document'), default=False)
     reference_number = models.CharField(_('reference number'), max_length=100, blank=True)
     name = models.CharField(_('name'), max_length=255)
-    file = models.FileField(_('file'), upload_to='documents/%Y/%m/')
+    # Stored once per content, see custom_requests.storage
+    file = models.FileField(_('file'), upload_to='documents/%Y/%m/', storage=ContentAddressedStorage())
     mime_type = models.CharField(_('MIME type'), max_length=100, blank=True)
     file_size = models.IntegerField(_('file size in KB'), blank=True, null=True)
     upload_date = models.DateTimeField(_('upload date'), auto_now_add=True)
+    # Thumbnail generated in the background, see custom_requests.previews
+    preview = models.FileField(_('preview'), upload_to='previews/', blank=True)
     
     def __str__(self):
         return self.name
@@ -236,3 +246,124 @@ class ContactMessage(models.Model):
         verbose_name = _('contact message')
         verbose_name_plural = _('contact messages')
         ordering = ['-created_at']
+
+class PlatformStats(models.Model):
+    """Platform-wide dashboard counters (single row), see custom_requests.platform_stats"""
+    users_total = models.IntegerField(default=0)
+    users_clients = models.IntegerField(default=0)
+    users_experts = models.IntegerField(default=0)
+    users_admins = models.IntegerField(default=0)
+    requests_total = models.IntegerField(default=0)
+    requests_pending = models.IntegerField(default=0)
+    requests_completed = models.IntegerField(default=0)
+    appointments_total = models.IntegerField(default=0)
+    documents_total = models.IntegerField(default=0)
+    reconciled_at = models.DateTimeField(_('reconciled at'), null=True, blank=True)
+    
+    def __str__(self):
+        return f"Platform stats (reconciled {self.reconciled_at})"
+    
+    class Meta:
+        verbose_name = _('platform statistics')
+        verbose_name_plural = _('platform statistics')
+
+class UserStats(models.Model):
+    """Dashboard counters of a client or expert, see custom_requests.platform_stats"""
+    user = models.OneToOneField(Utilisateur, on_delete=models.CASCADE, primary_key=True, related_name='dashboard_stats')
+    requests_total = models.IntegerField(default=0)
+    requests_active = models.IntegerField(default=0)
+    requests_pending = models.IntegerField(default=0)
+    requests_completed = models.IntegerField(default=0)
+    documents_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(_('updated at'), auto_now=True)
+    
+    def __str__(self):
+        return f"Stats for {self.user_id}"
+    
+    class Meta:
+        verbose_name = _('user statistics')
+        verbose_name_plural = _('user statistics')
+
+class BulkJob(models.Model):
+    """Admin bulk action run in chunks in the background, see custom_requests.bulk_jobs"""
+    
+    STATUS_CHOICES = (
+        ('pending', _('Pending')),
+        ('running', _('Running')),
+        ('completed', _('Completed')),
+        ('failed', _('Failed')),
+    )
+    
+    action = models.CharField(_('action'), max_length=50)
+    params = models.JSONField(_('parameters'), default=dict, blank=True)
+    object_ids = models.JSONField(_('object ids'), default=list)
+    status = models.CharField(_('status'), max_length=20, choices=STATUS_CHOICES, default='pending')
+    total = models.IntegerField(_('total'), default=0)
+    processed = models.IntegerField(_('processed'), default=0)
+    succeeded = models.IntegerField(_('succeeded'), default=0)
+    error = models.TextField(_('error'), blank=True)
+    created_by = models.ForeignKey(Utilisateur, on_delete=models.SET_NULL, null=True, blank=True, related_name='bulk_jobs')
+    created_at = models.DateTimeField(_('created at'), auto_now_add=True)
+    # Token of the runner working on the job; a runner that lost it stops
+    claimed_by = models.CharField(_('claimed by'), max_length=32, blank=True)
+    # Heartbeat: updated around every chunk, used to detect stalled jobs
+    updated_at = models.DateTimeField(_('updated at'), auto_now=True)
+    finished_at = models.DateTimeField(_('finished at'), null=True, blank=True)
+    
+    def __str__(self):
+        return f"{self.action} ({self.processed}/{self.total}, {self.status})"
+    
+    @property
+    def progress(self):
+        return 100 if not self.total else round(100 * self.processed / self.total)
+    
+    class Meta:
+        verbose_name = _('bulk job')
+        verbose_name_plural = _('bulk jobs')
+        ordering = ['-created_at']
+
+class UploadSession(models.Model):
+    """Resumable chunked upload of a document file, see custom_requests.uploads"""
+    
+    STATUS_CHOICES = (
+        ('uploading', _('Uploading')),
+        ('completed', _('Completed')),
+    )
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(Utilisateur, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(_('file name'), max_length=255)
+    content_type = models.CharField(_('content type'), max_length=100, blank=True)
+    size = models.BigIntegerField(_('size in bytes'))
+    # Bytes received and committed so far: the next chunk starts there
+    offset = models.BigIntegerField(_('offset'), default=0)
+    sha256 = models.CharField(_('SHA-256'), max_length=64, blank=True)
+    # Fields of the Document created on completion (name, type, service_request_id, ...)
+    metadata = models.JSONField(_('metadata'), default=dict, blank=True)
+    document = models.ForeignKey(Document, on_delete=models.SET_NULL, null=True, blank=True, related_name='upload_sessions')
+    status = models.CharField(_('status'), max_length=20, choices=STATUS_CHOICES, default='uploading')
+    created_at = models.DateTimeField(_('created at'), auto_now_add=True)
+    updated_at = models.DateTimeField(_('updated at'), auto_now=True)
+    
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size})"
+    
+    class Meta:
+        verbose_name = _('upload session')
+        verbose_name_plural = _('upload sessions')
+
+class DocumentBlob(models.Model):
+    """File content shared by the documents that have the same SHA-256, see custom_requests.storage"""
+    sha256 = models.CharField(_('SHA-256'), max_length=64, primary_key=True)
+    name = models.CharField(_('storage name'), max_length=255, unique=True)
+    size = models.BigIntegerField(_('size in bytes'), default=0)
+    # Number of documents whose file is this blob
+    ref_count = models.IntegerField(_('reference count'), default=0)
+    created_at = models.DateTimeField(_('created at'), auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} references)"
+    
+    class Meta:
+        verbose_name = _('document blob')
+        verbose_name_plural = _('document blobs')
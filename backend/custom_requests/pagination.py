@@ -0,0 +1,94 @@
+"""
+Keyset (seek) pagination for the admin listings.
+
+Rows are ordered by (-field, pk) and a page is addressed by an opaque cursor
+holding the (field, pk) of the row it starts after (or ends before). Each
+page is a single indexed range scan: unlike OFFSET, deep pages are as fast
+as the first one and no COUNT query is needed. The price is that pages have
+no number; listings show previous / next links and take their total from
+their own statistics.
+"""
+
+import base64
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+def encode_cursor(value, pk):
+    raw = f'{value.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(value, pk) of a cursor; None if it is missing or malformed."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        value, pk = raw.rsplit('|', 1)
+        value, pk = parse_datetime(value), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+    return (value, pk) if value is not None else None
+
+
+class KeysetPage:
+    """A page of rows with the cursors of its neighbours."""
+
+    def __init__(self, object_list, field, has_next, has_previous):
+        self.object_list = object_list
+        self.field = field
+        self.has_next = has_next
+        self.has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def _cursor(self, item):
+        return encode_cursor(getattr(item, self.field), item.pk)
+
+    @property
+    def next_cursor(self):
+        return self._cursor(self.object_list[-1]) if self.has_next else None
+
+    @property
+    def previous_cursor(self):
+        return self._cursor(self.object_list[0]) if self.has_previous else None
+
+
+class KeysetPaginator:
+    """Pages of `queryset` ordered by (-field, pk)."""
+
+    def __init__(self, queryset, per_page=10, field='created_at'):
+        self.queryset = queryset.order_by(f'-{field}', 'pk')
+        self.per_page = per_page
+        self.field = field
+
+    def page(self, after=None, before=None):
+        """The page following cursor `after`, or preceding cursor `before`; the first page otherwise."""
+        field = self.field
+        position = decode_cursor(after)
+        if position is not None:
+            value, pk = position
+            rows = self.queryset.filter(Q(**{f'{field}__lt': value}) | Q(**{field: value, 'pk__gt': pk}))
+            items = list(rows[:self.per_page + 1])
+            return KeysetPage(items[:self.per_page], field, len(items) > self.per_page, True)
+
+        position = decode_cursor(before)
+        if position is not None:
+            value, pk = position
+            rows = self.queryset.filter(
+                Q(**{f'{field}__gt': value}) | Q(**{field: value, 'pk__lt': pk})
+            ).order_by(field, '-pk')
+            items = list(rows[:self.per_page + 1])
+            return KeysetPage(items[:self.per_page][::-1], field, True, len(items) > self.per_page)
+
+        items = list(self.queryset[:self.per_page + 1])
+        return KeysetPage(items[:self.per_page], field, len(items) > self.per_page, False)
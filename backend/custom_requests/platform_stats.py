@@ -0,0 +1,224 @@
+"""
+Materialized dashboard statistics.
+
+PlatformStats is a single row of platform-wide counters and UserStats holds
+one row of counters per client or expert. Both are kept up to date by the
+post_save / post_delete receivers in custom_requests.signals:
+
+- PlatformStats is updated with F() deltas. Each tracked instance remembers
+  the fields that matter when it is loaded (post_init), so a save only
+  applies the difference between its old and new contribution;
+- the UserStats rows of the users touched by a change (client, expert or
+  uploader, before and after the change) are recomputed.
+
+Both updates run after the transaction commits. Queryset update() and raw
+SQL bypass the signals, so `reconcile_platform_stats` recomputes everything
+from scratch and should run periodically (e.g. nightly cron).
+
+Counters that depend on the current time, such as upcoming appointments,
+cannot be maintained this way and are still counted on read.
+"""
+
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from accounts.models import Client, Expert, Utilisateur
+from .models import Document, PlatformStats, RendezVous, ServiceRequest, UserStats
+
+PLATFORM_STATS_PK = 1
+
+PENDING_REQUEST_STATUSES = ['new', 'pending_info']
+ACTIVE_REQUEST_STATUSES = ['new', 'in_progress', 'pending_info']
+EXPERT_PENDING_REQUEST_STATUSES = ['new', 'pending', 'pending_info']
+
+# Fields (attnames) whose value determines the contribution of an instance.
+# Clients and experts are counted by profile, whatever the account type says.
+TRACKED_FIELDS = {
+    Utilisateur: ('account_type',),
+    Client: (),
+    Expert: (),
+    ServiceRequest: ('status', 'client_id', 'expert_id'),
+    RendezVous: ('client_id', 'expert_id'),
+    Document: ('uploaded_by_id', 'service_request_id', 'rendez_vous_id'),
+}
+
+
+def _user_contribution(values):
+    account_type = (values['account_type'] or '').lower()
+    return {
+        'users_total': 1,
+        'users_admins': int(account_type == 'admin'),
+    }
+
+
+def _request_contribution(values):
+    return {
+        'requests_total': 1,
+        'requests_pending': int(values['status'] in PENDING_REQUEST_STATUSES),
+        'requests_completed': int(values['status'] == 'completed'),
+    }
+
+
+CONTRIBUTIONS = {
+    Utilisateur: _user_contribution,
+    Client: lambda values: {'users_clients': 1},
+    Expert: lambda values: {'users_experts': 1},
+    ServiceRequest: _request_contribution,
+    RendezVous: lambda values: {'appointments_total': 1},
+    Document: lambda values: {'documents_total': 1},
+}
+
+
+def tracked_values(instance):
+    """Current values of the tracked fields; deferred fields are left out."""
+    return {
+        attname: instance.__dict__[attname]
+        for attname in TRACKED_FIELDS[type(instance)]
+        if attname in instance.__dict__
+    }
+
+
+def _apply_delta(delta):
+    delta = {field: value for field, value in delta.items() if value}
+    if delta:
+        PlatformStats.objects.filter(pk=PLATFORM_STATS_PK).update(
+            **{field: F(field) + value for field, value in delta.items()}
+        )
+
+
+def _affected_users(instance, values):
+    """Users whose UserStats depend on an instance with these tracked values."""
+    if isinstance(instance, Utilisateur):
+        return {instance.pk}
+    if isinstance(instance, Document):
+        user_ids = {values.get('uploaded_by_id')}
+        if values.get('service_request_id'):
+            user_ids.update(*ServiceRequest.objects.filter(pk=values['service_request_id']).values_list('client_id', 'expert_id'))
+        if values.get('rendez_vous_id'):
+            user_ids.update(*RendezVous.objects.filter(pk=values['rendez_vous_id']).values_list('client_id', 'expert_id'))
+        return user_ids
+    return {values.get('client_id'), values.get('expert_id')}
+
+
+def instance_changed(instance, created=False, deleted=False):
+    """Record the effect of a saved or deleted instance on the statistics.
+
+    Returns the ids of the users whose dashboards show this instance.
+    """
+    contribution = CONTRIBUTIONS[type(instance)]
+    new = tracked_values(instance)
+    # Fields that were deferred when the instance was loaded are assumed unchanged
+    old = {**new, **getattr(instance, '_stats_values', {})}
+
+    if deleted:
+        delta = {field: -value for field, value in contribution(old).items()}
+        user_ids = _affected_users(instance, old)
+    elif created:
+        delta = contribution(new)
+        user_ids = _affected_users(instance, new)
+    elif old == new:
+        delta = {}
+        user_ids = _affected_users(instance, new)
+    else:
+        before, after = contribution(old), contribution(new)
+        delta = {field: after[field] - before[field] for field in after}
+        user_ids = _affected_users(instance, old) | _affected_users(instance, new)
+
+    instance._stats_values = new
+    user_ids.discard(None)
+    if any(delta.values()):
+        transaction.on_commit(lambda: _apply_delta(delta))
+    if user_ids and (created or deleted or old != new):
+        # Users deleted in the meantime are skipped
+        transaction.on_commit(lambda: refresh_user_stats(user_ids))
+    return user_ids
+
+
+def compute_user_stats(user_id, account_type):
+    """Counters of a client or expert; None for other account types."""
+    account_type = (account_type or '').lower()
+    if account_type not in ('client', 'expert'):
+        return None
+    role = account_type
+
+    requests = ServiceRequest.objects.filter(**{role: user_id}).aggregate(
+        requests_total=Count('pk'),
+        requests_active=Count('pk', filter=Q(status__in=ACTIVE_REQUEST_STATUSES)),
+        requests_pending=Count('pk', filter=Q(status__in=EXPERT_PENDING_REQUEST_STATUSES)),
+        requests_completed=Count('pk', filter=Q(status='completed')),
+    )
+    requests['documents_count'] = Document.objects.filter(
+        Q(**{f'service_request__{role}': user_id}) |
+        Q(**{f'rendez_vous__{role}': user_id}) |
+        Q(uploaded_by=user_id)
+    ).distinct().count()
+    return requests
+
+
+def refresh_user_stats(user_ids):
+    """Recompute the UserStats rows of some users."""
+    for user_id, account_type in Utilisateur.objects.filter(pk__in=user_ids).values_list('pk', 'account_type'):
+        values = compute_user_stats(user_id, account_type)
+        if values is None:
+            UserStats.objects.filter(user_id=user_id).delete()
+        else:
+            UserStats.objects.update_or_create(user_id=user_id, defaults=values)
+
+
+def get_user_stats(user):
+    """UserStats row of a client or expert, computed on first use."""
+    stats = UserStats.objects.filter(user=user).first()
+    if stats is None:
+        values = compute_user_stats(user.pk, user.account_type)
+        if values is None:
+            return None
+        stats, _ = UserStats.objects.update_or_create(user=user, defaults=values)
+    return stats
+
+
+def compute_platform_stats():
+    """Platform-wide counters, counted from scratch."""
+    values = Utilisateur.objects.aggregate(
+        users_total=Count('pk'),
+        users_admins=Count('pk', filter=Q(account_type__iexact='admin')),
+    )
+    values['users_clients'] = Client.objects.count()
+    values['users_experts'] = Expert.objects.count()
+    values.update(ServiceRequest.objects.aggregate(
+        requests_total=Count('pk'),
+        requests_pending=Count('pk', filter=Q(status__in=PENDING_REQUEST_STATUSES)),
+        requests_completed=Count('pk', filter=Q(status='completed')),
+    ))
+    values['appointments_total'] = RendezVous.objects.count()
+    values['documents_total'] = Document.objects.count()
+    return values
+
+
+def reconcile_platform_stats():
+    """Rewrite the PlatformStats row from scratch; returns it."""
+    values = compute_platform_stats()
+    values['reconciled_at'] = timezone.now()
+    stats, _ = PlatformStats.objects.update_or_create(pk=PLATFORM_STATS_PK, defaults=values)
+    return stats
+
+
+def reconcile_user_stats():
+    """Recompute the UserStats rows of every client and expert; returns the number of rows."""
+    users = Utilisateur.objects.filter(
+        Q(account_type__iexact='client') | Q(account_type__iexact='expert')
+    ).values_list('pk', 'account_type')
+    count = 0
+    for user_id, account_type in users.iterator(chunk_size=500):
+        UserStats.objects.update_or_create(user_id=user_id, defaults=compute_user_stats(user_id, account_type))
+        count += 1
+    # Rows of users who are no longer clients or experts
+    UserStats.objects.exclude(
+        Q(user__account_type__iexact='client') | Q(user__account_type__iexact='expert')
+    ).delete()
+    return count
+
+
+def get_platform_stats():
+    """The PlatformStats row, built on first use."""
+    return PlatformStats.objects.filter(pk=PLATFORM_STATS_PK).first() or reconcile_platform_stats()
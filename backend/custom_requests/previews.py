@@ -0,0 +1,120 @@
+"""
+Thumbnails of the uploaded documents, shown in the document lists instead
+of generic icons or full-size originals.
+
+A preview job (the generate_previews bulk action, see
+custom_requests.bulk_jobs) is started when a document gets a new file; its
+web request does no image work. The job renders a JPEG of at most
+PREVIEW_SIZE pixels:
+- images are decoded and scaled down with Pillow;
+- the first page of a PDF is rasterized with pdftoppm (poppler-utils) when
+  it is installed, Pillow cannot read PDFs. Without it PDFs keep their icon.
+Other types, and files that cannot be decoded, have no preview.
+
+Previews are stored in the default storage and named after the document's
+blob (custom_requests.storage), so documents sharing a file share their
+preview too; they are served by the document_preview view.
+"""
+
+import io
+import logging
+import mimetypes
+import os
+import shutil
+import subprocess
+import tempfile
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from .models import Document
+from .storage import blob_sha256
+
+logger = logging.getLogger(__name__)
+
+PDF_RASTER_TIMEOUT = 30
+
+
+def preview_size():
+    return getattr(settings, 'PREVIEW_SIZE', 320)
+
+
+def document_mime_type(document):
+    return document.mime_type or mimetypes.guess_type(document.name)[0] or ''
+
+
+def previewable(document):
+    mime_type = document_mime_type(document)
+    return mime_type.startswith('image/') or (mime_type == 'application/pdf' and shutil.which('pdftoppm') is not None)
+
+
+def blob_preview_name(sha256):
+    return f'previews/{sha256[:2]}/{sha256}.jpg'
+
+
+def preview_name(document):
+    sha256 = blob_sha256(document.file.name)
+    if sha256:
+        return blob_preview_name(sha256)
+    return f'previews/documents/{document.pk}.jpg'
+
+
+def _thumbnail(image):
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((preview_size(), preview_size()))
+    if image.mode != 'RGB':
+        background = Image.new('RGB', image.size, 'white')
+        image = image.convert('RGBA')
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    output = io.BytesIO()
+    image.save(output, 'JPEG', quality=80, optimize=True)
+    return output.getvalue()
+
+
+def _render_image(document):
+    with document.file.open('rb') as f, Image.open(f) as image:
+        return _thumbnail(image)
+
+
+def _render_pdf(document):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        output = os.path.join(temp_dir, 'page')
+        subprocess.run(
+            ['pdftoppm', '-f', '1', '-l', '1', '-singlefile', '-png', '-scale-to', str(preview_size()),
+             document.file.path, output],
+            check=True, capture_output=True, timeout=PDF_RASTER_TIMEOUT,
+        )
+        with Image.open(output + '.png') as image:
+            return _thumbnail(image)
+
+
+def generate_preview(document):
+    """Render and store the preview of a document; returns True if it has one"""
+    if not document.file or not previewable(document):
+        return False
+    name = preview_name(document)
+    if not default_storage.exists(name):
+        try:
+            if document_mime_type(document) == 'application/pdf':
+                content = _render_pdf(document)
+            else:
+                content = _render_image(document)
+        except (OSError, ValueError, Image.DecompressionBombError, subprocess.SubprocessError):
+            logger.warning("No preview for document %s", document.pk, exc_info=True)
+            return False
+        # Previews are derived data: a preview rendered concurrently is simply replaced
+        default_storage.delete(name)
+        name = default_storage.save(name, ContentFile(content))
+    # Queryset update: no signal, the file itself is unchanged
+    Document.objects.filter(file=document.file.name).update(preview=name)
+    return True
+
+
+def delete_preview(document, file_name=None):
+    """Delete the preview of a document whose file is not a blob (blob previews go with their blob)"""
+    file_name = document.file.name if file_name is None else file_name
+    if document.preview and not blob_sha256(file_name):
+        default_storage.delete(document.preview.name)
@@ -0,0 +1,92 @@
+"""
+Signal receivers keeping the materialized dashboard statistics and the
+cached dashboards up to date, and the document blobs and previews.
+"""
+
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from accounts.models import Client, Expert
+from services.models import Service
+
+from .blobs import add_reference, remove_reference
+from .bulk_jobs import start_job
+from .dashboard_data import invalidate_dashboards, invalidate_services
+from .models import Document, Notification
+from .platform_stats import TRACKED_FIELDS, instance_changed, tracked_values
+from .previews import delete_preview, previewable
+
+
+def remember_tracked_values(sender, instance, **kwargs):
+    """Keep the values the statistics depend on, to compute deltas on save."""
+    instance._stats_values = tracked_values(instance)
+
+
+def stats_instance_saved(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        invalidate_dashboards(instance_changed(instance, created=created))
+
+
+def stats_instance_deleted(sender, instance, **kwargs):
+    invalidate_dashboards(instance_changed(instance, deleted=True))
+
+
+for model in TRACKED_FIELDS:
+    post_init.connect(remember_tracked_values, sender=model, dispatch_uid=f'stats_init_{model._meta.label_lower}')
+    post_save.connect(stats_instance_saved, sender=model, dispatch_uid=f'stats_save_{model._meta.label_lower}')
+    post_delete.connect(stats_instance_deleted, sender=model, dispatch_uid=f'stats_delete_{model._meta.label_lower}')
+
+
+@receiver(post_save, sender=Notification)
+@receiver(post_delete, sender=Notification)
+@receiver(post_save, sender=Client)
+@receiver(post_delete, sender=Client)
+@receiver(post_save, sender=Expert)
+@receiver(post_delete, sender=Expert)
+def user_content_changed(sender, instance, **kwargs):
+    """Forget the cached dashboard of the owner of a notification or profile."""
+    invalidate_dashboards([instance.user_id])
+
+
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+def service_changed(sender, **kwargs):
+    invalidate_services()
+
+
+def _file_name(instance, field='file'):
+    value = instance.__dict__.get(field)
+    return getattr(value, 'name', value) or ''
+
+
+@receiver(post_init, sender=Document)
+def remember_document_file(sender, instance, **kwargs):
+    """Keep the blob a document was loaded with, to move its reference on save."""
+    instance._blob_name = _file_name(instance) if 'file' in instance.__dict__ else None
+
+
+@receiver(post_save, sender=Document)
+def document_file_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    name = _file_name(instance)
+    old = None if created else instance._blob_name
+    # A file deferred when the document was loaded is assumed unchanged
+    if created or (old is not None and old != name):
+        add_reference(name)
+        if old:
+            remove_reference(old)
+            if instance.preview:
+                # The preview of the previous file, until the new one is rendered
+                delete_preview(instance, old)
+                Document.objects.filter(pk=instance.pk).update(preview='')
+                instance.preview = ''
+        if name and previewable(instance):
+            start_job('generate_previews', [instance.pk])
+    instance._blob_name = name
+
+
+@receiver(post_delete, sender=Document)
+def document_file_deleted(sender, instance, **kwargs):
+    remove_reference(_file_name(instance))
+    delete_preview(instance)
@@ -0,0 +1,119 @@
+"""
+Aggregate statistics for the dashboards and admin listings.
+
+Totals are read from the PlatformStats row (see custom_requests.platform_stats).
+What cannot be materialized is counted in as few queries as possible: time
+series with a single `TruncDate` group-by instead of one count() per day.
+"""
+
+from datetime import timedelta
+
+import json
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Count, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from accounts.models import Utilisateur
+from resources.models import Resource
+from .models import RendezVous, ServiceRequest
+from .platform_stats import PENDING_REQUEST_STATUSES, get_platform_stats
+
+
+def daily_counts(queryset, field, start, days):
+    """Rows per day for `days` days starting at `start`, zeros included."""
+    rows = (
+        queryset.filter(**{f'{field}__date__gte': start, f'{field}__date__lt': start + timedelta(days=days)})
+        .annotate(day=TruncDate(field))
+        .values('day')
+        .annotate(count=Count('pk'))
+    )
+    counts = {row['day']: row['count'] for row in rows}
+    return [{'date': day, 'count': counts.get(day, 0)}
+            for day in (start + timedelta(days=offset) for offset in range(days))]
+
+
+def get_admin_dashboard_stats(now=None):
+    """Counters, daily signups and top services for the admin dashboard."""
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+
+    platform = get_platform_stats()
+
+    signups = daily_counts(Utilisateur.objects.all(), 'date_joined', today - timedelta(days=6), 7)
+    top_services = (
+        ServiceRequest.objects.values('service__title')
+        .annotate(count=Count('pk'))
+        .order_by('-count')[:5]
+    )
+
+    return {
+        'users': {
+            'total': platform.users_total,
+            'clients': platform.users_clients,
+            'experts': platform.users_experts,
+            'admins': platform.users_admins,
+        },
+        'services': {
+            'total': platform.requests_total,
+            'pending': platform.requests_pending,
+            'completed': platform.requests_completed,
+        },
+        'appointments': {
+            'total': platform.appointments_total,
+            # Depends on the current time, so it cannot be materialized
+            'upcoming': RendezVous.objects.filter(date_time__gte=now).count(),
+        },
+        'documents': platform.documents_total,
+        'resources': Resource.objects.count(),
+        'daily_signups': [{'date': row['date'].strftime('%d/%m'), 'count': row['count']} for row in signups],
+        'service_requests': [
+            {'name': row['service__title'] or 'Unknown Service', 'count': row['count']}
+            for row in top_services
+        ],
+    }
+
+
+def estimate_count(queryset):
+    """Planner estimate of the number of rows of a queryset (PostgreSQL only, None elsewhere)."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def request_status_stats(queryset):
+    """Total, pending, in-progress and completed counts of a filtered request queryset.
+
+    One aggregate over the filtered set. When ADMIN_APPROXIMATE_COUNT_THRESHOLD
+    is set and the planner expects more rows than that, planner estimates are
+    returned instead (`approximate` is then True) so that very large result
+    sets are never scanned just to be counted.
+    """
+    queryset = queryset.order_by()
+    statuses = {
+        'pending': Q(status__in=PENDING_REQUEST_STATUSES),
+        'in_progress': Q(status='in_progress'),
+        'completed': Q(status='completed'),
+    }
+
+    threshold = getattr(settings, 'ADMIN_APPROXIMATE_COUNT_THRESHOLD', None)
+    if threshold is not None:
+        total = estimate_count(queryset)
+        if total is not None and total > threshold:
+            stats = {name: estimate_count(queryset.filter(condition)) for name, condition in statuses.items()}
+            return dict(stats, total=total, approximate=True)
+
+    stats = queryset.aggregate(
+        total=Count('pk'),
+        **{name: Count('pk', filter=condition) for name, condition in statuses.items()}
+    )
+    return dict(stats, approximate=False)
@@ -0,0 +1,83 @@
+"""
+Content-addressed storage of document files.
+
+ContentAddressedStorage stores each file under the SHA-256 of its content,
+blobs/ab/cd/<sha256>, whatever the upload_to name; documents keep their own
+name and MIME type for downloads. The digest is computed while the file is
+streamed to a temporary file next to the blobs.
+When the blob already exists the temporary file is dropped, so a file
+uploaded again, e.g. the same passport scan for several requests, takes no
+extra space. The name returned by save() is the blob name, stored in
+Document.file.
+
+Several documents may then share a file: the DocumentBlob table counts the
+references to each blob (kept up to date by custom_requests.blobs), and a
+blob file is only removed once no document references it.
+"""
+
+import hashlib
+import os
+import tempfile
+import time
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+BLOB_PREFIX = 'blobs'
+
+
+def blob_name(sha256):
+    return f'{BLOB_PREFIX}/{sha256[:2]}/{sha256[2:4]}/{sha256}'
+
+
+def blob_sha256(name):
+    """SHA-256 of a blob from its storage name; None for files stored before content addressing"""
+    if not name or not name.startswith(BLOB_PREFIX + '/'):
+        return None
+    return os.path.basename(name)
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """File system storage naming every file after the SHA-256 of its content"""
+
+    def get_available_name(self, name, max_length=None):
+        # The final name only depends on the content, see _save
+        return name
+
+    def _save(self, name, content):
+        blob_dir = self.path(BLOB_PREFIX)
+        os.makedirs(blob_dir, exist_ok=True)
+
+        digest = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(dir=blob_dir, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                for chunk in content.chunks():
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    digest.update(chunk)
+                    temp_file.write(chunk)
+
+            name = blob_name(digest.hexdigest())
+            path = self.path(name)
+            if os.path.exists(path):
+                # Duplicate: keep the existing blob, marked as just used (see blobs.release_blob)
+                os.utime(path)
+                return name
+
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Atomic: a concurrent upload of the same content writes the same bytes
+            os.replace(temp_path, path)
+            if self.file_permissions_mode is not None:
+                os.chmod(path, self.file_permissions_mode)
+            return name
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def modified_recently(self, name, seconds):
+        try:
+            return time.time() - os.path.getmtime(self.path(name)) < seconds
+        except FileNotFoundError:
+            return False
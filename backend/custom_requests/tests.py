@@ -1,11 +1,38 @@
-from django.test import TestCase, Client
+import csv
+import hashlib
+import io
+import os
+import tempfile
+import zipfile
+from xml.etree import ElementTree
+
+from django.test import TestCase, Client, override_settings
 from django.urls import reverse
 from django.contrib.auth import get_user_model
-from custom_requests.models import ServiceRequest, Message, Document, RendezVous, ContactMessage
+from custom_requests.models import ServiceRequest, Message, Document, RendezVous, ContactMessage, Notification, PlatformStats, UserStats, BulkJob, UploadSession, DocumentBlob
 from services.models import ServiceCategory, ServiceType, Service
-from accounts.models import Expert
+from accounts.models import Client as ClientProfile, Expert
+from custom_requests.stats import get_admin_dashboard_stats, request_status_stats
+from custom_requests.pagination import KeysetPaginator, decode_cursor
+from custom_requests.platform_stats import compute_platform_stats, get_platform_stats, get_user_stats
+from custom_requests.dashboard_data import DASHBOARD_KEY, get_active_services, get_dashboard_data
+from custom_requests.admin_search import admin_search
+from custom_requests.admin_export import iter_export
+from custom_requests.bulk_jobs import BULK_ACTIONS, run_job, stalled_jobs, start_job
+from custom_requests.uploads import UploadError, append_chunk, complete_upload, part_path, purge_stale_uploads
+from custom_requests.blobs import recount_references
+from custom_requests.document_access import accessible_documents, get_accessible_document
+from custom_requests.storage import blob_name
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.http import Http404
+from django.core.management import call_command
+from django.utils import timezone
 from decimal import Decimal
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
 
 User = get_user_model()
 
@@ -212,3 +239,870 @@ class CustomRequestViewTest(TestCase):
         self.client.login(email='test@example.com', password='testpass123')
         response = self.client.get(reverse('custom_requests:dashboard'))
         self.assertEqual(response.status_code, 200)
+
+
+class AdminDashboardStatsTest(TestCase):
+    """Test the admin dashboard statistics service"""
+
+    def setUp(self):
+        self.client_user = User.objects.create_user(email='client@example.com', password='testpass123', account_type='client')
+        self.expert_user = User.objects.create_user(email='expert@example.com', password='testpass123', account_type='expert')
+        self.admin_user = User.objects.create_user(email='admin@example.com', password='testpass123', account_type='admin')
+        ClientProfile.objects.create(user=self.client_user)
+        Expert.objects.create(user=self.expert_user, specialty='Fiscalité')
+        User.objects.filter(pk=self.admin_user.pk).update(date_joined=timezone.now() - timedelta(days=3))
+
+        category = ServiceCategory.objects.create(name='Tourism', slug='tourism')
+        service_type = ServiceType.objects.create(category=category, name='City Tours', price=Decimal('50.00'))
+        service = Service.objects.create(service_type=service_type, title='Paris Tour', description='City tour', price=Decimal('75.00'))
+        for status in ('new', 'pending_info', 'completed', 'in_progress'):
+            ServiceRequest.objects.create(client=self.client_user, service=service, title='Tour', description='Tour', status=status)
+        RendezVous.objects.create(client=self.client_user, expert=self.expert_user,
+                                  date_time=timezone.now() + timedelta(days=1))
+        RendezVous.objects.create(client=self.client_user, expert=self.expert_user,
+                                  date_time=timezone.now() - timedelta(days=1))
+
+    def test_stats(self):
+        get_admin_dashboard_stats()
+        with self.assertNumQueries(5):
+            stats = get_admin_dashboard_stats()
+
+        self.assertEqual(stats['users'], {'total': 3, 'clients': 1, 'experts': 1, 'admins': 1})
+        self.assertEqual(stats['services'], {'total': 4, 'pending': 2, 'completed': 1})
+        self.assertEqual(stats['appointments'], {'total': 2, 'upcoming': 1})
+        self.assertEqual(stats['service_requests'], [{'name': 'Paris Tour', 'count': 4}])
+
+        signups = stats['daily_signups']
+        self.assertEqual(len(signups), 7)
+        self.assertEqual(signups[-1], {'date': timezone.localdate().strftime('%d/%m'), 'count': 2})
+        self.assertEqual(signups[-4]['count'], 1)
+        self.assertEqual(sum(day['count'] for day in signups), 3)
+
+    def test_admin_dashboard_view(self):
+        self.client.force_login(self.admin_user)
+        response = self.client.get(reverse('admin_dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_requests'], 4)
+        self.assertEqual(response.context['stats']['appointments']['upcoming'], 1)
+
+
+class PlatformStatsTest(TestCase):
+    """Test the statistics maintained by signals"""
+
+    def setUp(self):
+        self.client_user = User.objects.create_user(email='client@example.com', password='testpass123', account_type='client')
+        self.expert_user = User.objects.create_user(email='expert@example.com', password='testpass123', account_type='expert')
+        self.service_request = ServiceRequest.objects.create(client=self.client_user, title='Tour', description='Tour')
+        self.platform = get_platform_stats()
+
+    def assertUpToDate(self):
+        platform = PlatformStats.objects.get()
+        self.assertEqual({field: getattr(platform, field) for field in compute_platform_stats()}, compute_platform_stats())
+
+    def test_counters_follow_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            request = ServiceRequest.objects.create(client=self.client_user, expert=self.expert_user, title='Visa', description='Visa')
+            Document.objects.create(service_request=request, uploaded_by=self.client_user, name='Passport', file='documents/passport.pdf')
+            request.status = 'completed'
+            request.save()
+            self.service_request.delete()
+            self.expert_user.account_type = 'admin'
+            self.expert_user.save()
+        self.assertUpToDate()
+
+        platform = PlatformStats.objects.get()
+        self.assertEqual((platform.requests_total, platform.requests_pending, platform.requests_completed), (1, 0, 1))
+        self.assertEqual((platform.users_experts, platform.users_admins, platform.documents_total), (0, 1, 1))
+
+    def test_clients_and_experts_are_counted_by_profile(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ClientProfile.objects.create(user=self.client_user)
+            Expert.objects.create(user=self.expert_user, specialty='Fiscalité')
+        platform = PlatformStats.objects.get()
+        self.assertEqual((platform.users_clients, platform.users_experts), (1, 1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.expert_user.delete()
+        self.assertUpToDate()
+        platform = PlatformStats.objects.get()
+        self.assertEqual((platform.users_total, platform.users_clients, platform.users_experts), (1, 1, 0))
+
+    def test_deferred_fields_are_not_counted_as_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            request = ServiceRequest.objects.only('title').get(pk=self.service_request.pk)
+            request.title = 'Tour de Paris'
+            request.save()
+            user = User.objects.only('email').get(pk=self.client_user.pk)
+            user.save()
+        self.assertUpToDate()
+
+    def test_user_stats(self):
+        stats = get_user_stats(self.client_user)
+        self.assertEqual((stats.requests_total, stats.requests_active, stats.documents_count), (1, 1, 0))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Document.objects.create(service_request=self.service_request, uploaded_by=self.client_user,
+                                    name='Passport', file='documents/passport.pdf')
+            self.service_request.expert = self.expert_user
+            self.service_request.status = 'completed'
+            self.service_request.save()
+
+        stats.refresh_from_db()
+        self.assertEqual((stats.requests_active, stats.requests_completed, stats.documents_count), (0, 1, 1))
+        expert_stats = UserStats.objects.get(user=self.expert_user)
+        self.assertEqual((expert_stats.requests_total, expert_stats.requests_completed, expert_stats.documents_count), (1, 1, 1))
+
+    def test_reconcile_fixes_drift(self):
+        ServiceRequest.objects.update(status='completed')
+        UserStats.objects.filter(user=self.client_user).delete()
+        call_command('reconcile_platform_stats', stdout=open(os.devnull, 'w'))
+
+        self.assertUpToDate()
+        self.assertIsNotNone(PlatformStats.objects.get().reconciled_at)
+        self.assertEqual(UserStats.objects.get(user=self.client_user).requests_completed, 1)
+
+
+@override_settings(DASHBOARD_CACHE_SECONDS=60)
+class DashboardDataTest(TestCase):
+    """Test the cached client and expert dashboard loader"""
+
+    def setUp(self):
+        cache.clear()
+        self.client_user = User.objects.create_user(email='client@example.com', password='testpass123', account_type='client')
+        self.expert_user = User.objects.create_user(email='expert@example.com', password='testpass123', account_type='expert')
+        ClientProfile.objects.create(user=self.client_user)
+        Expert.objects.create(user=self.expert_user, specialty='Tourism')
+        category = ServiceCategory.objects.create(name='Tourism', slug='tourism')
+        service_type = ServiceType.objects.create(category=category, name='City Tours', price=Decimal('50.00'))
+        Service.objects.create(service_type=service_type, title='Paris Tour', description='City tour', price=Decimal('75.00'))
+
+        self.service_request = ServiceRequest.objects.create(client=self.client_user, expert=self.expert_user, title='Tour', description='Tour')
+        RendezVous.objects.create(client=self.client_user, expert=self.expert_user, date_time=timezone.now() + timedelta(days=1))
+        RendezVous.objects.create(client=self.client_user, expert=self.expert_user, date_time=timezone.now() - timedelta(days=1))
+        Document.objects.create(service_request=self.service_request, uploaded_by=self.client_user, name='Passport', file='documents/passport.pdf')
+        Notification.objects.create(user=self.client_user, type='system', title='Bienvenue', content='Bienvenue')
+
+    def test_cold_and_warm_loads(self):
+        get_user_stats(self.client_user)
+        get_active_services()
+
+        with self.assertNumQueries(5):
+            data = get_dashboard_data(self.client_user, 'client')
+        with self.assertNumQueries(0):
+            self.assertEqual(get_dashboard_data(self.client_user, 'client')['unread_notifications_count'], 1)
+
+        self.assertEqual(data['stats'].requests_active, 1)
+        self.assertEqual(data['upcoming_appointments_count'], 1)
+        self.assertEqual([request.title for request in data['recent_requests']], ['Tour'])
+        self.assertEqual([document.name for document in data['recent_documents']], ['Passport'])
+        self.assertEqual(data['upcoming_appointments'][0].expert.email, 'expert@example.com')
+
+    @override_settings(DASHBOARD_CACHE_SECONDS=0)
+    def test_no_caching_without_a_shared_cache(self):
+        get_dashboard_data(self.client_user, 'client')
+        get_active_services()
+        self.assertIsNone(cache.get(DASHBOARD_KEY.format(self.client_user.pk)))
+        with self.assertNumQueries(1):
+            get_active_services()
+
+    def test_writes_invalidate_the_dashboards(self):
+        get_dashboard_data(self.client_user, 'client')
+        get_dashboard_data(self.expert_user, 'expert')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Notification.objects.create(user=self.client_user, type='system', title='Rappel', content='Rappel')
+        self.assertIsNone(cache.get(DASHBOARD_KEY.format(self.client_user.pk)))
+        self.assertIsNotNone(cache.get(DASHBOARD_KEY.format(self.expert_user.pk)))
+        self.assertEqual(get_dashboard_data(self.client_user, 'client')['unread_notifications_count'], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.service_request.status = 'completed'
+            self.service_request.save()
+        expert_data = get_dashboard_data(self.expert_user, 'expert')
+        self.assertEqual(expert_data['stats'].requests_completed, 1)
+        self.assertEqual(get_dashboard_data(self.client_user, 'client')['stats'].requests_active, 0)
+
+    def test_dashboard_views(self):
+        self.client.force_login(self.client_user)
+        response = self.client.get(reverse('client_dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.context['active_requests'], response.context['documents_count']), (1, 1))
+
+        self.client.force_login(self.expert_user)
+        response = self.client.get(reverse('expert_dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['upcoming_appointments'], 1)
+        self.assertEqual([service.title for service in response.context['expert_services']], ['Paris Tour'])
+
+
+class AdminRequestsListingTest(TestCase):
+    """Test keyset pagination and filtered statistics of the admin requests listing"""
+
+    def setUp(self):
+        self.admin_user = User.objects.create_user(email='admin@example.com', password='testpass123', account_type='admin')
+        self.client_user = User.objects.create_user(email='client@example.com', password='testpass123', account_type='client')
+        statuses = ['new', 'pending_info', 'in_progress', 'completed', 'cancelled']
+        ServiceRequest.objects.bulk_create([
+            ServiceRequest(client=self.client_user, title=f'Request {index}', description='Test', status=statuses[index % 5])
+            for index in range(23)
+        ])
+        # Ties on created_at are broken by id
+        now = timezone.now()
+        for index, pk in enumerate(ServiceRequest.objects.order_by('pk').values_list('pk', flat=True)):
+            ServiceRequest.objects.filter(pk=pk).update(created_at=now - timedelta(hours=index // 3))
+        self.expected = list(ServiceRequest.objects.order_by('-created_at', 'pk').values_list('pk', flat=True))
+
+    def test_walk_forward_and_back(self):
+        paginator = KeysetPaginator(ServiceRequest.objects.all(), per_page=5)
+        pages = [paginator.page()]
+        while pages[-1].has_next:
+            with self.assertNumQueries(1):
+                pages.append(paginator.page(after=pages[-1].next_cursor))
+
+        self.assertEqual([item.pk for page in pages for item in page], self.expected)
+        self.assertEqual([len(page) for page in pages], [5, 5, 5, 5, 3])
+        self.assertFalse(pages[0].has_previous)
+
+        previous = paginator.page(before=pages[2].previous_cursor)
+        self.assertEqual([item.pk for item in previous], [item.pk for item in pages[1]])
+        self.assertTrue(previous.has_previous)
+        first = paginator.page(before=pages[1].previous_cursor)
+        self.assertFalse(first.has_previous)
+
+    def test_bad_cursor_gives_first_page(self):
+        self.assertIsNone(decode_cursor('not-a-cursor'))
+        page = KeysetPaginator(ServiceRequest.objects.all(), per_page=5).page(after='not-a-cursor')
+        self.assertEqual([item.pk for item in page], self.expected[:5])
+
+    def test_status_stats_in_one_query(self):
+        with self.assertNumQueries(1):
+            stats = request_status_stats(ServiceRequest.objects.filter(title__startswith='Request'))
+        self.assertEqual(stats, {'total': 23, 'pending': 10, 'in_progress': 5, 'completed': 4, 'approximate': False})
+
+    def test_admin_requests_view(self):
+        self.client.force_login(self.admin_user)
+        response = self.client.get(reverse('admin_demandes'), {'status': 'new'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('error', response.context)
+        self.assertEqual(response.context['total_requests'], 5)
+        self.assertEqual(len(response.context['service_requests']), 5)
+
+        response = self.client.get(reverse('admin_demandes'))
+        page = response.context['service_requests']
+        self.assertContains(response, f'after={page.next_cursor}')
+        response = self.client.get(reverse('admin_demandes'), {'after': page.next_cursor})
+        self.assertEqual([item.pk for item in response.context['service_requests']], self.expected[10:20])
+
+
+class AdminSearchTest(TestCase):
+    """Test the unified admin search"""
+
+    def setUp(self):
+        self.admin_user = User.objects.create_user(email='admin@example.com', password='testpass123', account_type='admin')
+        self.client_user = User.objects.create_user(email='karim@example.com', password='testpass123',
+                                                    account_type='client', name='Benali', first_name='Karim')
+        self.other_user = User.objects.create_user(email='sara.karimi@example.com', password='testpass123',
+                                                   account_type='client', name='Karimi', first_name='Sara')
+        self.expert_user = User.objects.create_user(email='expert@example.com', password='testpass123', account_type='expert')
+        self.own_request = ServiceRequest.objects.create(client=self.other_user, title='Dossier fiscal', description='Test')
+        self.client_request = ServiceRequest.objects.create(client=self.client_user, title='Visa', description='Test')
+        Document.objects.create(name='Passeport', uploaded_by=self.client_user, file='documents/passeport.pdf')
+        RendezVous.objects.create(client=self.client_user, expert=self.expert_user,
+                                  date_time=timezone.now() + timedelta(days=1), notes='Appeler avant')
+
+    def test_typed_ranked_results(self):
+        results = admin_search('karim')
+        self.assertEqual(set(results), {'users', 'requests', 'documents', 'appointments'})
+        # The exact e-mail prefix ranks above the substring match
+        self.assertEqual([item['id'] for item in results['users']], [self.client_user.pk, self.other_user.pk])
+        self.assertGreater(results['users'][0]['score'], results['users'][1]['score'])
+        self.assertEqual(results['users'][0]['url'], reverse('admin_user_detail', args=[self.client_user.pk]))
+
+    def test_matches_through_related_users(self):
+        results = admin_search('benali', types=['requests', 'documents', 'appointments'])
+        self.assertEqual([item['id'] for item in results['requests']], [self.client_request.pk])
+        self.assertEqual([item['title'] for item in results['documents']], ['Passeport'])
+        self.assertEqual(len(results['appointments']), 1)
+
+    def test_limit_and_short_query(self):
+        self.assertEqual(len(admin_search('example', types=['users'], limit=2)['users']), 2)
+        self.assertEqual(admin_search('k'), {})
+
+    def test_endpoint(self):
+        self.client.login(email='karim@example.com', password='testpass123')
+        self.assertEqual(self.client.get(reverse('admin_search'), {'q': 'karim'}).status_code, 403)
+
+        self.client.login(email='admin@example.com', password='testpass123')
+        response = self.client.get(reverse('admin_search'), {'q': 'fiscal', 'types': 'requests'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['id'] for item in response.json()['results']['requests']], [self.own_request.pk])
+        self.assertEqual(self.client.get(reverse('admin_search'), {'q': 'fiscal', 'types': 'bogus'}).status_code, 400)
+
+
+class AdminExportTest(TestCase):
+    """Test the streaming CSV/XLSX exports of the admin listings"""
+
+    def setUp(self):
+        self.admin_user = User.objects.create_user(email='admin@example.com', password='testpass123', account_type='admin')
+        self.client_user = User.objects.create_user(email='client@example.com', password='testpass123', account_type='client')
+        ServiceRequest.objects.create(client=self.client_user, title='=HYPERLINK("x")', description='Test', status='completed')
+        ServiceRequest.objects.create(client=self.client_user, title='Visa', description='Test', status='new')
+        self.client.login(email='admin@example.com', password='testpass123')
+
+    def test_csv_uses_listing_filters(self):
+        response = self.client.get(reverse('admin_export', args=['requests']), {'format': 'csv', 'status': 'completed'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment;', response['Content-Disposition'])
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['Status'], 'Completed')
+        self.assertEqual(rows[0]['Client email'], 'client@example.com')
+        # Formulas are neutralized
+        self.assertEqual(rows[0]['Title'], '\'=HYPERLINK("x")')
+
+    def test_xlsx_workbook(self):
+        chunks = list(iter_export('users', 'xlsx', {'user_type': 'client'}, chunk_size=1))
+        self.assertGreater(len(chunks), 2)
+        with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as archive:
+            self.assertIsNone(archive.testzip())
+            sheet = ElementTree.fromstring(archive.read('xl/worksheets/sheet1.xml'))
+        namespace = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+        rows = sheet.findall(f'{namespace}sheetData/{namespace}row')
+        self.assertEqual(len(rows), 2)
+        texts = [element.text for element in rows[1].iter(f'{namespace}t')]
+        self.assertIn('client@example.com', texts)
+
+    def test_access_and_validation(self):
+        self.assertEqual(self.client.get(reverse('admin_export', args=['bogus'])).status_code, 400)
+        self.assertEqual(self.client.get(reverse('admin_export', args=['users']), {'format': 'pdf'}).status_code, 400)
+        self.client.login(email='client@example.com', password='testpass123')
+        self.assertEqual(self.client.get(reverse('admin_export', args=['users'])).status_code, 403)
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'requests.csv')
+            call_command('export_admin_listing', 'requests', '--filter', 'status=new', '--output', path, stdout=io.StringIO())
+            with open(path, encoding='utf-8') as output:
+                rows = list(csv.DictReader(output))
+        self.assertEqual([row['Title'] for row in rows], ['Visa'])
+
+
+@override_settings(BULK_JOBS_RUNNER='worker')
+class BulkJobTest(TestCase):
+    """Test the chunked background bulk actions"""
+
+    def setUp(self):
+        self.admin_user = User.objects.create_user(email='admin@example.com', password='testpass123', account_type='admin')
+        self.users = [
+            User.objects.create_user(email=f'user{index}@example.com', password='testpass123', account_type='client')
+            for index in range(5)
+        ]
+        self.client.login(email='admin@example.com', password='testpass123')
+
+    def test_delete_users_in_chunks(self):
+        ids = [user.pk for user in self.users] + [self.admin_user.pk]
+        response = self.client.post(reverse('admin_bulk_delete_users'), {'selected_users': ids},
+                                    HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.status_code, 202)
+        job = BulkJob.objects.get(pk=response.json()['job_id'])
+        self.assertEqual((job.status, job.total), ('pending', 6))
+        # Nothing is deleted within the request
+        self.assertEqual(User.objects.count(), 6)
+
+        chunk_size, action = BULK_ACTIONS['delete_users']
+        BULK_ACTIONS['delete_users'] = (2, action)
+        try:
+            job = run_job(job.pk)
+        finally:
+            BULK_ACTIONS['delete_users'] = (chunk_size, action)
+        self.assertEqual((job.status, job.processed, job.succeeded), ('completed', 6, 5))
+        # The admin running the job is kept
+        self.assertEqual(list(User.objects.values_list('pk', flat=True)), [self.admin_user.pk])
+        self.assertIsNone(run_job(job.pk))
+
+        progress = self.client.get(response.json()['progress_url']).json()['job']
+        self.assertEqual((progress['status'], progress['progress']), ('completed', 100))
+
+    def test_review_documents_notifies_with_bulk_create(self):
+        documents = [
+            Document.objects.create(name=f'Doc {index}', uploaded_by=self.users[index % 2], file='documents/doc.pdf')
+            for index in range(4)
+        ]
+        job = start_job('reject_documents', [document.pk for document in documents],
+                        created_by=self.admin_user, rejection_reason='Illisible')
+        with self.assertNumQueries(11):
+            # Claim, load, then per chunk: savepoint, heartbeat, owners, update, one bulk insert,
+            # progress, release; then status and reload
+            job = run_job(job.pk)
+        self.assertEqual(job.succeeded, 4)
+        self.assertEqual(set(Document.objects.values_list('status', 'rejection_reason')), {('rejected', 'Illisible')})
+        self.assertEqual(Notification.objects.filter(type='document').count(), 4)
+
+    def test_failed_chunk_keeps_progress(self):
+        job = start_job('delete_users', [self.users[0].pk], created_by=self.admin_user)
+        chunk_size, action = BULK_ACTIONS['delete_users']
+
+        def fail(job, ids):
+            raise RuntimeError('boom')
+
+        BULK_ACTIONS['delete_users'] = (chunk_size, fail)
+        try:
+            job = run_job(job.pk)
+        finally:
+            BULK_ACTIONS['delete_users'] = (chunk_size, action)
+        self.assertEqual((job.status, job.processed, job.error), ('failed', 0, 'boom'))
+        self.assertTrue(User.objects.filter(pk=self.users[0].pk).exists())
+
+    def test_command_and_thread_runner(self):
+        job = start_job('verify_documents', [], created_by=self.admin_user)
+        call_command('run_bulk_jobs', '--once', stdout=io.StringIO())
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'completed')
+
+        with override_settings(BULK_JOBS_RUNNER='thread'):
+            with self.captureOnCommitCallbacks() as callbacks:
+                start_job('verify_documents', [], created_by=self.admin_user)
+        self.assertEqual(len(callbacks), 1)
+
+        self.client.login(email='user0@example.com', password='testpass123')
+        self.assertEqual(self.client.get(reverse('admin_bulk_job_status', args=[job.pk])).status_code, 403)
+
+    def test_stalled_jobs_are_resumed(self):
+        job = start_job('verify_documents', [], created_by=self.admin_user)
+        self.assertEqual(stalled_jobs(), [])
+        # Its thread died with the gunicorn worker that started it
+        BulkJob.objects.filter(pk=job.pk).update(created_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(stalled_jobs(), [job.pk])
+
+        # Polling the progress does not start a runner
+        with override_settings(BULK_JOBS_RUNNER='thread'):
+            with self.captureOnCommitCallbacks() as callbacks:
+                self.client.get(reverse('admin_bulk_job_status', args=[job.pk]))
+        self.assertEqual(callbacks, [])
+
+        self.assertEqual(run_job(job.pk).status, 'completed')
+        self.assertEqual(stalled_jobs(), [])
+
+    def test_runner_stops_once_the_job_is_taken_over(self):
+        job = start_job('verify_documents', [user.pk for user in self.users[:3]], created_by=self.admin_user)
+        chunks = []
+
+        def take_over(job, ids):
+            chunks.append(ids)
+            # Another runner claimed the job as stalled
+            BulkJob.objects.filter(pk=job.pk).update(claimed_by='other')
+            return len(ids)
+
+        chunk_size, action = BULK_ACTIONS['verify_documents']
+        BULK_ACTIONS['verify_documents'] = (1, take_over)
+        try:
+            self.assertIsNone(run_job(job.pk))
+        finally:
+            BULK_ACTIONS['verify_documents'] = (chunk_size, action)
+        self.assertEqual(len(chunks), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.claimed_by), ('running', 'other'))
+
+
+class ChunkedUploadTest(TestCase):
+    """Test the resumable chunked upload protocol"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(
+            MEDIA_ROOT=os.path.join(self.temp_dir.name, 'media'),
+            CHUNKED_UPLOAD_TEMP_DIR=os.path.join(self.temp_dir.name, 'parts'),
+            CHUNKED_UPLOAD_MAX_CHUNK_SIZE=4,
+        )
+        self.settings_override.enable()
+        self.client_user = User.objects.create_user(email='client@example.com', password='testpass123', account_type='client')
+        self.expert_user = User.objects.create_user(email='expert@example.com', password='testpass123', account_type='expert')
+        self.service_request = ServiceRequest.objects.create(client=self.client_user, expert=self.expert_user,
+                                                             title='Visa', description='Test')
+        self.client.login(email='client@example.com', password='testpass123')
+        self.content = b'0123456789'
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.temp_dir.cleanup()
+
+    def init(self, **data):
+        data = {'filename': 'scan.pdf', 'size': len(self.content), 'content_type': 'application/pdf',
+                'name': 'Passeport', 'type': 'identity', 'demande_id': self.service_request.pk, **data}
+        return self.client.post(reverse('custom_requests:upload_init'), data, content_type='application/json')
+
+    def patch(self, upload_id, offset, data, **headers):
+        return self.client.patch(reverse('custom_requests:upload_chunk', args=[upload_id]), data,
+                                 content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET=str(offset), **headers)
+
+    def test_upload_resume_and_complete(self):
+        response = self.init()
+        self.assertEqual(response.status_code, 201)
+        upload_id = response.json()['upload_id']
+
+        self.assertEqual(self.patch(upload_id, 0, self.content[:4]).json()['offset'], 4)
+        # A chunk sent again after a lost response is refused with the committed offset
+        response = self.patch(upload_id, 0, self.content[:4])
+        self.assertEqual((response.status_code, response['Upload-Offset']), (409, '4'))
+        status = self.client.get(reverse('custom_requests:upload_chunk', args=[upload_id])).json()
+        self.assertEqual(status['offset'], 4)
+
+        # A corrupted chunk is dropped
+        response = self.patch(upload_id, 4, self.content[4:8], HTTP_UPLOAD_CHECKSUM='sha256 ' + '0' * 64)
+        self.assertEqual((response.status_code, response.json()['offset']), (460, 4))
+        self.assertEqual(os.path.getsize(part_path(UploadSession.objects.get(pk=upload_id))), 4)
+
+        checksum = 'sha256 ' + hashlib.sha256(self.content[4:8]).hexdigest()
+        self.assertEqual(self.patch(upload_id, 4, self.content[4:8], HTTP_UPLOAD_CHECKSUM=checksum).status_code, 200)
+        self.assertEqual(self.patch(upload_id, 8, self.content[8:]).json()['offset'], 10)
+
+        response = self.client.post(reverse('custom_requests:upload_complete', args=[upload_id]),
+                                    {'sha256': hashlib.sha256(self.content).hexdigest()}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        document = Document.objects.get(pk=response.json()['document']['id'])
+        self.assertEqual((document.name, document.type, document.service_request), ('Passeport', 'identity', self.service_request))
+        with document.file.open('rb') as stored:
+            self.assertEqual(stored.read(), self.content)
+        upload = UploadSession.objects.get(pk=upload_id)
+        self.assertEqual((upload.status, upload.sha256), ('completed', hashlib.sha256(self.content).hexdigest()))
+        self.assertFalse(os.path.exists(part_path(upload)))
+        self.assertTrue(Notification.objects.filter(user=self.expert_user, type='document').exists())
+
+    def test_expert_form_fields(self):
+        self.client.login(email='expert@example.com', password='testpass123')
+        response = self.init(demande_id=None, service_request_id=self.service_request.pk)
+        self.assertEqual(response.status_code, 201)
+        upload = UploadSession.objects.get(pk=response.json()['upload_id'])
+        self.assertEqual(upload.metadata['service_request_id'], self.service_request.pk)
+
+    def test_request_form_is_posted_before_its_files(self):
+        ClientProfile.objects.create(user=self.client_user)
+        category = ServiceCategory.objects.create(name='Tourism', slug='tourism')
+        service_type = ServiceType.objects.create(category=category, name='City Tours', price=Decimal('50.00'))
+        service = Service.objects.create(service_type=service_type, title='Paris Tour', description='City tour', price=Decimal('75.00'))
+        response = self.client.post(reverse('custom_requests:create_request', args=[service.pk]),
+                                    {'title': 'Tour', 'description': 'Tour'}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        data = response.json()
+        self.assertEqual(data['redirect_url'], reverse('custom_requests:client_requests'))
+        # The files then go through the chunked upload endpoints
+        self.assertEqual(self.init(demande_id=data['demande_id']).status_code, 201)
+
+    def test_invalid_steps(self):
+        self.assertEqual(self.init(size=0).status_code, 413)
+        self.assertEqual(self.init(demande_id=999).status_code, 404)
+        upload_id = self.init().json()['upload_id']
+        self.assertEqual(self.patch(upload_id, 0, b'01234').status_code, 413)
+        self.assertEqual(self.client.post(reverse('custom_requests:upload_complete', args=[upload_id])).status_code, 409)
+
+        # Sessions are private to their user
+        self.client.login(email='expert@example.com', password='testpass123')
+        self.assertEqual(self.patch(upload_id, 0, b'0123').status_code, 404)
+
+    def test_concurrent_requests_see_the_committed_state(self):
+        upload_id = self.init(size=4).json()['upload_id']
+        # Two requests that loaded the session before either committed
+        first, second = UploadSession.objects.get(pk=upload_id), UploadSession.objects.get(pk=upload_id)
+        self.assertEqual(append_chunk(first, 0, io.BytesIO(b'0123'), 4), 4)
+        with self.assertRaises(UploadError) as raised:
+            append_chunk(second, 0, io.BytesIO(b'abcd'), 4)
+        self.assertEqual((raised.exception.status, raised.exception.offset), (409, 4))
+        with open(part_path(first), 'rb') as part:
+            self.assertEqual(part.read(), b'0123')
+
+        first, second = UploadSession.objects.get(pk=upload_id), UploadSession.objects.get(pk=upload_id)
+        document = complete_upload(first)
+        self.assertEqual(complete_upload(second), document)
+        self.assertEqual(Document.objects.filter(uploaded_by=self.client_user).count(), 1)
+
+    def test_purge_stale_uploads(self):
+        upload = UploadSession.objects.get(pk=self.init().json()['upload_id'])
+        self.assertEqual(purge_stale_uploads(), 0)
+        UploadSession.objects.filter(pk=upload.pk).update(updated_at=timezone.now() - timedelta(days=2))
+        self.assertEqual(purge_stale_uploads(), 1)
+        self.assertFalse(os.path.exists(part_path(upload)))
+
+
+class DocumentBlobTest(TestCase):
+    """Test the content-addressed, reference-counted storage of document files"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(
+            MEDIA_ROOT=os.path.join(self.temp_dir.name, 'media'),
+            CHUNKED_UPLOAD_TEMP_DIR=os.path.join(self.temp_dir.name, 'parts'),
+            BLOB_GRACE_SECONDS=0,
+        )
+        self.settings_override.enable()
+        self.user = User.objects.create_user(email='client@example.com', password='testpass123', account_type='client')
+        self.content = b'%PDF-1.4 passport scan'
+        self.name = blob_name(hashlib.sha256(self.content).hexdigest())
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.temp_dir.cleanup()
+
+    def create_document(self, filename='scan.pdf'):
+        document = Document(uploaded_by=self.user, name=filename, type='identity')
+        document.file.save(filename, ContentFile(self.content), save=False)
+        document.save()
+        return document
+
+    def test_duplicates_share_one_file(self):
+        first, second = self.create_document(), self.create_document('copy.pdf')
+        self.assertEqual((first.file.name, second.file.name), (self.name, self.name))
+        self.assertEqual(DocumentBlob.objects.get().ref_count, 2)
+        path = first.file.path
+        self.assertEqual(os.listdir(os.path.dirname(path)), [os.path.basename(path)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(DocumentBlob.objects.get().ref_count, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(DocumentBlob.objects.exists())
+
+    def test_upload_of_known_content_sends_nothing(self):
+        self.create_document()
+        self.client.login(email='client@example.com', password='testpass123')
+        response = self.client.post(reverse('custom_requests:upload_init'), {
+            'filename': 'again.pdf', 'size': len(self.content), 'sha256': hashlib.sha256(self.content).hexdigest(),
+        }, content_type='application/json')
+        self.assertEqual(response.json()['offset'], len(self.content))
+
+        upload_id = response.json()['upload_id']
+        response = self.client.post(reverse('custom_requests:upload_complete', args=[upload_id]))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Document.objects.get(pk=response.json()['document']['id']).file.name, self.name)
+        self.assertEqual(DocumentBlob.objects.get().ref_count, 2)
+
+        self.assertEqual(response.json()['document']['file_url'],
+                         reverse('custom_requests:view_document', args=[response.json()['document']['id']]))
+
+        # Only the user's own content is matched
+        other = User.objects.create_user(email='other@example.com', password='testpass123', account_type='client')
+        self.client.force_login(other)
+        response = self.client.post(reverse('custom_requests:upload_init'), {
+            'filename': 'again.pdf', 'size': len(self.content), 'sha256': hashlib.sha256(self.content).hexdigest(),
+        }, content_type='application/json')
+        self.assertEqual(response.json()['offset'], 0)
+
+    def test_known_content_removed_before_completion_is_sent(self):
+        document = self.create_document()
+        self.client.login(email='client@example.com', password='testpass123')
+        upload_id = self.client.post(reverse('custom_requests:upload_init'), {
+            'filename': 'again.pdf', 'size': len(self.content), 'sha256': hashlib.sha256(self.content).hexdigest(),
+        }, content_type='application/json').json()['upload_id']
+        with self.captureOnCommitCallbacks(execute=True):
+            document.delete()
+
+        response = self.client.post(reverse('custom_requests:upload_complete', args=[upload_id]))
+        self.assertEqual((response.status_code, response.json()['offset']), (409, 0))
+        response = self.client.patch(reverse('custom_requests:upload_chunk', args=[upload_id]), self.content,
+                                     content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET='0')
+        self.assertEqual(response.json()['offset'], len(self.content))
+        response = self.client.post(reverse('custom_requests:upload_complete', args=[upload_id]))
+        self.assertEqual(response.status_code, 201)
+        with Document.objects.get(pk=response.json()['document']['id']).file.open('rb') as stored:
+            self.assertEqual(stored.read(), self.content)
+
+    def test_reconcile_document_blobs(self):
+        document = self.create_document()
+        DocumentBlob.objects.update(ref_count=5)
+        self.assertEqual(recount_references(), 1)
+        self.assertEqual(DocumentBlob.objects.get().ref_count, 1)
+
+        # Legacy files are moved into blobs, unreferenced blobs removed
+        legacy = Document.objects.create(uploaded_by=self.user, name='old.pdf', type='other')
+        Document.objects.filter(pk=legacy.pk).update(file=default_storage.save('documents/2024/01/old.pdf', ContentFile(b'old')))
+        orphan = default_storage.path(blob_name(hashlib.sha256(b'orphan').hexdigest()))
+        os.makedirs(os.path.dirname(orphan))
+        with open(orphan, 'wb') as f:
+            f.write(b'orphan')
+
+        call_command('reconcile_document_blobs', '--store-legacy', stdout=io.StringIO())
+        legacy.refresh_from_db()
+        self.assertEqual(legacy.file.name, blob_name(hashlib.sha256(b'old').hexdigest()))
+        self.assertFalse(default_storage.exists('documents/2024/01/old.pdf'))
+        self.assertFalse(os.path.exists(orphan))
+        self.assertTrue(os.path.exists(document.file.path))
+        self.assertEqual(DocumentBlob.objects.count(), 2)
+
+
+class ProtectedMediaTest(TestCase):
+    """Test the delivery of document files, by Django or by the front server"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(MEDIA_ROOT=self.temp_dir.name)
+        self.settings_override.enable()
+        self.user = User.objects.create_user(email='client@example.com', password='testpass123', account_type='client')
+        self.document = Document(uploaded_by=self.user, name='Passeport été.pdf', type='identity', mime_type='application/pdf')
+        self.document.file.save('scan.pdf', ContentFile(b'%PDF-1.4'), save=False)
+        self.document.save()
+        self.client.login(email='client@example.com', password='testpass123')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.temp_dir.cleanup()
+
+    def test_streamed_by_django(self):
+        response = self.client.get(reverse('custom_requests:download_document', args=[self.document.pk]))
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF-1.4')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(response['Content-Disposition'].startswith('attachment;'))
+
+    def test_conditional_requests(self):
+        url = reverse('custom_requests:view_document', args=[self.document.pk])
+        response = self.client.get(url)
+        self.assertEqual(response['ETag'], '"%s"' % hashlib.sha256(b'%PDF-1.4').hexdigest())
+        self.assertIn('private', response['Cache-Control'])
+        response.close()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual((response.status_code, response.content), (304, b''))
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_range_requests(self):
+        url = reverse('custom_requests:view_document', args=[self.document.pk])
+        response = self.client.get(url, HTTP_RANGE='bytes=1-3')
+        self.assertEqual((response.status_code, response['Content-Range']), (206, 'bytes 1-3/8'))
+        self.assertEqual(b''.join(response.streaming_content), b'PDF')
+
+        response = self.client.get(url, HTTP_RANGE='bytes=0-0,-3')
+        self.assertEqual(response.status_code, 206)
+        body = b''.join(response.streaming_content)
+        self.assertEqual(len(body), int(response['Content-Length']))
+        boundary = response['Content-Type'].split('boundary=')[1]
+        parts = [part.split(b'\r\n\r\n', 1) for part in body.split(b'--' + boundary.encode())[1:-1]]
+        self.assertEqual([(b'Content-Range: bytes 0-0/8' in head, data.rstrip(b'\r\n')) for head, data in parts],
+                         [(True, b'%'), (False, b'1.4')])
+
+        response = self.client.get(url, HTTP_RANGE='bytes=8-')
+        self.assertEqual((response.status_code, response['Content-Range']), (416, 'bytes */8'))
+
+        # A range on a changed file is answered with the whole file
+        response = self.client.get(url, HTTP_RANGE='bytes=1-3', HTTP_IF_RANGE='"outdated"')
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF-1.4')
+
+    @override_settings(PROTECTED_MEDIA_BACKEND='nginx', PROTECTED_MEDIA_INTERNAL_URL='/protected-media/')
+    def test_offloaded_to_nginx(self):
+        response = self.client.get(reverse('custom_requests:view_document', args=[self.document.pk]))
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + self.document.file.name)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(response['Content-Disposition'], "inline; filename*=utf-8''Passeport%20%C3%A9t%C3%A9.pdf")
+
+    @override_settings(PROTECTED_MEDIA_BACKEND='sendfile')
+    def test_offloaded_with_x_sendfile(self):
+        response = self.client.get(reverse('custom_requests:download_document', args=[self.document.pk]))
+        self.assertEqual(response['X-Sendfile'], self.document.file.path)
+
+        # Permission checks still come first
+        other = User.objects.create_user(email='other@example.com', password='testpass123', account_type='client')
+        self.client.force_login(other)
+        response = self.client.get(reverse('custom_requests:download_document', args=[self.document.pk]))
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(response.has_header('X-Sendfile'))
+
+
+@override_settings(BULK_JOBS_RUNNER='worker')
+class DocumentPreviewTest(TestCase):
+    """Test the background rendering of document thumbnails"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(MEDIA_ROOT=self.temp_dir.name, PREVIEW_SIZE=32)
+        self.settings_override.enable()
+        self.user = User.objects.create_user(email='client@example.com', password='testpass123', account_type='client')
+        image = io.BytesIO()
+        Image.new('RGBA', (200, 100), (255, 0, 0, 128)).save(image, 'PNG')
+        self.png = image.getvalue()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.temp_dir.cleanup()
+
+    def create_document(self, content, mime_type='image/png'):
+        document = Document(uploaded_by=self.user, name='scan', type='identity', mime_type=mime_type)
+        document.file.save('scan', ContentFile(content), save=False)
+        document.save()
+        return document
+
+    def test_preview_rendered_by_job(self):
+        document = self.create_document(self.png)
+        self.assertFalse(document.preview)
+        job = BulkJob.objects.get(action='generate_previews')
+        self.assertEqual(job.object_ids, [document.pk])
+
+        run_job(job.pk)
+        document.refresh_from_db()
+        with document.preview.open('rb') as f, Image.open(f) as preview:
+            self.assertEqual((preview.format, preview.size), ('JPEG', (32, 16)))
+
+        self.client.login(email='client@example.com', password='testpass123')
+        response = self.client.get(reverse('custom_requests:document_preview', args=[document.pk]))
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertIn('max-age=86400', response['Cache-Control'])
+        response.close()
+
+        # Same content: the preview is shared, not rendered again
+        copy = self.create_document(self.png)
+        run_job(BulkJob.objects.get(action='generate_previews', object_ids=[copy.pk]).pk)
+        copy.refresh_from_db()
+        self.assertEqual(copy.preview.name, document.preview.name)
+
+    def test_unsupported_documents_have_no_job(self):
+        self.create_document(b'PK\x03\x04', mime_type='application/vnd.openxmlformats-officedocument.wordprocessingml.document')
+        self.assertFalse(BulkJob.objects.filter(action='generate_previews').exists())
+
+        # An image that cannot be decoded keeps its icon
+        document = self.create_document(b'not a png')
+        run_job(BulkJob.objects.get(action='generate_previews').pk)
+        document.refresh_from_db()
+        self.assertFalse(document.preview)
+
+
+class DocumentAccessTest(TestCase):
+    """Test the document access policy shared by listings and downloads"""
+
+    def setUp(self):
+        self.client_user = User.objects.create_user(email='client@example.com', password='testpass123', account_type='client')
+        self.other_client = User.objects.create_user(email='other@example.com', password='testpass123', account_type='client')
+        self.expert_user = User.objects.create_user(email='expert@example.com', password='testpass123', account_type='expert')
+        self.admin_user = User.objects.create_user(email='admin@example.com', password='testpass123', account_type='admin')
+        service_request = ServiceRequest.objects.create(client=self.client_user, expert=self.expert_user,
+                                                        title='Visa', description='Test')
+        rendez_vous = RendezVous.objects.create(client=self.other_client, expert=self.expert_user,
+                                                date_time=timezone.now() + timedelta(days=1))
+        self.request_document = Document.objects.create(uploaded_by=self.expert_user, service_request=service_request,
+                                                        name='Visa', type='other')
+        self.appointment_document = Document.objects.create(uploaded_by=self.expert_user, rendez_vous=rendez_vous,
+                                                            name='Convocation', type='other')
+        self.own_document = Document.objects.create(uploaded_by=self.other_client, name='Passeport', type='identity')
+
+    def test_policy(self):
+        def readable(user):
+            return set(accessible_documents(user).values_list('name', flat=True))
+
+        self.assertEqual(readable(self.client_user), {'Visa'})
+        self.assertEqual(readable(self.other_client), {'Convocation', 'Passeport'})
+        self.assertEqual(readable(self.expert_user), {'Visa', 'Convocation'})
+        self.assertEqual(readable(self.admin_user), {'Visa', 'Convocation', 'Passeport'})
+
+    def test_single_document_check_is_one_query(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(get_accessible_document(self.expert_user, self.appointment_document.pk), self.appointment_document)
+        with self.assertRaises(PermissionDenied):
+            get_accessible_document(self.client_user, self.own_document.pk)
+        with self.assertRaises(Http404):
+            get_accessible_document(self.admin_user, 999)
+
+    def test_download_views(self):
+        self.client.login(email='client@example.com', password='testpass123')
+        self.assertEqual(self.client.get(reverse('custom_requests:download_document', args=[self.own_document.pk])).status_code, 403)
+        self.assertEqual(self.client.get(reverse('custom_requests:view_document', args=[999])).status_code, 404)
@@ -0,0 +1,119 @@
+"""
+JSON endpoints of the resumable chunked upload protocol (see custom_requests.uploads)
+"""
+
+import json
+
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.views.decorators.http import require_http_methods, require_POST
+
+from .models import UploadSession
+from .uploads import UploadError, append_chunk, complete_upload, init_upload, max_chunk_size
+
+
+def _error(error):
+    data = {'success': False, 'message': str(error)}
+    if error.offset is not None:
+        data['offset'] = error.offset
+    response = JsonResponse(data, status=error.status)
+    if error.offset is not None:
+        response['Upload-Offset'] = str(error.offset)
+    return response
+
+
+def _upload_data(upload):
+    return {
+        'upload_id': str(upload.pk),
+        'filename': upload.filename,
+        'size': upload.size,
+        'offset': upload.offset,
+        'status': upload.status,
+        'chunk_size': max_chunk_size(),
+    }
+
+
+def _json_body(request):
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body or b'{}')
+        except ValueError:
+            raise UploadError('JSON invalide')
+    return request.POST
+
+
+@login_required
+@require_POST
+def upload_init(request):
+    """Start an upload: filename, size, content_type and the document fields"""
+    try:
+        data = _json_body(request)
+        upload = init_upload(
+            request.user,
+            filename=data.get('filename', ''),
+            size=data.get('size'),
+            content_type=data.get('content_type', ''),
+            sha256=data.get('sha256') or None,
+            name=data.get('name', ''),
+            type=data.get('type', 'other'),
+            # demande_id in the client forms, service_request_id in the expert ones
+            service_request_id=data.get('demande_id') or data.get('service_request_id') or None,
+            rendez_vous_id=data.get('rendez_vous_id') or None,
+            is_official=data.get('is_official') in (True, 'true', 'on'),
+            reference_number=data.get('reference_number', ''),
+        )
+    except UploadError as e:
+        return _error(e)
+    return JsonResponse({'success': True, **_upload_data(upload)}, status=201)
+
+
+@login_required
+@require_http_methods(['GET', 'PATCH'])
+def upload_chunk(request, upload_id):
+    """GET: current offset, to resume. PATCH: append the raw body at the Upload-Offset header"""
+    upload = get_object_or_404(UploadSession, pk=upload_id, user=request.user)
+    if request.method == 'GET':
+        response = JsonResponse({'success': True, **_upload_data(upload)})
+        response['Upload-Offset'] = str(upload.offset)
+        return response
+
+    try:
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.headers['Content-Length'])
+        except (KeyError, ValueError):
+            raise UploadError('En-têtes Upload-Offset et Content-Length obligatoires')
+        # The body is read from the request stream, block by block
+        offset = append_chunk(upload, offset, request, length, request.headers.get('Upload-Checksum'))
+    except UploadError as e:
+        return _error(e)
+
+    response = JsonResponse({'success': True, **_upload_data(upload)})
+    response['Upload-Offset'] = str(offset)
+    return response
+
+
+@login_required
+@require_POST
+def upload_complete(request, upload_id):
+    """Create the document once the whole file has been received (optional sha256 to verify)"""
+    upload = get_object_or_404(UploadSession, pk=upload_id, user=request.user)
+    try:
+        data = _json_body(request)
+        document = complete_upload(upload, sha256=data.get('sha256'))
+    except UploadError as e:
+        return _error(e)
+
+    return JsonResponse({
+        'success': True,
+        'sha256': upload.sha256,
+        'document': {
+            'id': document.id,
+            'name': document.name,
+            'type': document.type,
+            'file_url': reverse('custom_requests:view_document', args=[document.pk]) if document.file else None,
+            'upload_date': document.upload_date.isoformat(),
+        },
+    }, status=201)
@@ -0,0 +1,353 @@
+"""
+Resumable chunked uploads of document files.
+
+The protocol has three steps, all JSON (custom_requests.upload_views):
+
+1. init: the client announces the file (name, size, content type) and the
+   fields of the document to create. An UploadSession is created and its
+   id returned;
+2. chunks: the client sends the file in consecutive chunks, each one as the
+   raw body of a PATCH request with an Upload-Offset header giving its
+   position. The server only accepts a chunk that starts at the committed
+   offset (409 with the current offset otherwise). After a dropped
+   connection the client asks for the offset (GET) and resumes from there,
+   so only the interrupted chunk is sent again;
+3. complete: once every byte has been received, the part file is copied
+   into Document.file storage and the document is created.
+
+A client may send the SHA-256 of the file on init. When the user already
+has a document with that content (see custom_requests.storage), the upload
+starts complete and the new document shares the existing blob: no byte is
+sent again. Only the user's own files are matched, so knowing the hash of
+someone else's file gives no access to it. If that content is deleted before
+the upload is completed, completion answers 409 with offset 0 and the
+client sends the file after all.
+
+Chunks are read from the request stream in blocks and appended to a part
+file in CHUNKED_UPLOAD_TEMP_DIR, never held in memory. Each chunk is hashed
+while it arrives. A chunk sent with an `Upload-Checksum: sha256 <hex>`
+header is rejected, and the part file truncated back to the committed
+offset, when it does not match. The SHA-256 of the whole file is computed
+in the single pass that copies the part file to storage on completion
+(a hash state cannot be kept between requests served by different
+processes). The client may send it to have the file verified.
+
+A chunk is bounded by CHUNKED_UPLOAD_MAX_CHUNK_SIZE, so a slow client ties
+up a worker for at most one chunk; behind nginx, whose request buffering is
+on by default, the worker only sees each chunk once it has fully arrived.
+The 1 MB default takes 8 seconds at 1 Mbit/s, well within gunicorn's
+30-second worker timeout (gunicorn.conf.py); raise both together.
+Abandoned sessions are removed by the purge_stale_uploads command.
+
+Appending a chunk and completing an upload both hold a lock on the
+UploadSession row (select_for_update) until they commit: a concurrent chunk
+at the same offset waits, then finds the new offset and is refused without
+touching the part file, and a second completion finds the document created
+by the first.
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from services.email_notifications import EmailNotificationService
+from .blobs import release_blob
+from .models import Document, DocumentBlob, Notification, RendezVous, ServiceRequest, UploadSession
+from .storage import blob_name, blob_sha256
+
+READ_BLOCK_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """Invalid upload step; `status` is the HTTP status to answer with"""
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+def max_upload_size():
+    return getattr(settings, 'CHUNKED_UPLOAD_MAX_SIZE', 100 * 1024 * 1024)
+
+
+def max_chunk_size():
+    return getattr(settings, 'CHUNKED_UPLOAD_MAX_CHUNK_SIZE', 1024 * 1024)
+
+
+def upload_temp_dir():
+    return getattr(settings, 'CHUNKED_UPLOAD_TEMP_DIR', None) or os.path.join(tempfile.gettempdir(), 'servicesbladi-uploads')
+
+
+def part_path(upload):
+    return os.path.join(upload_temp_dir(), f'{upload.pk}.part')
+
+
+def _related_objects(user, metadata):
+    """Request and appointment the document is attached to, if the user may attach to them"""
+    service_request = rendez_vous = None
+    if metadata.get('service_request_id'):
+        service_request = ServiceRequest.objects.filter(pk=metadata['service_request_id']).first()
+        if service_request is None:
+            raise UploadError('Demande non trouvée', status=404)
+        if user.account_type == 'expert' and service_request.expert_id != user.pk:
+            raise UploadError("Vous n'êtes pas autorisé à ajouter des documents à cette demande", status=403)
+        if user.account_type == 'client' and service_request.client_id != user.pk:
+            raise UploadError("Vous n'êtes pas autorisé à ajouter des documents à cette demande", status=403)
+    if metadata.get('rendez_vous_id'):
+        rendez_vous = RendezVous.objects.filter(pk=metadata['rendez_vous_id']).first()
+        if rendez_vous is None:
+            raise UploadError('Rendez-vous non trouvé', status=404)
+        if user.account_type != 'admin' and user.pk not in (rendez_vous.client_id, rendez_vous.expert_id):
+            raise UploadError("Vous n'êtes pas autorisé à ajouter des documents à ce rendez-vous", status=403)
+    return service_request, rendez_vous
+
+
+def init_upload(user, filename, size, content_type='', sha256=None, **metadata):
+    """Start an upload session for a file of `size` bytes, already complete if the user has this content"""
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise UploadError('Taille de fichier invalide')
+    if not filename:
+        raise UploadError('Nom de fichier manquant')
+    if size <= 0 or size > max_upload_size():
+        raise UploadError(f'La taille du fichier doit être comprise entre 1 et {max_upload_size()} octets', status=413)
+    metadata['name'] = metadata.get('name') or filename
+    _related_objects(user, metadata)
+
+    upload = UploadSession(
+        user=user, filename=os.path.basename(filename)[:255], content_type=content_type[:100],
+        size=size, metadata=metadata,
+    )
+    if sha256 and not re.fullmatch(r'[0-9a-fA-F]{64}', sha256):
+        raise UploadError('Somme de contrôle SHA-256 invalide')
+    existing = blob_name(sha256.lower()) if sha256 else None
+    if (existing and Document.objects.filter(uploaded_by=user, file=existing).exists()
+            and Document.file.field.storage.exists(existing)):
+        upload.offset = size
+        upload.sha256 = sha256.lower()
+        upload.metadata['blob'] = existing
+        upload.save()
+        return upload
+
+    upload.save()
+    os.makedirs(upload_temp_dir(), exist_ok=True)
+    open(part_path(upload), 'wb').close()
+    return upload
+
+
+def _parse_checksum(header):
+    if not header:
+        return None
+    algorithm, _, value = header.partition(' ')
+    if algorithm.lower() != 'sha256' or not value:
+        raise UploadError('En-tête Upload-Checksum invalide, attendu "sha256 <hex>"')
+    return value.strip().lower()
+
+
+def _check_offset(upload, offset):
+    if upload.status != 'uploading':
+        raise UploadError('Téléchargement déjà terminé', status=409, offset=upload.offset)
+    if offset != upload.offset:
+        raise UploadError('Position inattendue', status=409, offset=upload.offset)
+
+
+def _lock(upload):
+    """Reload `upload` with its row locked until the end of the transaction"""
+    locked = UploadSession.objects.select_for_update().get(pk=upload.pk)
+    for field in ('offset', 'status', 'sha256', 'document_id'):
+        setattr(upload, field, getattr(locked, field))
+    return upload
+
+
+def append_chunk(upload, offset, stream, length, checksum_header=None):
+    """Append `length` bytes read from `stream` at `offset`; returns the new offset"""
+    _check_offset(upload, offset)
+    if length <= 0:
+        raise UploadError('Morceau vide')
+    if length > max_chunk_size():
+        raise UploadError(f'Morceau trop grand (max. {max_chunk_size()} octets)', status=413)
+    if offset + length > upload.size:
+        raise UploadError('Le morceau dépasse la taille annoncée du fichier')
+    expected = _parse_checksum(checksum_header)
+
+    with transaction.atomic():
+        # A concurrent chunk at the same offset commits first, then this one is refused
+        _check_offset(_lock(upload), offset)
+
+        digest = hashlib.sha256()
+        received = 0
+        with open(part_path(upload), 'r+b') as part:
+            # Bytes of an interrupted chunk are dropped
+            part.truncate(offset)
+            part.seek(offset)
+            while received < length:
+                block = stream.read(min(READ_BLOCK_SIZE, length - received))
+                if not block:
+                    break
+                part.write(block)
+                digest.update(block)
+                received += len(block)
+
+            if received != length:
+                part.truncate(offset)
+                raise UploadError('Morceau incomplet', offset=offset)
+            if expected and digest.hexdigest() != expected:
+                part.truncate(offset)
+                raise UploadError('Somme de contrôle du morceau invalide', status=460, offset=offset)
+
+        UploadSession.objects.filter(pk=upload.pk).update(offset=offset + length, updated_at=timezone.now())
+    upload.offset = offset + length
+    return upload.offset
+
+
+class _HashingFile(File):
+    """File whose chunks update a SHA-256 digest as storage reads them"""
+
+    def __init__(self, file, name):
+        super().__init__(file, name)
+        self.digest = hashlib.sha256()
+
+    def chunks(self, chunk_size=None):
+        for chunk in super().chunks(chunk_size):
+            self.digest.update(chunk)
+            yield chunk
+
+
+def _lock_blob(name):
+    """Lock the row of a blob until the end of the transaction; False if it was removed"""
+    blob = DocumentBlob.objects.select_for_update().filter(pk=blob_sha256(name)).first()
+    return blob is not None and Document.file.field.storage.exists(name)
+
+
+def _restart(upload):
+    """Turn a session that matched a removed blob into a regular upload"""
+    upload.offset = 0
+    upload.sha256 = ''
+    del upload.metadata['blob']
+    upload.save(update_fields=['offset', 'sha256', 'metadata', 'updated_at'])
+    os.makedirs(upload_temp_dir(), exist_ok=True)
+    open(part_path(upload), 'wb').close()
+
+
+def complete_upload(upload, sha256=None):
+    """Move the received file into storage and create its Document"""
+    with transaction.atomic():
+        # A concurrent completion waits here, then returns the document of the first
+        if _lock(upload).status == 'completed':
+            return upload.document
+        if upload.offset != upload.size:
+            raise UploadError('Fichier incomplet', status=409, offset=upload.offset)
+        # The blob stays locked until the document referencing it is saved
+        if upload.metadata.get('blob') and not _lock_blob(upload.metadata['blob']):
+            _restart(upload)
+            document = None
+        else:
+            document = _create_document(upload, sha256)
+
+    if document is None:
+        raise UploadError('Le fichier doit être envoyé', status=409, offset=0)
+    if not upload.metadata.get('blob'):
+        os.remove(part_path(upload))
+
+    notify_document_uploaded(document, upload.user)
+    return document
+
+
+def _create_document(upload, sha256):
+    metadata = upload.metadata
+    service_request, rendez_vous = _related_objects(upload.user, metadata)
+    document = Document(
+        service_request=service_request,
+        rendez_vous=rendez_vous,
+        uploaded_by=upload.user,
+        type=metadata.get('type') or 'other',
+        name=metadata['name'],
+        mime_type=upload.content_type,
+        file_size=upload.size // 1024,  # Convert to KB
+        is_official=bool(metadata.get('is_official')),
+        reference_number=metadata.get('reference_number', ''),
+    )
+
+    if metadata.get('blob'):
+        # Same content as one of the user's documents: share its blob
+        document.file.name = metadata['blob']
+        checksum = upload.sha256
+    else:
+        with open(part_path(upload), 'rb') as part:
+            content = _HashingFile(part, upload.filename)
+            document.file.save(upload.filename, content, save=False)
+        checksum = content.digest.hexdigest()
+        if sha256 and sha256.lower() != checksum:
+            # Removed unless other documents share this content
+            release_blob(document.file.name)
+            raise UploadError('Somme de contrôle du fichier invalide', status=460)
+
+    document.save()
+    upload.document = document
+    upload.sha256 = checksum
+    upload.status = 'completed'
+    upload.save(update_fields=['document', 'sha256', 'status', 'updated_at'])
+    return document
+
+
+def notify_document_uploaded(document, user):
+    """Notify the other party of the request or appointment of a new document"""
+    demande, rendez_vous = document.service_request, document.rendez_vous
+    uploader = f'{user.name} {user.first_name}'
+
+    if demande:
+        if user.account_type == 'client':
+            recipient = demande.expert
+            content = f'Un nouveau document "{document.name}" a été téléchargé par {uploader} pour la demande "{demande.title}".'
+        else:
+            recipient = demande.client
+            content = f'Un nouveau document "{document.name}" a été téléchargé par votre expert pour votre demande "{demande.title}".'
+        if recipient:
+            Notification.objects.create(
+                user=recipient, type='document', title='Nouveau document téléchargé',
+                content=content, related_service_request=demande,
+            )
+            try:
+                EmailNotificationService.send_document_uploaded_notification(user, recipient, document, demande)
+            except Exception:
+                pass  # Fail silently
+
+    if rendez_vous:
+        date = rendez_vous.date_time.strftime("%d/%m/%Y à %H:%M")
+        if user.account_type == 'client':
+            recipient = rendez_vous.expert
+            content = f'Un nouveau document "{document.name}" a été téléchargé par {uploader} pour le rendez-vous du {date}.'
+        else:
+            recipient = rendez_vous.client
+            content = f'Un nouveau document "{document.name}" a été téléchargé par votre expert pour le rendez-vous du {date}.'
+        Notification.objects.create(
+            user=recipient, type='document', title='Nouveau document téléchargé',
+            content=content, related_rendez_vous=rendez_vous,
+        )
+        try:
+            EmailNotificationService.send_document_uploaded_notification(user, recipient, document, None)
+        except Exception:
+            pass  # Fail silently
+
+
+def purge_stale_uploads(older_than=timedelta(hours=24)):
+    """Delete the unfinished sessions inactive for `older_than` and their part files; returns their number"""
+    stale = UploadSession.objects.filter(status='uploading', updated_at__lt=timezone.now() - older_than)
+    count = 0
+    for upload in stale.iterator():
+        try:
+            os.remove(part_path(upload))
+        except FileNotFoundError:
+            pass
+        upload.delete()
+        count += 1
+    return count
@@ -4,6 +4,7 @@ from . import message_views
 from . import client_views
 from . import admin_views
 from . import expert_views
+from . import upload_views
 
 app_name = 'custom_requests'
 
@@ -37,6 +38,7 @@ urlpatterns = [
     path('documents/delete/<int:document_id>/', views.delete_document_view, name='delete_document'),
     path('documents/download/<int:document_id>/', views.download_document_view, name='download_document'),
     path('documents/view/<int:document_id>/', views.view_document_view, name='view_document'),
+    path('documents/preview/<int:document_id>/', views.document_preview_view, name='document_preview'),
     
     # Messaging views
     path('messages/', views.messages_view, name='messages'),
@@ -52,6 +54,9 @@ urlpatterns = [
     path('api/appointments/', views.api_client_appointments, name='api_appointments'),
     path('api/expert/requests/', views.api_expert_requests, name='api_expert_requests'),    path('api/documents/upload/', views.api_upload_document, name='api_upload_document'),
     path('api/messages/', views.api_messages, name='api_messages'),
+    path('api/uploads/', upload_views.upload_init, name='upload_init'),
+    path('api/uploads/<uuid:upload_id>/', upload_views.upload_chunk, name='upload_chunk'),
+    path('api/uploads/<uuid:upload_id>/complete/', upload_views.upload_complete, name='upload_complete'),
     path('api/client/appointments/', client_views.client_appointments_api, name='client_appointments_api'),
     path('api/client/appointments/<int:appointment_id>/cancel/', client_views.cancel_appointment_api, name='cancel_appointment_api'),
     
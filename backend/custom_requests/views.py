@@ -8,6 +8,7 @@ from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from django.contrib import messages
 from django.core.exceptions import PermissionDenied
+from django.urls import reverse
 import json
 import os
 import mimetypes
@@ -16,7 +17,12 @@ import logging
 from accounts.models import Utilisateur, Client, Expert
 from services.models import Service, ServiceCategory
 from .models import ServiceRequest, RendezVous, Document, Message, Notification, ContactMessage
+from .dashboard_data import invalidate_dashboards
+from .document_access import accessible_documents, get_accessible_document
+from .storage import blob_sha256
+from .uploads import notify_document_uploaded
 from services.email_notifications import EmailNotificationService
+from servicesbladi.protected_media import serve_protected_file
 from django.core.mail import send_mail
 from django.conf import settings
 
@@ -131,6 +137,14 @@ def create_request_view(request, service_id):
                     related_service_request=demande
                 )
             
+            # Sent without its files by static/js/chunked-upload.js, which then uploads them in chunks
+            if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+                return JsonResponse({
+                    'success': True,
+                    'demande_id': demande.pk,
+                    'redirect_url': reverse('custom_requests:client_requests'),
+                })
+            
             # Redirect to client requests view using the consistent URL naming
             return redirect('custom_requests:client_requests')
             
@@ -730,46 +744,13 @@ def documents_view(request):
     search = request.GET.get('search')
     date_filter = request.GET.get('date')
     
-    documents_query = Document.objects.all()
+    # Apply user filter: the documents the user may read (same policy as downloads)
+    documents_query = accessible_documents(request.user)
     
-    # Apply user filter
     if request.user.account_type == 'client':
-        try:
-            client = Client.objects.get(user=request.user)
-            # Get documents from client's requests - fixed to use correct field names
-            documents_query = documents_query.filter(
-                Q(service_request__client=request.user) |
-                Q(rendez_vous__client=request.user) |
-                Q(uploaded_by=request.user)
-            ).distinct()
-            
-            # Get client's service requests for the upload form
-            service_requests = ServiceRequest.objects.filter(client=request.user).order_by('-created_at')
-            
-        except Client.DoesNotExist:
-            documents_query = documents_query.filter(uploaded_by=request.user)
-            service_requests = []
-    
-    elif request.user.account_type == 'expert':
-        try:
-            expert = Expert.objects.get(user=request.user)
-            # Get documents from expert's assigned requests
-            documents_query = documents_query.filter(
-                Q(service_request__expert=expert.user) |
-                Q(rendez_vous__expert=expert.user) |
-                Q(uploaded_by=request.user)
-            ).distinct()
-            service_requests = []
-        except Expert.DoesNotExist:
-            documents_query = documents_query.filter(uploaded_by=request.user)
-            service_requests = []
-    
-    elif request.user.account_type == 'admin':
-        # Admins can see all documents
-        service_requests = []
-    
+        # Get client's service requests for the upload form
+        service_requests = ServiceRequest.objects.filter(client=request.user).order_by('-created_at')
     else:
-        documents_query = Document.objects.none()
         service_requests = []
     
     # Apply type filter
@@ -875,77 +856,8 @@ def upload_document_view(request):
                 reference_number=reference_number
             )
             
-            # Create notifications
-            if demande:
-                if request.user.account_type == 'client':
-                    # Notify assigned expert if any
-                    if demande.expert:
-                        Notification.objects.create(
-                            user=demande.expert,
-                            type='document',
-                            title='Nouveau document téléchargé',
-                            content=f'Un nouveau document "{document.name}" a été téléchargé par {request.user.name} {request.user.first_name} pour la demande "{demande.title}".',
-                            related_service_request=demande
-                        )
-                        
-                        # Send email notification to expert
-                        try:
-                            EmailNotificationService.send_document_uploaded_notification(
-                                request.user, demande.expert, document, demande
-                            )
-                        except:
-                            pass  # Fail silently
-                else:
-                    # Notify client
-                    Notification.objects.create(
-                        user=demande.client,
-                        type='document',
-                        title='Nouveau document téléchargé',
-                        content=f'Un nouveau document "{document.name}" a été téléchargé par votre expert pour votre demande "{demande.title}".',
-                        related_service_request=demande
-                    )
-                    
-                    # Send email notification to client
-                    try:
-                        EmailNotificationService.send_document_uploaded_notification(
-                            request.user, demande.client, document, demande
-                        )
-                    except:
-                        pass  # Fail silently
-            
-            if rendez_vous:
-                if request.user.account_type == 'client':
-                    # Notify expert
-                    Notification.objects.create(
-                        user=rendez_vous.expert,
-                        type='document',
-                        title='Nouveau document téléchargé',
-                        content=f'Un nouveau document "{document.name}" a été téléchargé par {request.user.name} {request.user.first_name} pour le rendez-vous du {rendez_vous.date_time.strftime("%d/%m/%Y à %H:%M")}.',
-                    )
-                    
-                    # Send email notification to expert
-                    try:
-                        EmailNotificationService.send_document_uploaded_notification(
-                            request.user, rendez_vous.expert, document, None
-                        )
-                    except:
-                        pass  # Fail silently
-                else:
-                    # Notify client
-                    Notification.objects.create(
-                        user=rendez_vous.client,
-                        type='document',
-                        title='Nouveau document téléchargé',
-                        content=f'Un nouveau document "{document.name}" a été téléchargé par votre expert pour le rendez-vous du {rendez_vous.date_time.strftime("%d/%m/%Y à %H:%M")}.',
-                    )
-                    
-                    # Send email notification to client
-                    try:
-                        EmailNotificationService.send_document_uploaded_notification(
-                            request.user, rendez_vous.client, document, None
-                        )
-                    except:
-                        pass  # Fail silently
+            # Notify the other party of the request or appointment
+            notify_document_uploaded(document, request.user)
             
             if is_ajax:
                 return JsonResponse({'success': True, 'message': 'Document téléchargé avec succès'})
@@ -1207,6 +1119,7 @@ def notifications_view(request):
     # Mark all as read if requested
     if request.GET.get('mark_all_read'):
         notifications.filter(is_read=False).update(is_read=True)
+        invalidate_dashboards([request.user.pk])
     
     context = {
         'notifications': notifications,
@@ -1270,6 +1183,7 @@ def mark_all_notifications_read(request):
     try:
         # Marquer toutes les notifications non lues comme lues
         updated = Notification.objects.filter(user=request.user, is_read=False).update(is_read=True)
+        invalidate_dashboards([request.user.pk])
         
         return JsonResponse({
             'success': True,
@@ -1685,7 +1599,7 @@ def api_expert_requests(request):
 @csrf_exempt
 @require_POST
 def api_upload_document(request):
-    """API endpoint to upload a document"""
+    """API endpoint to upload a document in a single request (the upload forms use the chunked upload endpoints)"""
     try:
         data = request.POST
         file = request.FILES.get('file')
@@ -1770,7 +1684,7 @@ def api_upload_document(request):
                 'id': document.id,
                 'name': document.name,
                 'type': document.type,
-                'file_url': document.file.url if document.file else None,
+                'file_url': reverse('custom_requests:view_document', args=[document.pk]) if document.file else None,
                 'upload_date': document.upload_date.isoformat()
             }
         })
@@ -2169,88 +2083,39 @@ ID du message: {contact_message.id}
 @login_required
 def download_document_view(request, document_id):
     """Download a document"""
-    try:
-        document = get_object_or_404(Document, id=document_id)
-        
-        # Check permissions
-        if request.user.account_type == 'client':
-            if not (document.service_request and document.service_request.client == request.user) and \
-               not (document.rendez_vous and document.rendez_vous.client == request.user) and \
-               document.uploaded_by != request.user:
-                raise PermissionDenied("You don't have permission to access this document.")
-        elif request.user.account_type == 'expert':
-            expert = Expert.objects.get(user=request.user)
-            if not (document.service_request and document.service_request.expert == expert.user) and \
-               not (document.rendez_vous and document.rendez_vous.expert == expert.user) and \
-               document.uploaded_by != request.user:
-                raise PermissionDenied("You don't have permission to access this document.")
-        elif not request.user.is_staff:
-            raise PermissionDenied("You don't have permission to access this document.")
-        
-        # Return file response
-        from django.http import FileResponse, Http404
-        import os
-        
-        if not document.file or not os.path.exists(document.file.path):
-            raise Http404("Document file not found.")
-        
-        response = FileResponse(
-            open(document.file.path, 'rb'),
-            as_attachment=True,
-            filename=document.name
-        )
-        response['Content-Type'] = document.mime_type or 'application/octet-stream'
-        return response
-        
-    except Document.DoesNotExist:
-        raise Http404("Document not found.")
-    except Expert.DoesNotExist:
-        raise PermissionDenied("Expert profile not found.")
+    from django.http import Http404
+    
+    # One query: the document only if the user may read it
+    document = get_accessible_document(request.user, document_id)
+    if not document.file:
+        raise Http404("Document file not found.")
+    
+    # Return file response, sent by the front server if configured
+    return serve_protected_file(request, document.file, document.name, content_type=document.mime_type,
+                                etag=blob_sha256(document.file.name))
 
 @login_required 
 def view_document_view(request, document_id):
     """View a document in browser"""
-    try:
-        document = get_object_or_404(Document, id=document_id)
-        
-        # Check permissions (same as download)
-        if request.user.account_type == 'client':
-            if not (document.service_request and document.service_request.client == request.user) and \
-               not (document.rendez_vous and document.rendez_vous.client == request.user) and \
-               document.uploaded_by != request.user:
-                raise PermissionDenied("You don't have permission to access this document.")
-        elif request.user.account_type == 'expert':
-            expert = Expert.objects.get(user=request.user)
-            if not (document.service_request and document.service_request.expert == expert.user) and \
-               not (document.rendez_vous and document.rendez_vous.expert == expert.user) and \
-               document.uploaded_by != request.user:
-                raise PermissionDenied("You don't have permission to access this document.")
-        elif not request.user.is_staff:
-            raise PermissionDenied("You don't have permission to access this document.")
-        
-        # Return file response for viewing
-        from django.http import FileResponse, Http404
-        import os
-        
-        if not document.file or not os.path.exists(document.file.path):
-            raise Http404("Document file not found.")
-        
-        response = FileResponse(
-            open(document.file.path, 'rb'),
-            as_attachment=False,  # View in browser
-            filename=document.name
-        )
-        response['Content-Type'] = document.mime_type or 'application/octet-stream'
-        
-        # Set content disposition for inline viewing of supported formats
-        if document.mime_type and (document.mime_type.startswith('image/') or 
-                                  document.mime_type == 'application/pdf' or
-                                  document.mime_type.startswith('text/')):
-            response['Content-Disposition'] = f'inline; filename="{document.name}"'
-        
-        return response
-        
-    except Document.DoesNotExist:
-        raise Http404("Document not found.")
-    except Expert.DoesNotExist:
-        raise PermissionDenied("Expert profile not found.")
+    from django.http import Http404
+    
+    document = get_accessible_document(request.user, document_id)
+    if not document.file:
+        raise Http404("Document file not found.")
+    
+    # Return file response for viewing in browser
+    return serve_protected_file(request, document.file, document.name, content_type=document.mime_type,
+                                as_attachment=False, etag=blob_sha256(document.file.name))
+
+@login_required
+def document_preview_view(request, document_id):
+    """Thumbnail of a document, for the document lists (see custom_requests.previews)"""
+    from django.http import Http404
+    
+    document = get_accessible_document(request.user, document_id)
+    if not document.preview:
+        raise Http404("No preview for this document.")
+    
+    # Previews change with the file only: browsers may keep them for PREVIEW_MAX_AGE without asking
+    return serve_protected_file(request, document.preview, f'{document.pk}.jpg', content_type='image/jpeg',
+                                as_attachment=False, max_age=getattr(settings, 'PREVIEW_MAX_AGE', 86400))
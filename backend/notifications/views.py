@@ -7,6 +7,7 @@ from django.utils import timezone
 from django.core.paginator import Paginator
 from django.db.models import Q
 
+from custom_requests.dashboard_data import invalidate_dashboards
 from custom_requests.models import Notification
 
 
@@ -94,6 +95,7 @@ def mark_all_notifications_read(request):
             user=request.user,
             is_read=False
         ).update(is_read=True)
+        invalidate_dashboards([request.user.pk])
         
         return JsonResponse({
             'success': True,
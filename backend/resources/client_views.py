@@ -1,10 +1,11 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
-from django.http import FileResponse
 from django.db.models import F
 from django.contrib import messages
 from django.utils.translation import gettext_lazy as _
 
+from servicesbladi.protected_media import is_full_download, serve_protected_file
+
 from .models import Resource, ResourceFile, ResourceLink
 from accounts.models import Client
 
@@ -44,12 +45,11 @@ def client_download_resource_view(request, resource_file_id):
         messages.error(request, _('This resource is not available.'))
         return redirect('resources:client_resources')
     
-    # Increment download count
-    Resource.objects.filter(id=resource_file.resource.id).update(download_count=F('download_count') + 1)
+    # Return the file as a response, sent by the front server if configured
+    response = serve_protected_file(request, resource_file.file, resource_file.file.name.split('/')[-1])
+    
+    # Increment download count, once per full download (not for 304s or byte ranges)
+    if is_full_download(request, response):
+        Resource.objects.filter(id=resource_file.resource_id).update(download_count=F('download_count') + 1)
     
-    # Return the file as a response
-    return FileResponse(
-        resource_file.file, 
-        as_attachment=True, 
-        filename=resource_file.file.name.split('/')[-1]
-    )
+    return response
@@ -1,7 +1,10 @@
-from django.test import TestCase, Client
+import tempfile
+
+from django.core.files.base import ContentFile
+from django.test import TestCase, Client, override_settings
 from django.urls import reverse
 from django.contrib.auth import get_user_model
-from resources.models import Resource
+from resources.models import Resource, ResourceFile
 
 User = get_user_model()
 
@@ -67,3 +70,43 @@ class ResourceViewTest(TestCase):
         self.client.login(email='test@example.com', password='testpass123')
         response = self.client.get(reverse('resources:resource_list'))
         self.assertEqual(response.status_code, 200)
+
+
+class ResourceDownloadTest(TestCase):
+    """Test the download of resource files"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(MEDIA_ROOT=self.temp_dir.name)
+        self.settings_override.enable()
+        user = User.objects.create_user(email='admin@example.com', password='testpass123', account_type='admin')
+        self.resource = Resource.objects.create(category='administrative', title='Guide', description='Guide',
+                                                created_by=user)
+        self.resource_file = ResourceFile(resource=self.resource, language='fr')
+        self.resource_file.file.save('guide.pdf', ContentFile(b'%PDF-1.4'))
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.temp_dir.cleanup()
+
+    def test_only_full_downloads_are_counted(self):
+        url = reverse('resources:download_resource', args=[self.resource_file.pk])
+        response = self.client.get(url)
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF-1.4')
+        self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.client.get(url, HTTP_RANGE='bytes=0-3')
+
+        self.resource.refresh_from_db()
+        self.assertEqual(self.resource.download_count, 1)
+
+    @override_settings(PROTECTED_MEDIA_BACKEND='nginx')
+    def test_range_requests_are_not_counted_behind_nginx(self):
+        url = reverse('resources:download_resource', args=[self.resource_file.pk])
+        # nginx cuts the range itself: Django answers 200 with X-Accel-Redirect
+        response = self.client.get(url, HTTP_RANGE='bytes=0-3')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('X-Accel-Redirect', response)
+        self.client.get(url)
+
+        self.resource.refresh_from_db()
+        self.assertEqual(self.resource.download_count, 1)
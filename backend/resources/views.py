@@ -1,11 +1,13 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse, FileResponse
+from django.http import JsonResponse
 from django.utils.translation import gettext_lazy as _
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import translation
 from django.db.models import Q, F
 
+from servicesbladi.protected_media import is_full_download, serve_protected_file
+
 from .models import Resource, ResourceFile, ResourceLink, ConsulateEmbassy, FAQ
 
 # Resource views
@@ -87,15 +89,14 @@ def download_resource_view(request, resource_file_id):
     """Download a resource file"""
     resource_file = get_object_or_404(ResourceFile, id=resource_file_id)
     
-    # Increment download count for the resource
-    Resource.objects.filter(id=resource_file.resource.id).update(download_count=F('download_count') + 1)
+    # Return the file as a response, sent by the front server if configured
+    response = serve_protected_file(request, resource_file.file, resource_file.file.name.split('/')[-1])
+    
+    # Increment download count for the resource, once per full download (not for 304s or byte ranges)
+    if is_full_download(request, response):
+        Resource.objects.filter(id=resource_file.resource_id).update(download_count=F('download_count') + 1)
     
-    # Return the file as a response
-    return FileResponse(
-        resource_file.file, 
-        as_attachment=True, 
-        filename=resource_file.file.name.split('/')[-1]
-    )
+    return response
 
 # Expert resource management views
 @login_required
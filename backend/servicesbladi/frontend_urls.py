@@ -37,13 +37,14 @@ from custom_requests.admin_views import (
     admin_add_resource, admin_edit_resource, admin_delete_resource,
     admin_toggle_resource_visibility, admin_messages_view, admin_mark_message_read,
     admin_profile_view, admin_edit_profile_view, admin_assign_expert, admin_update_request_status,
-    admin_request_detail, admin_send_message, admin_user_detail
+    admin_request_detail, admin_send_message, admin_user_detail, admin_search_api,
+    admin_export_view
 )
 
 # Import admin bulk action views
 from custom_requests.admin_bulk_actions import (
     admin_bulk_toggle_users_status, admin_bulk_delete_users,
-    admin_bulk_verify_documents, admin_bulk_reject_documents
+    admin_bulk_verify_documents, admin_bulk_reject_documents, admin_bulk_job_status
 )
 
 from custom_requests.models import ServiceRequest, Message, Notification
@@ -111,6 +112,7 @@ urlpatterns = [    # Main pages
     path('admin/users/<int:user_id>/edit/', admin_edit_user, name='admin_edit_user'),
     path('admin/documents/bulk-verify/', admin_bulk_verify_documents, name='admin_bulk_verify_documents'),
     path('admin/documents/bulk-reject/', admin_bulk_reject_documents, name='admin_bulk_reject_documents'),
+    path('admin/bulk-jobs/<int:job_id>/', admin_bulk_job_status, name='admin_bulk_job_status'),
     path('admin/documents/<int:document_id>/verify/', admin_verify_document, name='admin_verify_document'),
     path('admin/documents/<int:document_id>/reject/', admin_reject_document, name='admin_reject_document'),
     path('admin/documents/<int:document_id>/delete/', admin_delete_document, name='admin_delete_document'),
@@ -128,6 +130,8 @@ urlpatterns = [    # Main pages
     path('admin/demandes/<int:request_id>/assign-expert/', admin_assign_expert, name='admin_assign_expert'),
     path('admin/demandes/<int:request_id>/update-status/', admin_update_request_status, name='admin_update_request_status'),
     path('admin/send-message/', admin_send_message, name='admin_send_message'),
+    path('admin/search/', admin_search_api, name='admin_search'),
+    path('admin/export/<str:listing>/', admin_export_view, name='admin_export'),
     
     # Additional client routes that may have been missing
     path('client/demandes/detail/<int:request_id>/', client_requests_view, name='client_request_detail'),
@@ -0,0 +1,217 @@
+"""
+Envoi des fichiers média protégés (documents, ressources) après contrôle d'accès
+
+Django vérifie les droits puis, selon PROTECTED_MEDIA_BACKEND, délègue le
+transfert au serveur frontal au lieu de lire le fichier lui-même :
+
+- "django" (par défaut, développement) : FileResponse, le fichier est lu et
+  envoyé par le worker ;
+- "nginx" : en-tête X-Accel-Redirect vers PROTECTED_MEDIA_INTERNAL_URL, une
+  location `internal` de nginx qui pointe sur MEDIA_ROOT ;
+- "sendfile" : en-tête X-Sendfile avec le chemin absolu du fichier (Apache
+  mod_xsendfile, lighttpd).
+
+Avec nginx ou sendfile, le worker ne fait que la requête SQL et l'écriture
+des en-têtes : le transfert, même d'un gros PDF, ne l'occupe plus. Exemple
+de configuration nginx :
+
+    location /protected-media/ {
+        internal;
+        alias /chemin/vers/media/;
+    }
+
+Le type MIME et le Content-Disposition sont toujours fixés par Django, les
+fichiers stockés par contenu (custom_requests.storage) n'ayant pas
+d'extension.
+
+Les réponses portent un ETag (l'empreinte du contenu quand l'appelant la
+connaît, sinon date de modification et taille) et un Last-Modified, avec
+Cache-Control: private, no-cache : le navigateur garde le fichier et le
+revalide, une nouvelle consultation ne coûte qu'un 304. Avec le backend
+"django", les requêtes Range reçoivent un 206 (une plage, ou plusieurs en
+multipart/byteranges), ce qui permet au lecteur PDF d'afficher les pages au
+fil du chargement ; nginx et sendfile gèrent eux-mêmes les plages.
+"""
+
+import mimetypes
+import os
+import uuid
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+READ_BLOCK_SIZE = 64 * 1024
+# Au-delà, l'en-tête Range est ignoré et le fichier envoyé en entier (RFC 9110, 14.2)
+MAX_RANGES = 16
+
+BACKENDS = ('django', 'nginx', 'sendfile')
+
+
+def protected_media_backend():
+    backend = getattr(settings, 'PROTECTED_MEDIA_BACKEND', 'django')
+    if backend not in BACKENDS:
+        raise ValueError(f'PROTECTED_MEDIA_BACKEND invalide : {backend!r} (attendu : {", ".join(BACKENDS)})')
+    return backend
+
+
+def internal_url(name):
+    """URL interne nginx d'un fichier de MEDIA_ROOT"""
+    prefix = getattr(settings, 'PROTECTED_MEDIA_INTERNAL_URL', '/protected-media/')
+    return prefix.rstrip('/') + '/' + quote(name.lstrip('/'))
+
+
+def parse_range(header, size):
+    """Plages (début, fin incluse) demandées par un en-tête Range ; None s'il faut l'ignorer, [] si aucune n'est satisfiable"""
+    unit, _, specs = (header or '').partition('=')
+    if unit.strip().lower() != 'bytes' or not specs:
+        return None
+    specs = specs.split(',')
+    if len(specs) > MAX_RANGES:
+        return None
+    ranges = []
+    for spec in specs:
+        first, sep, last = spec.strip().partition('-')
+        if not sep:
+            return None
+        try:
+            if first:
+                start, end = int(first), int(last) if last else size - 1
+            else:
+                start, end = size - int(last), size - 1  # Les `last` derniers octets
+        except ValueError:
+            return None
+        if start < 0:
+            start = 0
+        if first and last and end < start:
+            return None
+        if start < size and end >= start:
+            ranges.append((start, min(end, size - 1)))
+    return ranges
+
+
+def _read_range(file, start, end):
+    file.seek(start)
+    remaining = end - start + 1
+    while remaining > 0:
+        block = file.read(min(READ_BLOCK_SIZE, remaining))
+        if not block:
+            break
+        remaining -= len(block)
+        yield block
+
+
+def _range_response(field_file, ranges, size, content_type):
+    # Les générateurs ouvrent le fichier à la première lecture ; la réponse les ferme
+    if len(ranges) == 1:
+        start, end = ranges[0]
+
+        def body():
+            with field_file.open('rb') as file:
+                yield from _read_range(file, start, end)
+
+        response = StreamingHttpResponse(body(), status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+        return response
+
+    boundary = uuid.uuid4().hex
+    headers = [
+        f'--{boundary}\r\nContent-Type: {content_type}\r\nContent-Range: bytes {start}-{end}/{size}\r\n\r\n'.encode()
+        for start, end in ranges
+    ]
+    trailer = f'\r\n--{boundary}--\r\n'.encode()
+
+    def parts():
+        with field_file.open('rb') as file:
+            for i, (start, end) in enumerate(ranges):
+                yield (b'\r\n' if i else b'') + headers[i]
+                yield from _read_range(file, start, end)
+        yield trailer
+
+    length = sum(len(h) for h in headers) + 2 * (len(ranges) - 1) + len(trailer)
+    length += sum(end - start + 1 for start, end in ranges)
+    response = StreamingHttpResponse(parts(), status=206, content_type=f'multipart/byteranges; boundary={boundary}')
+    response['Content-Length'] = str(length)
+    return response
+
+
+def serve_protected_file(request, field_file, filename, content_type=None, as_attachment=True, etag=None,
+                         max_age=None, public=False):
+    """Réponse envoyant `field_file` (FieldFile) sous le nom `filename`, déléguée au serveur frontal si configuré
+
+    `etag` : empreinte du contenu si connue (sinon dérivée de la date de
+    modification et de la taille). `max_age` : durée en secondes pendant
+    laquelle le navigateur peut réutiliser le fichier sans le revalider ;
+    `public` pour un fichier immuable que les caches partagés peuvent garder.
+    Gère les requêtes conditionnelles et Range.
+    """
+    content_type = content_type or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    backend = protected_media_backend()
+    try:
+        stat = os.stat(field_file.path)
+    except FileNotFoundError:
+        raise Http404('Fichier introuvable')
+    etag = f'"{etag}"' if etag else f'"{int(stat.st_mtime):x}-{stat.st_size:x}"'
+    last_modified = int(stat.st_mtime)
+
+    def finish(response):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        if public:
+            patch_cache_control(response, public=True, max_age=max_age, immutable=True)
+        elif max_age is None:
+            patch_cache_control(response, private=True, no_cache=True)
+        else:
+            patch_cache_control(response, private=True, max_age=max_age)
+        return response
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return finish(not_modified)
+
+    if backend == 'django':
+        ranges = None
+        if request.method == 'GET' and 'HTTP_RANGE' in request.META and _if_range_matches(request, etag, last_modified):
+            ranges = parse_range(request.META['HTTP_RANGE'], stat.st_size)
+        if ranges == []:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+            return finish(response)
+        if ranges:
+            response = _range_response(field_file, ranges, stat.st_size, content_type)
+        else:
+            response = FileResponse(field_file.open('rb'), filename=filename)
+            response['Content-Type'] = content_type
+        response['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+        response['Accept-Ranges'] = 'bytes'
+        return finish(response)
+
+    response = HttpResponse(content_type=content_type)
+    if backend == 'nginx':
+        response['X-Accel-Redirect'] = internal_url(field_file.name)
+    else:
+        response['X-Sendfile'] = field_file.path
+    response['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+    return finish(response)
+
+
+def is_full_download(request, response):
+    """Vrai si `response` envoie le fichier entier : ni 304, ni plage
+
+    Avec nginx ou sendfile, une requête Range reçoit ici un 200 : le serveur
+    frontal découpe la plage ensuite. L'en-tête Range suffit donc à l'exclure.
+    """
+    return response.status_code == 200 and 'HTTP_RANGE' not in request.META
+
+
+def _if_range_matches(request, etag, last_modified):
+    """Vrai si la plage peut être servie : pas d'If-Range, ou le fichier n'a pas changé depuis"""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
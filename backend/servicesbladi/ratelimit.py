@@ -0,0 +1,123 @@
+"""
+Limitation de débit par seau à jetons (token bucket), stockée dans le cache Django
+
+Chaque clé (IP, session, ...) possède un seau de `capacity` jetons qui se
+remplit de `capacity` jetons par `period` secondes. Une requête consomme un
+jeton dans chacun de ses seaux ; si l'un d'eux est vide, elle est refusée
+avec un 429 et un en-tête Retry-After.
+
+Le cache par défaut est la mémoire locale (tests, développement) ou Redis en
+production, partagé entre les workers. La mise à jour d'un seau se fait sous
+un verrou pris avec cache.add (atomique dans Redis comme en mémoire locale) :
+des requêtes simultanées ne peuvent pas consommer le même jeton. Un verrou
+qu'un worker tué n'a pas rendu expire après LOCK_TIMEOUT secondes.
+
+L'IP d'une requête est celle que voit le proxy de confiance le plus externe
+(client_ip) : le début de X-Forwarded-For est fourni par le client.
+"""
+
+import math
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+
+KEY_PREFIX = 'ratelimit'
+LOCK_TIMEOUT = 2
+# Attente maximale d'un seau verrouillé ; au-delà, la requête est refusée
+LOCK_WAIT = 0.25
+LOCK_POLL = 0.005
+
+
+def client_ip(request):
+    """IP du client : REMOTE_ADDR, ou l'entrée de X-Forwarded-For ajoutée par le proxy de confiance le plus externe"""
+    proxies = getattr(settings, 'TRUSTED_PROXY_COUNT', 0)
+    if proxies:
+        forwarded = [ip.strip() for ip in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if ip.strip()]
+        if len(forwarded) >= proxies:
+            return forwarded[-proxies]
+    return request.META.get('REMOTE_ADDR')
+
+
+def parse_rate(value, default=None):
+    """Lire une limite "capacité/période" (ex. "10/60") ; `default` si invalide ou vide"""
+    try:
+        capacity, period = str(value).split('/')
+        capacity, period = int(capacity), float(period)
+    except (TypeError, ValueError):
+        return default
+    if capacity <= 0 or period <= 0:
+        return default
+    return capacity, period
+
+
+class TokenBucketLimiter:
+    """Seaux à jetons nommés par `scope`, un par identifiant"""
+
+    def __init__(self, scope, capacity, period, clock=time.time):
+        self.scope = scope
+        self.capacity = capacity
+        self.period = period
+        self._clock = clock
+
+    @property
+    def refill_rate(self):
+        return self.capacity / self.period
+
+    def _cache_key(self, identifier):
+        return f'{KEY_PREFIX}:{self.scope}:{identifier}'
+
+    def _acquire(self, key, token, deadline):
+        while not cache.add(f'{key}:lock', token, LOCK_TIMEOUT):
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(LOCK_POLL)
+        return True
+
+    def hit(self, identifiers, cost=1):
+        """Consommer `cost` jetons dans chaque seau ; retourne (autorisé, secondes avant réessai)"""
+        # Ordre fixe : deux requêtes qui partagent des seaux ne s'attendent pas mutuellement
+        keys = sorted({self._cache_key(identifier) for identifier in identifiers if identifier})
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + LOCK_WAIT
+        locked = []
+        try:
+            for key in keys:
+                if not self._acquire(key, token, deadline):
+                    return False, 1.0
+                locked.append(key)
+            return self._consume(keys, cost)
+        finally:
+            # Un verrou expiré a pu être repris par une autre requête : ne pas le lui retirer
+            held = cache.get_many([f'{key}:lock' for key in locked])
+            cache.delete_many([lock for lock, value in held.items() if value == token])
+
+    def _consume(self, keys, cost):
+        now = self._clock()
+        states = cache.get_many(keys)
+
+        buckets = {}
+        retry_after = 0.0
+        for key in keys:
+            tokens, updated_at = states.get(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - updated_at) * self.refill_rate)
+            if tokens < cost:
+                retry_after = max(retry_after, (cost - tokens) / self.refill_rate)
+            buckets[key] = tokens
+
+        if retry_after:
+            return False, retry_after
+
+        # Un seau plein est équivalent à une clé absente : il expire après une période
+        cache.set_many({key: (tokens - cost, now) for key, tokens in buckets.items()}, math.ceil(self.period))
+        return True, 0.0
+
+
+def too_many_requests(retry_after, message="Trop de requêtes. Veuillez réessayer dans quelques instants."):
+    """Réponse 429 avec l'en-tête Retry-After (en secondes entières)"""
+    retry_after = max(1, math.ceil(retry_after))
+    response = JsonResponse({'error': message, 'retry_after': retry_after}, status=429)
+    response['Retry-After'] = str(retry_after)
+    return response
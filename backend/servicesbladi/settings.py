@@ -228,6 +228,24 @@ if IS_PRODUCTION:
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Protected files (documents, resources) are checked by Django, then sent by
+# the front server: 'django' (streamed by the worker), 'nginx'
+# (X-Accel-Redirect to an internal location aliasing MEDIA_ROOT) or
+# 'sendfile' (X-Sendfile). See servicesbladi/protected_media.py
+PROTECTED_MEDIA_BACKEND = os.environ.get('PROTECTED_MEDIA_BACKEND', 'django')
+PROTECTED_MEDIA_INTERNAL_URL = os.environ.get('PROTECTED_MEDIA_INTERNAL_URL', '/protected-media/')
+
+# Number of proxies in front of the app that append to X-Forwarded-For (the
+# Render/Heroku router in production). The client IP used for rate limiting
+# is the entry added by the outermost one; 0 means REMOTE_ADDR. Entries
+# further left are sent by the client and never trusted.
+TRUSTED_PROXY_COUNT = int(os.environ.get('TRUSTED_PROXY_COUNT', '1' if IS_PRODUCTION else '0'))
+
+# Admin bulk jobs, document previews and avatar renditions run in threads of
+# the web process ('thread') or in the `worker` process of the Procfile
+# ('worker'). See custom_requests/bulk_jobs.py
+BULK_JOBS_RUNNER = os.environ.get('BULK_JOBS_RUNNER', 'thread')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -532,12 +550,25 @@ SESSION_COOKIE_AGE = 86400  # Durée de vie de la session (en secondes) - 1 jour
 SESSION_SAVE_EVERY_REQUEST = True  # Enregistrer la session à chaque requête
 SESSION_EXPIRE_AT_BROWSER_CLOSE = True  # Expirer la session à la fermeture du navigateur
 
-# Paramètres de cache - Désactiver autant que possible
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',  # Ne pas mettre en cache
+# Paramètres de cache - aucune page n'est mise en cache (voir CacheControlMiddleware),
+# le cache ne sert qu'aux données applicatives (configuration du chatbot, etc.)
+if os.environ.get('REDIS_URL'):
+    # Partagé entre tous les workers
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
     }
-}
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+    # Cache propre à chaque processus : un worker ne peut pas effacer les tableaux
+    # de bord mis en cache par les autres (voir custom_requests/dashboard_data.py)
+    DASHBOARD_CACHE_SECONDS = 0
 
 # Email Configuration
 if IS_PRODUCTION:
@@ -0,0 +1,17 @@
+"""
+Exports CSV ouverts dans un tableur
+
+Une cellule qui commence par =, +, -, @, une tabulation ou un retour chariot
+peut être évaluée comme une formule par Excel ou LibreOffice (injection CSV).
+Les valeurs saisies par les utilisateurs sont donc préfixées d'une apostrophe,
+que le tableur affiche comme du texte.
+"""
+
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def neutralize_formula(value):
+    """`value` telle quelle, préfixée d'une apostrophe si c'est un texte qui ressemble à une formule"""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
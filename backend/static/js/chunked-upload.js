@@ -0,0 +1,207 @@
+/**
+ * Resumable chunked upload of documents (see custom_requests/uploads.py)
+ *
+ * Progressive enhancement of the upload forms: a form with a
+ * data-chunked-upload attribute (URL of the init endpoint) is sent in
+ * chunks instead of one multipart POST. A chunk that fails is retried from
+ * the offset committed by the server, so a dropped connection only costs
+ * the interrupted chunk. Without JavaScript the form is posted as before.
+ *
+ * A form that creates the object the files belong to (e.g. a service
+ * request) also has a data-chunked-parent attribute naming the init field
+ * that links a document to it. The form is first posted without its files;
+ * the view answers JSON with that field and a redirect_url, then every
+ * selected file is uploaded in chunks.
+ *
+ * Files up to HASH_MAX_SIZE are hashed first: when the user already uploaded
+ * the same content, the server has it and no chunk is sent.
+ */
+
+const HASH_MAX_SIZE = 32 * 1024 * 1024;
+
+class ChunkedUpload {
+    constructor(file, initUrl, fields = {}, options = {}) {
+        this.file = file;
+        this.initUrl = initUrl;
+        this.fields = fields;
+        this.maxRetries = options.maxRetries ?? 5;
+        this.onProgress = options.onProgress || (() => {});
+        this.csrfToken = options.csrfToken || ChunkedUpload.cookie('csrftoken');
+        this.uploadUrl = null;
+    }
+
+    static cookie(name) {
+        const match = document.cookie.match(new RegExp('(?:^|; )' + name + '=([^;]*)'));
+        return match ? decodeURIComponent(match[1]) : null;
+    }
+
+    async request(url, options = {}) {
+        const response = await fetch(url, {
+            credentials: 'same-origin',
+            ...options,
+            headers: {'X-CSRFToken': this.csrfToken, 'X-Requested-With': 'XMLHttpRequest', ...(options.headers || {})},
+        });
+        const data = await response.json().catch(() => ({}));
+        return {response, data};
+    }
+
+    async sha256() {
+        if (!window.crypto?.subtle || this.file.size > HASH_MAX_SIZE) {
+            return undefined;
+        }
+        const digest = await crypto.subtle.digest('SHA-256', await this.file.arrayBuffer());
+        return Array.from(new Uint8Array(digest), byte => byte.toString(16).padStart(2, '0')).join('');
+    }
+
+    async start() {
+        const sha256 = await this.sha256().catch(() => undefined);
+        const {response, data} = await this.request(this.initUrl, {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({
+                ...this.fields,
+                filename: this.file.name,
+                size: this.file.size,
+                content_type: this.file.type,
+                sha256,
+            }),
+        });
+        if (!response.ok) {
+            throw new Error(data.message || 'Échec du téléchargement');
+        }
+        this.uploadUrl = this.initUrl + data.upload_id + '/';
+        this.chunkSize = data.chunk_size;
+        return this.resume(data.offset);
+    }
+
+    async resume(offset) {
+        let retries = 0;
+        while (offset < this.file.size) {
+            const chunk = this.file.slice(offset, offset + this.chunkSize);
+            let result;
+            try {
+                result = await this.request(this.uploadUrl, {
+                    method: 'PATCH',
+                    headers: {'Upload-Offset': String(offset), 'Content-Type': 'application/offset+octet-stream'},
+                    body: chunk,
+                });
+            } catch (error) {
+                if (++retries > this.maxRetries) {
+                    throw error;
+                }
+                // Connection dropped: wait, then ask the server where to resume
+                await new Promise(resolve => setTimeout(resolve, 1000 * 2 ** retries));
+                const status = await this.request(this.uploadUrl).catch(() => null);
+                if (status && status.response.ok) {
+                    offset = status.data.offset;
+                }
+                continue;
+            }
+
+            const {response, data} = result;
+            if (response.ok) {
+                offset = data.offset;
+                retries = 0;
+                this.onProgress(offset / this.file.size);
+                continue;
+            }
+            if (data.offset === undefined || ++retries > this.maxRetries) {
+                throw new Error(data.message || 'Échec du téléchargement');
+            }
+            // Offset mismatch, incomplete or corrupted chunk: continue from the committed offset
+            offset = data.offset;
+        }
+
+        const {response, data} = await this.request(this.uploadUrl + 'complete/', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: '{}',
+        });
+        if (response.status === 409 && data.offset === 0) {
+            // The server no longer has the content it matched on start: send the file after all
+            return this.resume(0);
+        }
+        if (!response.ok) {
+            throw new Error(data.message || 'Échec du téléchargement');
+        }
+        return data.document;
+    }
+}
+
+async function submitParentForm(form, fileInputs) {
+    // The form without its files; the view answers JSON once the object exists
+    const body = new FormData(form);
+    fileInputs.forEach(input => body.delete(input.name));
+    const response = await fetch(form.action, {
+        method: 'POST',
+        body,
+        credentials: 'same-origin',
+        headers: {'X-Requested-With': 'XMLHttpRequest'},
+    });
+    const data = await response.json().catch(() => ({}));
+    if (!response.ok || !data.success) {
+        throw new Error(data.message || 'Échec de l\'envoi du formulaire');
+    }
+    return data;
+}
+
+document.addEventListener('DOMContentLoaded', function() {
+    document.querySelectorAll('form[data-chunked-upload]').forEach(form => {
+        form.addEventListener('submit', async function(event) {
+            const fileInputs = Array.from(form.querySelectorAll('input[type="file"]'));
+            const files = fileInputs.flatMap(input => Array.from(input.files));
+            if (!window.fetch || !files.length) {
+                return;  // Regular multipart POST
+            }
+            event.preventDefault();
+
+            const parentField = form.dataset.chunkedParent;
+            const fields = {};
+            if (!parentField) {
+                new FormData(form).forEach((value, key) => {
+                    if (!(value instanceof File) && key !== 'csrfmiddlewaretoken') {
+                        fields[key] = value;
+                    }
+                });
+            }
+            const submit = form.querySelector('[type="submit"]');
+            const label = submit ? submit.innerHTML : '';
+            if (submit) submit.disabled = true;
+            const restore = () => {
+                if (submit) {
+                    submit.disabled = false;
+                    submit.innerHTML = label;
+                }
+            };
+
+            let parent = null;
+            try {
+                if (parentField) {
+                    parent = await submitParentForm(form, fileInputs);
+                }
+                for (const [index, file] of files.entries()) {
+                    const fileFields = parent ? {[parentField]: parent[parentField], name: file.name} : fields;
+                    await new ChunkedUpload(file, form.dataset.chunkedUpload, fileFields, {
+                        csrfToken: form.querySelector('[name="csrfmiddlewaretoken"]')?.value,
+                        onProgress: progress => {
+                            if (submit) submit.textContent = Math.round((index + progress) / files.length * 100) + ' %';
+                        },
+                    }).start();
+                    if (!parent) break;  // One document per form
+                }
+            } catch (error) {
+                alert(error.message);
+                if (!parent) {
+                    restore();
+                    return;
+                }
+                // The object exists: do not create it again by submitting the form twice
+            }
+            if (parent) {
+                window.location.href = parent.redirect_url;
+            } else {
+                window.location.reload();
+            }
+        });
+    });
+});